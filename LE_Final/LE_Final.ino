@@ -1,6 +1,21 @@
-int sine_off=47;
-int cosine_off=59;
-int address=8;
+// Calibration values. Per-device values are passed by the build as
+// -DLE_SINE_OFF=.. -DLE_COSINE_OFF=.. -DLE_ADDRESS=..; these are the defaults.
+#ifndef LE_SINE_OFF
+#define LE_SINE_OFF 47
+#endif
+#ifndef LE_COSINE_OFF
+#define LE_COSINE_OFF 59
+#endif
+#ifndef LE_ADDRESS
+#define LE_ADDRESS 8
+#endif
+
+// They are const volatile so the optimizer keeps them in flash instead of
+// folding them into the code; firmware_patcher.py relies on this to patch
+// per-device values into a prebuilt image.
+const volatile int sine_off=LE_SINE_OFF;
+const volatile int cosine_off=LE_COSINE_OFF;
+const volatile int address=LE_ADDRESS;
 
 #define SAMPLE_SIZE 10
 int cosineSamples[SAMPLE_SIZE];
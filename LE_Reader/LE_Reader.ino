@@ -2,6 +2,7 @@
 // Scans addresses 0-127 once and continuously reads from found devices
 
 #include <Wire.h>
+#include <util/crc16.h>
 
 // Number of bytes to request from each device found
 #define BYTES_TO_REQUEST 6  // Just enough for sine and cosine values
@@ -10,6 +11,13 @@ bool scanComplete = false;
 byte foundDevices[128]; // Array to store found device addresses
 int deviceCount = 0;    // Number of devices found
 
+// Binary mode: the host sends 'B' to get 12-byte frames at 500000 baud with no
+// delay between rounds, and 'A' to go back to text lines at 115200
+#define BINARY_BAUD_RATE 500000
+#define FRAME_SYNC 0xA5
+bool binaryMode = false;
+unsigned int frameSeq = 0;
+
 void setup() {
   Wire.begin();        // join I2C bus as master
   Serial.begin(115200);  // start serial for output
@@ -25,13 +33,66 @@ void loop() {
     // First scan to find devices
     scanI2CBus();
     scanComplete = true;
+    
+    // Tell the host that samples follow; no commas, so it is never taken for a sample
+    Serial.print("LE_Reader ready: ");
+    Serial.print(deviceCount);
+    Serial.println(" devices");
   } else {
     // After scan is complete, continuously read from found devices
+    checkHostCommand();
     readFromFoundDevices();
-    delay(100); // 100ms delay between readings
+    if (!binaryMode) {
+      delay(100); // 100ms delay between readings
+    }
+  }
+}
+
+void checkHostCommand() {
+  while (Serial.available()) {
+    char command = Serial.read();
+    if (command == 'B' && !binaryMode) {
+      Serial.print("LE_Reader binary ");
+      Serial.println(BINARY_BAUD_RATE);
+      Serial.flush();
+      Serial.begin(BINARY_BAUD_RATE);
+      binaryMode = true;
+      frameSeq = 0;
+    } else if (command == 'A' && binaryMode) {
+      Serial.flush();
+      Serial.begin(115200);
+      binaryMode = false;
+      Serial.println("LE_Reader ascii");
+    }
   }
 }
 
+void sendFrame(byte address, int distance, int cosine, int sine) {
+  // sync, address, seq, distance, cosine, sine, CRC-16/XMODEM of address..sine;
+  // little endian, the byte order the host unpacks
+  byte frame[12];
+  frame[0] = FRAME_SYNC;
+  frame[1] = address;
+  frame[2] = frameSeq & 0xFF;
+  frame[3] = frameSeq >> 8;
+  frame[4] = distance & 0xFF;
+  frame[5] = distance >> 8;
+  frame[6] = cosine & 0xFF;
+  frame[7] = cosine >> 8;
+  frame[8] = sine & 0xFF;
+  frame[9] = sine >> 8;
+  
+  uint16_t crc = 0;
+  for (int i = 1; i < 10; i++) {
+    crc = _crc_xmodem_update(crc, frame[i]);
+  }
+  frame[10] = crc & 0xFF;
+  frame[11] = crc >> 8;
+  
+  Serial.write(frame, sizeof(frame));
+  frameSeq++;
+}
+
 void scanI2CBus() {
   byte error, address;
   
@@ -77,6 +138,11 @@ void readFromDevice(byte address) {
       int cosine = (data[2] << 8) | data[3]; // First two bytes for cosine
       int sine = (data[4] << 8) | data[5];   // Next two bytes for sine
       
+      if (binaryMode) {
+        sendFrame(address, abs1, cosine, sine);
+        return;
+      }
+      
       // Print in format: address,cosine,sine
       // Serial.print(abs1);
       // Serial.print(',');
@@ -2,14 +2,25 @@ import os
 import re
 import sys
 import time
+import shutil
+import hashlib
+import tempfile
 from arduino_compiler import ArduinoCompiler
 from arduino_uploader import ArduinoUploader
+from firmware_patcher import FirmwarePatcher
+from arduino_config import CALIBRATION_DEFINES
+from variant_cache import VariantCache
 
 class AddressChanger:
-    """Class to change address, sine, and cosine values in LE_Final settings.h file."""
+    """Class to build LE_Final with per-device address, sine, and cosine values."""
     
-    def __init__(self, le_final_dir=None):
-        """Initialize the AddressChanger with the path to the LE_Final directory."""
+    def __init__(self, le_final_dir=None, variant_cache_size=32 * 1024 * 1024):
+        """Initialize the AddressChanger with the path to the LE_Final directory.
+        
+        Args:
+            variant_cache_size (int): Disk budget in bytes for cached device
+                images, or 0 to always build
+        """
         # Set default path if not provided
         if le_final_dir is None:
             le_final_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LE_Final")
@@ -23,17 +34,19 @@ class AddressChanger:
         
         if not os.path.exists(self.ino_file):
             raise FileNotFoundError(f"LE_Final.ino file not found at {self.ino_file}")
+        
+        self.variant_cache = VariantCache(max_size=variant_cache_size) if variant_cache_size else None
     
     def read_current_settings(self):
-        """Read the current settings from the LE_Final.ino file."""
+        """Read the default settings from the LE_Final.ino file."""
         try:
             with open(self.ino_file, 'r') as f:
                 content = f.read()
             
-            # Extract current values using regex
-            address_match = re.search(r'int\s+address\s*=\s*(\d+)', content)
-            sine_match = re.search(r'int\s+sine_off\s*=\s*(\d+)', content)
-            cosine_match = re.search(r'int\s+cosine_off\s*=\s*(\d+)', content)
+            # Extract the default values of the calibration defines using regex
+            address_match = re.search(r'#define\s+LE_ADDRESS\s+(-?\d+)', content)
+            sine_match = re.search(r'#define\s+LE_SINE_OFF\s+(-?\d+)', content)
+            cosine_match = re.search(r'#define\s+LE_COSINE_OFF\s+(-?\d+)', content)
             
             # Default values if not found
             address = int(address_match.group(1)) if address_match else 8
@@ -50,7 +63,10 @@ class AddressChanger:
             return {'address': 8, 'sine': 0, 'cosine': 0}
     
     def update_settings(self, address, sine, cosine):
-        """Update the LE_Final.ino file with new values."""
+        """Update the default values in the LE_Final.ino file.
+        
+        Per-device builds do not need this; pass the values to compile_sketch instead.
+        """
         try:
             # Read the current file content
             with open(self.ino_file, 'r') as f:
@@ -61,15 +77,15 @@ class AddressChanger:
             changes_made = {'address': False, 'sine': False, 'cosine': False}
             
             for line in lines:
-                # Check for each variable and replace if found
-                if re.search(r'int\s+address\s*=', line):
-                    new_lines.append(f"int address={address};\n")
+                # Check for each default define and replace only its value
+                if re.search(r'#define\s+LE_ADDRESS\s', line):
+                    new_lines.append(re.sub(r'(#define\s+LE_ADDRESS\s+)-?\d+', rf'\g<1>{address}', line))
                     changes_made['address'] = True
-                elif re.search(r'int\s+sine_off\s*=', line):
-                    new_lines.append(f"int sine_off={sine};\n")
+                elif re.search(r'#define\s+LE_SINE_OFF\s', line):
+                    new_lines.append(re.sub(r'(#define\s+LE_SINE_OFF\s+)-?\d+', rf'\g<1>{sine}', line))
                     changes_made['sine'] = True
-                elif re.search(r'int\s+cosine_off\s*=', line):
-                    new_lines.append(f"int cosine_off={cosine};\n")
+                elif re.search(r'#define\s+LE_COSINE_OFF\s', line):
+                    new_lines.append(re.sub(r'(#define\s+LE_COSINE_OFF\s+)-?\d+', rf'\g<1>{cosine}', line))
                     changes_made['cosine'] = True
                 else:
                     new_lines.append(line)
@@ -104,40 +120,87 @@ class AddressChanger:
             print(f"Error updating LE_Final.ino file: {str(e)}")
             return False
     
-    def compile_sketch(self):
-        """Compile the LE_Final sketch."""
+    def build_parameters(self, address=None, sine=None, cosine=None):
+        """Return the calibration values that differ from the sketch defaults.
+        
+        Values equal to the defaults are left out, so they do not create a
+        separate build variant.
+        """
+        defaults = self.read_current_settings()
+        values = {'address': address, 'sine': sine, 'cosine': cosine}
+        return {setting: value for setting, value in values.items()
+                if value is not None and value != defaults[setting]}
+    
+    def compile_sketch(self, mode="full", address=None, sine=None, cosine=None):
+        """Compile the LE_Final sketch.
+        
+        Calibration values are build parameters: they are passed to the
+        compiler as preprocessor defines, so LE_Final.ino is never modified
+        and every device variant builds in its own workspace. Values that are
+        not given fall back to the defaults in the sketch.
+        
+        Args:
+            mode (str): "full" runs the compiler, "patch" writes the
+                calibration values into a prebuilt template image instead
+        """
+        work_dir = output_dir = None
         try:
             print("Compiling LE_Final sketch...")
             
-            # Check if the compiler module is available
-            compiler = ArduinoCompiler()
-            
-            # Create a directory for the compiled output
-            output_dir = os.path.join(self.le_final_dir, "build")
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
             sketch_path = self.ino_file
             sketch_name = os.path.basename(sketch_path)
             if sketch_name.endswith('.ino'):
                 sketch_name = sketch_name[:-4]
             
-            print(f"Compiling {sketch_name} for ATtiny1616...")
+            parameters = self.build_parameters(address, sine, cosine)
+            settings = self.read_current_settings()
+            settings.update(parameters)
             
-            # Compile the sketch
-            success = compiler.compile_attiny1616(sketch_path, output_dir)
+            # Default builds keep using LE_Final/build; device variants get their own directory
+            output_dir = os.path.join(self.le_final_dir, "build")
+            work_dir = output_dir
+            if parameters:
+                variant = '_'.join(f"{setting}{value}" for setting, value in sorted(parameters.items()))
+                output_dir = os.path.join(output_dir, "variants", variant)
+                # Stations building the same variant at once must not write into the
+                # same directory; each builds privately and the result is swapped in
+                os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+                work_dir = tempfile.mkdtemp(dir=os.path.dirname(output_dir), prefix=f".{variant}.")
+            elif not os.path.exists(output_dir):
+                os.makedirs(output_dir)
             
-            if success:
-                # Get the path to the compiled hex file
+            # Get the path to the hex file
+            hex_file = os.path.join(work_dir, f"{sketch_name}.hex")
+            
+            # Reuse a previous build of the same variant if there is one
+            cache_key = self._variant_cache_key(settings)
+            if cache_key and self.variant_cache.get(cache_key, hex_file):
+                print(f"Using cached {sketch_name} build for address={settings['address']}, "
+                      f"sine={settings['sine']}, cosine={settings['cosine']}")
+                success = True
+            else:
+                start_time = time.perf_counter()
+                success = self._build(mode, sketch_path, sketch_name, work_dir, settings, parameters)
+                if success and cache_key and os.path.exists(hex_file):
+                    self.variant_cache.put(cache_key, hex_file, {
+                        'address': settings['address'],
+                        'sine': settings['sine'],
+                        'cosine': settings['cosine'],
+                        'build_seconds': time.perf_counter() - start_time
+                    })
+            
+            if work_dir != output_dir and success and os.path.exists(hex_file):
+                self._publish_variant(work_dir, output_dir)
                 hex_file = os.path.join(output_dir, f"{sketch_name}.hex")
-                
+            
+            if success:
                 # Copy the hex file to the Hex directory for easy access
                 hex_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Hex")
                 
                 if os.path.exists(hex_file):
-                    if os.path.exists(hex_dir):
+                    # Only the default build is shared; device variants stay in their own directory
+                    if os.path.exists(hex_dir) and not parameters:
                         target_hex = os.path.join(hex_dir, f"{sketch_name}.hex")
-                        import shutil
                         shutil.copy2(hex_file, target_hex)
                         print(f"Hex file copied to: {target_hex}")
                     return hex_file
@@ -150,6 +213,84 @@ class AddressChanger:
         except Exception as e:
             print(f"Error during compilation: {str(e)}")
             return None
+        finally:
+            # A variant build that was not moved into place is left over
+            if work_dir != output_dir and os.path.exists(work_dir):
+                shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def _publish_variant(self, work_dir, output_dir, attempts=3):
+        """Move a finished variant build into place in one step.
+        
+        A directory from an earlier build of the variant is renamed out of the
+        way first and deleted afterwards, so output_dir always holds one
+        complete build.
+        """
+        for _ in range(attempts):
+            try:
+                os.replace(work_dir, output_dir)
+                return
+            except OSError:
+                if not os.path.exists(output_dir):
+                    raise
+            stale_dir = tempfile.mkdtemp(dir=os.path.dirname(output_dir), prefix=".stale.")
+            try:
+                os.replace(output_dir, os.path.join(stale_dir, "build"))
+            except OSError:
+                # Another station moved it first; try again
+                pass
+            shutil.rmtree(stale_dir, ignore_errors=True)
+        raise OSError(f"Could not move the build into {output_dir}")
+    
+    def _build(self, mode, sketch_path, sketch_name, output_dir, settings, parameters):
+        """Produce the hex file by patching the template or running the compiler."""
+        success = False
+        if mode == "patch":
+            print(f"Patching {sketch_name} template with address={settings['address']}, "
+                  f"sine={settings['sine']}, cosine={settings['cosine']}...")
+            patcher = FirmwarePatcher(self.le_final_dir)
+            success = patcher.patch(settings['address'], settings['sine'], settings['cosine'],
+                                    os.path.join(output_dir, f"{sketch_name}.hex")) is not None
+            if not success:
+                print("Patch build failed, falling back to a full compile.")
+        
+        if not success:
+            print(f"Compiling {sketch_name} for ATtiny1616...")
+            
+            defines = {CALIBRATION_DEFINES[setting]: value for setting, value in parameters.items()}
+            
+            # Compile the sketch
+            compiler = ArduinoCompiler()
+            build_dir = None
+            if parameters:
+                # Another station may be compiling the same variant; its objects and
+                # build state must not mix with ours
+                build_dir = tempfile.mkdtemp(dir=compiler.temp_dir, prefix=f".{sketch_name}.")
+            try:
+                success = compiler.compile_attiny1616(sketch_path, output_dir, defines=defines, build_dir=build_dir)
+            finally:
+                if build_dir is not None:
+                    shutil.rmtree(build_dir, ignore_errors=True)
+        
+        return success
+    
+    def _variant_cache_key(self, settings):
+        """Return the variant cache key for a build, or None if caching is off.
+        
+        The key covers the full calibration tuple, the sketch source and the
+        toolchain, so a firmware edit or compiler update never reuses an old image.
+        """
+        if self.variant_cache is None:
+            return None
+        
+        toolchain_version = ArduinoCompiler().toolchain_version()
+        if toolchain_version is None:
+            return None
+        
+        with open(self.ino_file, 'rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+        
+        return VariantCache.make_key(settings['address'], settings['sine'], settings['cosine'],
+                                     source_hash, toolchain_version)
     
     def upload_to_attiny(self, hex_file, updi_port):
         """Upload the compiled hex file to the ATtiny1616."""
@@ -161,17 +302,7 @@ class AddressChanger:
             print(f"Uploading to ATtiny1616 via {updi_port}...")
             uploader = ArduinoUploader()
             
-            # Default fuse settings for ATtiny1616 with 20MHz clock
-            fuse_settings = {
-                "fuse0": "0b00000000",  # APPEND disabled, BOOTEND = 0
-                "fuse2": "0x02",        # OSCLOCK disabled, EESAVE disabled, BODCFG = 2
-                "fuse5": "0b11000101",  # 20MHz oscillator, RUNSTDBY disabled, STARTUP = 1 (16ms)
-                "fuse6": "0x04",        # SYSCFG0 = 0x04 (default)
-                "fuse7": "0x00",        # SYSCFG1 = 0x00 (default)
-                "fuse8": "0x00"         # BOOTSIZE = 0 (default)
-            }
-            
-            result = uploader.upload_to_attiny1616(hex_file, updi_port, fuse_settings)
+            result = uploader.upload_to_attiny1616(hex_file, updi_port, delta=True)
             
             if result:
                 print("Upload successful!")
@@ -255,19 +386,14 @@ class AddressChanger:
                 print("Changes cancelled.")
                 return False
             
-            # Update settings file
-            if not self.update_settings(address, sine, cosine):
-                print("Failed to update settings. Operation cancelled.")
-                return False
-            
             # Ask if user wants to compile and upload
             compile_choice = input("\nDo you want to compile and upload these changes? (y/n): ").lower().strip()
             if compile_choice != 'y':
-                print("Settings updated without compilation or upload.")
-                return True
+                print("Nothing compiled or uploaded; LE_Final.ino is unchanged.")
+                return False
             
-            # Compile the sketch using the same approach as option 4
-            hex_file = self.compile_sketch()
+            # Build with the new values as parameters; LE_Final.ino is left unchanged
+            hex_file = self.compile_sketch(address=address, sine=sine, cosine=cosine)
             if not hex_file:
                 print("Compilation failed. Operation cancelled.")
                 return False
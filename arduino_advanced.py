@@ -1,11 +1,15 @@
 import os
+import math
 import time
 import serial
 import subprocess
 
+from toolchain_registry import get_registry
 from arduino_utils import clear_screen, find_arduino_ports, find_avrdude
 from arduino_config import load_config, HEX_DIR
 from arduino_upload import upload_hex
+from serial_capture import SerialCapture
+from encoder_stats import OffsetCalibration, calibrate
 
 try:
     from arduino_compiler import ArduinoCompiler
@@ -34,24 +38,9 @@ def check_dependencies():
         print(f"✓ avrdude found at: {avrdude_path}")
         
         # Check for avrdude.conf
-        avrdude_dir = os.path.dirname(avrdude_path)
-        avrdude_conf = os.path.join(os.path.dirname(avrdude_dir), "etc", "avrdude.conf")
+        avrdude_conf = get_registry().get('avrdude_conf')
         
-        # If avrdude.conf doesn't exist in the expected location, try to find it
-        if not os.path.exists(avrdude_conf):
-            # Try common locations
-            possible_conf_locations = [
-                os.path.join(avrdude_dir, "avrdude.conf"),
-                os.path.join(os.path.dirname(avrdude_dir), "etc", "avrdude.conf"),
-                os.path.join(os.path.dirname(os.path.dirname(avrdude_dir)), "etc", "avrdude.conf")
-            ]
-            
-            for conf_location in possible_conf_locations:
-                if os.path.exists(conf_location):
-                    avrdude_conf = conf_location
-                    break
-        
-        if os.path.exists(avrdude_conf):
+        if avrdude_conf:
             print(f"✓ avrdude.conf found at: {avrdude_conf}")
         else:
             print("✗ avrdude.conf not found. This may cause issues when using avrdude.")
@@ -195,19 +184,9 @@ def upload_attiny_code():
             from arduino_uploader import ArduinoUploader
             uploader = ArduinoUploader()
             
-            # Default fuse settings for ATtiny1616 with 20MHz clock
-            fuse_settings = {
-                "fuse0": "0b00000000",  # APPEND disabled, BOOTEND = 0
-                "fuse2": "0x02",        # OSCLOCK disabled, EESAVE disabled, BODCFG = 2
-                "fuse5": "0b11000101",  # 20MHz oscillator, RUNSTDBY disabled, STARTUP = 1 (16ms)
-                "fuse6": "0x04",        # SYSCFG0 = 0x04 (default)
-                "fuse7": "0x00",        # SYSCFG1 = 0x00 (default)
-                "fuse8": "0x00"         # BOOTSIZE = 0 (default)
-            }
-            
             print(f"\nUploading {selected_hex} to ATtiny1616 via UPDI programmer on {config['updi_programmer']['port']}...")
             
-            if uploader.upload_to_attiny1616(selected_hex, config['updi_programmer']['port'], fuse_settings):
+            if uploader.upload_to_attiny1616(selected_hex, config['updi_programmer']['port']):
                 print("Upload successful!")
             else:
                 print("Upload failed.")
@@ -287,17 +266,9 @@ def run_le_test():
         from arduino_uploader import ArduinoUploader
         uploader = ArduinoUploader()
         
-        # Default fuse settings for ATtiny1616 with 20MHz clock
-        fuse_settings = {
-            "fuse0": "0b00000000",  # APPEND disabled, BOOTEND = 0
-            "fuse2": "0x02",        # OSCLOCK disabled, EESAVE disabled, BODCFG = 2
-            "fuse5": "0b11000101",  # 20MHz oscillator, RUNSTDBY disabled, STARTUP = 1 (16ms)
-            "fuse6": "0x04",        # SYSCFG0 = 0x04 (default)
-            "fuse7": "0x00",        # SYSCFG1 = 0x00 (default)
-            "fuse8": "0x00"         # BOOTSIZE = 0 (default)
-        }
-        
-        if not uploader.upload_to_attiny1616(le_test_hex, config['updi_programmer']['port'], fuse_settings):
+        # Comparing first costs a whole extra avrdude run, so only the updi backend skips identical images
+        policy = 'if-different' if uploader.backend == 'updi' else 'always'
+        if not uploader.upload_to_attiny1616(le_test_hex, config['updi_programmer']['port'], policy=policy, delta=True):
             print("\nFailed to upload LE_Test to ATtiny1616.")
             input("Press Enter to continue...")
             return
@@ -320,78 +291,50 @@ def run_le_test():
     print("\nWaiting for data...")
     
     try:
-        # Open serial connection
-        ser = serial.Serial(config['target_arduino']['port'], 115200, timeout=1)
-        time.sleep(2)  # Allow time for serial connection to establish
-        
-        # Initialize data collection
-        cosine_values = []
-        sine_values = []
-        count = 0
-        max_samples = 10  # Number of samples to collect
+        # Collect until both offsets are known to within the tolerance
+        calibration = OffsetCalibration(tolerance=1.0, min_samples=5, max_samples=200)
         
-        print("\nReading values (waiting for 10 samples):")
+        print("\nReading values until the offsets settle:")
         print("----------------------------------------")
         print("Sample\tCosine\tSine")
         print("----------------------------------------")
         
-        # Read data until we have enough samples
-        timeout_counter = 0
-        max_timeout = 30  # 30 seconds timeout
+        def print_sample(sample):
+            print(f"{calibration.stats.samples}\t{sample.cosine:.2f}\t{sample.sine:.2f}")
         
-        while count < max_samples and timeout_counter < max_timeout:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8').strip()
-                if ',' in line:  # Make sure we have valid data
-                    try:
-                        cosine_str, sine_str = line.split(',')
-                        cosine = float(cosine_str)
-                        sine = float(sine_str)
-                        
-                        cosine_values.append(cosine)
-                        sine_values.append(sine)
-                        
-                        count += 1
-                        print(f"{count}\t{cosine:.2f}\t{sine:.2f}")
-                        timeout_counter = 0  # Reset timeout counter on successful read
-                    except ValueError:
-                        # Skip invalid data
-                        pass
-            else:
-                time.sleep(0.1)
-                timeout_counter += 0.1
+        # Samples are captured on a background thread; stop after 30 seconds without one.
+        # LE_Reader was just uploaded, after LE_Test, so it has found the encoder and the
+        # Uno is not reset.
+        max_timeout = 30
         
-        # Close the serial connection
-        ser.close()
+        with SerialCapture(config['target_arduino']['port'], reset=False, protocol='binary') as capture:
+            calibrate(capture, calibration, timeout=max_timeout, on_sample=print_sample)
         
-        if count < max_samples:
+        if not calibration.done():
             print("\nTimeout waiting for data. Check connections and try again.")
         else:
-            # Calculate averages
-            avg_cosine = sum(cosine_values) / len(cosine_values)
-            avg_sine = sum(sine_values) / len(sine_values)
+            devices = calibration.stats.addresses()
             
             print("\n----------------------------------------")
-            print(f"Average Cosine: {avg_cosine:.2f}")
-            print(f"Average Sine: {avg_sine:.2f}")
+            for device_address in devices:
+                encoder = calibration.stats.encoders[device_address]
+                print(calibration.report(device_address))
+                print(f"Average Cosine: {encoder.cosine.mean:.2f}")
+                print(f"Average Sine: {encoder.sine.mean:.2f}")
+                print(f"Magnitude: {math.hypot(encoder.cosine.mean, encoder.sine.mean):.2f}")
             print("----------------------------------------")
             
-            # Calculate magnitude (optional)
-            magnitude = (avg_cosine**2 + avg_sine**2)**0.5
-            print(f"Magnitude: {magnitude:.2f}")
-            
             # Save results to a file
             results_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_results.txt")
             with open(results_file, 'w') as f:
                 f.write(f"Test Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
                 f.write("----------------------------------------\n")
-                f.write("Sample\tCosine\tSine\n")
-                for i in range(len(cosine_values)):
-                    f.write(f"{i+1}\t{cosine_values[i]:.2f}\t{sine_values[i]:.2f}\n")
-                f.write("----------------------------------------\n")
-                f.write(f"Average Cosine: {avg_cosine:.2f}\n")
-                f.write(f"Average Sine: {avg_sine:.2f}\n")
-                f.write(f"Magnitude: {magnitude:.2f}\n")
+                for device_address in devices:
+                    encoder = calibration.stats.encoders[device_address]
+                    f.write(f"{calibration.report(device_address)}\n")
+                    f.write(f"Average Cosine: {encoder.cosine.mean:.2f}\n")
+                    f.write(f"Average Sine: {encoder.sine.mean:.2f}\n")
+                    f.write(f"Magnitude: {math.hypot(encoder.cosine.mean, encoder.sine.mean):.2f}\n")
             
             print(f"\nResults saved to {results_file}")
     
@@ -401,12 +344,6 @@ def run_le_test():
         print("\nTest stopped by user.")
     except Exception as e:
         print(f"\nError during serial reading: {str(e)}")
-    finally:
-        # Make sure to close the serial connection
-        try:
-            ser.close()
-        except:
-            pass
     
     print("\nTest completed.")
     input("Press Enter to continue...")
@@ -6,18 +6,117 @@ import shutil
 import tempfile
 import time
 import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from object_cache import ObjectCache, hash_file, parse_dep_file
+from elf_convert import convert as elf_convert
+from toolchain_registry import get_registry
+
+# The in-process objcopy replacement; its sources are inputs of the objcopy node
+# so that changing the converter regenerates the hex, bin and eep files
+ELF_CONVERT_SOURCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                       for name in ("elf_convert.py", "elf_reader.py")]
+
+class BuildGraph:
+    """Minimal make-like engine that decides which build steps are stale.
+    
+    Every node records the hashes of its inputs (including headers listed in
+    avr-gcc .d files), its outputs and a signature of its command. A node is
+    rebuilt only when one of those changed or an output is missing.
+    """
+    
+    def __init__(self, state_file, force=False):
+        """Load the recorded node state from state_file."""
+        self.state_file = state_file
+        self.force = force
+        self.nodes = {}
+        
+        if not force and os.path.exists(state_file):
+            try:
+                with open(state_file, 'r') as f:
+                    self.nodes = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.nodes = {}
+    
+    @staticmethod
+    def signature(cmd):
+        """Stable fingerprint of a command line."""
+        return hashlib.sha256('\0'.join(cmd).encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _fingerprint(path, recorded=None):
+        """Return [mtime_ns, size, sha256] for path, reusing the recorded hash if the file is untouched."""
+        stat = os.stat(path)
+        if recorded and recorded[0] == stat.st_mtime_ns and recorded[1] == stat.st_size:
+            return recorded
+        return [stat.st_mtime_ns, stat.st_size, hash_file(path)]
+    
+    def is_stale(self, name, inputs, outputs, signature):
+        """Check whether a node must be rebuilt."""
+        node = self.nodes.get(name)
+        if self.force or node is None or node['signature'] != signature:
+            return True
+        
+        if any(not os.path.exists(path) for path in outputs):
+            return True
+        
+        if set(inputs) - set(node['inputs']):
+            return True
+        
+        # Recorded inputs include the headers found in the .d file last time
+        for path, recorded in node['inputs'].items():
+            try:
+                if self._fingerprint(path, recorded)[2] != recorded[2]:
+                    return True
+            except OSError:
+                return True
+        
+        return False
+    
+    def record(self, name, inputs, outputs, signature, dep_file=None):
+        """Record a successfully built node."""
+        paths = list(inputs)
+        if dep_file and os.path.exists(dep_file):
+            paths.extend(parse_dep_file(dep_file))
+        
+        previous = self.nodes.get(name, {}).get('inputs', {})
+        recorded_inputs = {}
+        for path in paths:
+            if os.path.exists(path):
+                recorded_inputs[path] = self._fingerprint(path, previous.get(path))
+        
+        self.nodes[name] = {
+            'signature': signature,
+            'inputs': recorded_inputs,
+            'outputs': list(outputs)
+        }
+    
+    def save(self):
+        """Write the node state to disk."""
+        with open(self.state_file, 'w') as f:
+            json.dump(self.nodes, f, indent=4)
 
 class ArduinoCompiler:
-    def __init__(self):
+    def __init__(self, use_object_cache=True, jobs=None):
         # Paths to Arduino tools and libraries
         self.arduino_path = self._find_arduino_path()
         self.avr_gcc_path = self._find_avr_gcc_path()
-        self.core_path = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'megaTinyCore', 'hardware', 'megaavr', '2.6.10')
+        self.core_path = get_registry().get('core_path') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'megaTinyCore', 'hardware', 'megaavr', '2.6.10')
         self.temp_dir = os.path.join(tempfile.gettempdir(), 'arduino_compiler')
+        self._toolchain_version = None
         
         # Create temp directory if it doesn't exist
         if not os.path.exists(self.temp_dir):
             os.makedirs(self.temp_dir)
+        
+        # Number of compile jobs run concurrently; 1 compiles serially
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
+        
+        # Persistent cache for library objects that do not change between builds
+        self.object_cache = None
+        if use_object_cache:
+            self.object_cache = ObjectCache(os.path.join(self.temp_dir, 'object_cache'))
     
     def _find_arduino_path(self):
         """Find the Arduino installation directory."""
@@ -35,19 +134,46 @@ class ArduinoCompiler:
     
     def _find_avr_gcc_path(self):
         """Find the avr-gcc tools path."""
-        possible_paths = [
-            os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'DxCore', 'tools', 'avr-gcc', '7.3.0-atmel3.6.1-azduino7b1', 'bin'),
-            os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'arduino', 'tools', 'avr-gcc', '7.3.0-atmel3.6.1-azduino7b1', 'bin')
-        ]
+        return get_registry().get('avr_gcc')
+    
+    def toolchain_version(self):
+        """Identify the toolchain: avr-gcc version plus the megaTinyCore release."""
+        if not self.avr_gcc_path:
+            return None
         
-        for path in possible_paths:
-            if os.path.exists(path):
-                return path
+        if self._toolchain_version is None:
+            # The registry fingerprints avr-gcc when it is discovered or changes
+            registry = get_registry()
+            gcc_version = registry.version('avr_gcc') if self.avr_gcc_path == registry.get('avr_gcc') else None
+            if gcc_version is None:
+                try:
+                    output = subprocess.run([os.path.join(self.avr_gcc_path, "avr-gcc"), "--version"],
+                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout
+                    gcc_version = output.splitlines()[0].strip() if output else "unknown"
+                except OSError:
+                    gcc_version = "unknown"
+            self._toolchain_version = f"{gcc_version}; megaTinyCore {os.path.basename(self.core_path)}"
         
-        return None
+        return self._toolchain_version
     
-    def compile_attiny1616(self, sketch_path, output_dir=None):
-        """Compile an Arduino sketch for ATtiny1616."""
+    def compile_attiny1616(self, sketch_path, output_dir=None, force=False, defines=None, listing=False,
+                           build_dir=None):
+        """Compile an Arduino sketch for ATtiny1616.
+        
+        Only build steps whose inputs changed since the last call are rerun.
+        Pass force=True to discard the build directory and rebuild everything.
+        
+        defines is an optional dict of preprocessor defines for the sketch
+        translation unit (e.g. per-device calibration values). Library units
+        never see them, so their cached objects are shared by all variants.
+        
+        The disassembly listing is skipped unless listing=True; it can also be
+        made later from the copied ELF with generate_listing().
+        
+        Intermediate files go to build_dir if given, else to a directory per
+        set of defines under the compiler's temp directory. A caller that may
+        build the same defines concurrently passes a directory of its own.
+        """
         if not os.path.exists(sketch_path):
             print(f"Error: Sketch file {sketch_path} not found.")
             return False
@@ -65,11 +191,20 @@ class ArduinoCompiler:
         if sketch_name.endswith('.ino'):
             sketch_name = sketch_name[:-4]
         
-        # Create a temporary directory for compilation
-        build_dir = os.path.join(self.temp_dir, sketch_name)
-        if os.path.exists(build_dir):
+        defines = defines or {}
+        define_flags = [f"-D{name}={value}" for name, value in sorted(defines.items())]
+        
+        # Every set of defines gets its own build directory, so builds of
+        # different variants can run at the same time. It is reused between
+        # calls unless a full rebuild is requested.
+        if build_dir is None:
+            build_dir = os.path.join(self.temp_dir, sketch_name, self._variant_key(defines))
+        if force and os.path.exists(build_dir):
             shutil.rmtree(build_dir)
-        os.makedirs(build_dir)
+        if not os.path.exists(build_dir):
+            os.makedirs(build_dir)
+        
+        graph = BuildGraph(os.path.join(build_dir, 'build_state.json'), force)
         
         # Copy the sketch to the build directory
         sketch_copy = os.path.join(build_dir, os.path.basename(sketch_path))
@@ -77,6 +212,9 @@ class ArduinoCompiler:
         
         print(f"Compiling {sketch_name} for ATtiny1616...")
         
+        if self.object_cache:
+            self.object_cache.reset_stats()
+        
         # Check if required tools are available
         if not self.avr_gcc_path:
             print("Error: avr-gcc tools not found. Please install the Arduino IDE with megaTinyCore.")
@@ -148,8 +286,7 @@ class ArduinoCompiler:
                 # If no include is found, add prototypes at the top after any initial comments
                 new_content = '// Function prototypes\n' + '\n'.join(function_declarations) + '\n\n' + sketch_content
             
-            with open(combined_sketch, 'w') as f:
-                f.write(new_content)
+            self._write_if_changed(combined_sketch, new_content)
             
             # Create a temporary .cpp file for Arduino compilation
             # This is necessary because Arduino expects .ino files to be preprocessed in a specific way
@@ -157,39 +294,9 @@ class ArduinoCompiler:
             cpp_file = os.path.join(build_dir, f"{sketch_name}.cpp")
             
             # Add Arduino header at the top
-            with open(cpp_file, 'w') as f:
-                f.write('#include <Arduino.h>\n\n')
-                f.write(new_content)
-            
-            # Step 2: Preprocess the sketch
-            print("Preprocessing sketch...")
-            preprocessed_file = os.path.join(build_dir, f"{sketch_name}_preprocessed.cpp")
-            
-            preprocess_cmd = [
-                os.path.join(self.avr_gcc_path, "avr-g++"),
-                "-c", "-g", "-Os", "-Wall", "-std=gnu++17", "-fpermissive",
-                "-Wno-sized-deallocation", "-fno-exceptions", "-ffunction-sections",
-                "-fdata-sections", "-fno-threadsafe-statics", "-Wno-error=narrowing",
-                "-flto", "-mrelax", "-w", "-x", "c++", "-E", "-CC",
-                "-mmcu=attiny1616", "-DF_CPU=20000000L", "-DCLOCK_SOURCE=0",
-                "-DTWI_MORS", "-DMILLIS_USE_TIMERD0", "-DCORE_ATTACH_ALL",
-                "-DUSE_TIMERD0_PWM", "-DARDUINO=10607", "-DARDUINO_AVR_ATtiny1616",
-                "-DARDUINO_ARCH_MEGAAVR", f'-DMEGATINYCORE="2.6.10"',
-                "-DMEGATINYCORE_MAJOR=2UL", "-DMEGATINYCORE_MINOR=6UL",
-                "-DMEGATINYCORE_PATCH=10UL", "-DMEGATINYCORE_RELEASED=1",
-                "-DARDUINO_attinyxy6",
-                f"-I{os.path.join(core_dir, 'api', 'deprecated')}",
-                f"-I{core_dir}",
-                f"-I{variant_dir}",
-                f"-I{wire_lib_dir}",
-                cpp_file,
-                "-o", preprocessed_file
-            ]
-            
-            self._run_command(preprocess_cmd)
+            self._write_if_changed(cpp_file, '#include <Arduino.h>\n\n' + new_content)
             
             # Step 2: Compile the sketch
-            print("Compiling sketch...")
             compiled_file = os.path.join(build_dir, f"{sketch_name}.o")
             
             compile_cmd = [
@@ -205,18 +312,20 @@ class ArduinoCompiler:
                 "-DMEGATINYCORE_MAJOR=2UL", "-DMEGATINYCORE_MINOR=6UL",
                 "-DMEGATINYCORE_PATCH=10UL", "-DMEGATINYCORE_RELEASED=1",
                 "-DARDUINO_attinyxy6",
+                *define_flags,
                 f"-I{os.path.join(core_dir, 'api', 'deprecated')}",
                 f"-I{core_dir}",
                 f"-I{variant_dir}",
                 f"-I{wire_lib_dir}",
-                cpp_file,  # Use the cpp file directly instead of preprocessed file
+                cpp_file,
                 "-o", compiled_file
             ]
             
-            self._run_command(compile_cmd)
+            # -MMD writes the headers the sketch includes next to the object, where the graph looks for them
+            compile_jobs = [{'name': f"{sketch_name}.cpp", 'cmd': compile_cmd,
+                             'inputs': [cpp_file], 'outputs': [compiled_file]}]
             
             # Step 3: Compile Wire library
-            print("Compiling Wire library...")
             wire_cpp = os.path.join(wire_lib_dir, "Wire.cpp")
             wire_o = os.path.join(build_dir, "Wire.o")
             
@@ -241,7 +350,8 @@ class ArduinoCompiler:
                 "-o", wire_o
             ]
             
-            self._run_command(wire_cmd)
+            compile_jobs.append({'name': "Wire.cpp", 'cmd': wire_cmd, 'source': wire_cpp, 'output': wire_o,
+                                 'inputs': [wire_cpp], 'outputs': [wire_o]})
             
             # Step 4: Compile twi.c
             twi_c = os.path.join(wire_lib_dir, "twi.c")
@@ -266,7 +376,8 @@ class ArduinoCompiler:
                 "-o", twi_o
             ]
             
-            self._run_command(twi_cmd)
+            compile_jobs.append({'name': "twi.c", 'cmd': twi_cmd, 'source': twi_c, 'output': twi_o,
+                                 'inputs': [twi_c], 'outputs': [twi_o]})
             
             # Step 5: Compile twi_pins.c
             twi_pins_c = os.path.join(wire_lib_dir, "twi_pins.c")
@@ -291,35 +402,24 @@ class ArduinoCompiler:
                 "-o", twi_pins_o
             ]
             
-            self._run_command(twi_pins_cmd)
+            compile_jobs.append({'name': "twi_pins.c", 'cmd': twi_pins_cmd, 'source': twi_pins_c, 'output': twi_pins_o,
+                                 'inputs': [twi_pins_c], 'outputs': [twi_pins_o]})
+            
+            # Steps 2-5 do not depend on each other, only the link below does
+            self._run_compile_jobs(compile_jobs, graph)
             
             # Step 6: Find and use the existing core.a file
             print("Finding core.a file...")
             
-            # Try Arduino IDE's typical core location first
-            core_a = None
-            arduino_cores_dir = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'arduino', 'cores')
-            
-            if os.path.exists(arduino_cores_dir):
-                # Look through all subdirectories for core.a
-                for root, dirs, files in os.walk(arduino_cores_dir):
-                    if 'core.a' in files:
-                        core_a = os.path.join(root, 'core.a')
-                        print(f"Found Arduino IDE core.a at: {core_a}")
-                        break
-            
-            # If not found, try other common locations
-            if not core_a:
-                possible_core_paths = [
-                    os.path.join(os.path.dirname(sketch_path), "core.a"),
-                    os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'arduino', 'cores', '7971056259659535f3dc38ca7d607784', 'core.a')
-                ]
-                
-                for path in possible_core_paths:
-                    if os.path.exists(path):
-                        core_a = path
-                        print(f"Found core.a at: {core_a}")
-                        break
+            # The registry remembers the Arduino IDE's core.a; a copy next to the sketch also works
+            core_a = get_registry().get('core_a')
+            if core_a:
+                print(f"Found Arduino IDE core.a at: {core_a}")
+            else:
+                path = os.path.join(os.path.dirname(sketch_path), "core.a")
+                if os.path.exists(path):
+                    core_a = path
+                    print(f"Found core.a at: {core_a}")
             
             if not core_a:
                 print("Error: core.a not found! Please compile a sketch with Arduino IDE first.")
@@ -339,70 +439,42 @@ class ArduinoCompiler:
                 f"-L{build_dir}", "-lm"
             ]
             
-            self._run_command(link_cmd)
+            self._run_node(graph, "link", link_cmd,
+                           [compiled_file, wire_o, twi_o, twi_pins_o, core_a], [elf_file])
             
-            # Step 7: Generate binary file
-            print("Generating binary file...")
+            # Step 8: Generate the hex, binary and eeprom files in-process
+            print("Generating hex, binary and eeprom files...")
+            hex_file = os.path.join(build_dir, f"{sketch_name}.hex")
             bin_file = os.path.join(build_dir, f"{sketch_name}.bin")
-            
-            bin_cmd = [
-                os.path.join(self.avr_gcc_path, "avr-objcopy"),
-                "-O", "binary", "-R", ".eeprom",
-                elf_file, bin_file
-            ]
-            
-            self._run_command(bin_cmd)
-            
-            # Step 8: Generate eeprom file
-            print("Generating eeprom file...")
             eep_file = os.path.join(build_dir, f"{sketch_name}.eep")
             
-            eep_cmd = [
-                os.path.join(self.avr_gcc_path, "avr-objcopy"),
-                "-O", "ihex", "-j", ".eeprom", "--set-section-flags=.eeprom=alloc,load",
-                "--no-change-warnings", "--change-section-lma", ".eeprom=0",
-                elf_file, eep_file
-            ]
-            
-            self._run_command(eep_cmd)
-            
-            # Step 9: Generate hex file
-            print("Generating hex file...")
-            hex_file = os.path.join(build_dir, f"{sketch_name}.hex")
-            
-            hex_cmd = [
-                os.path.join(self.avr_gcc_path, "avr-objcopy"),
-                "-O", "ihex", "-R", ".eeprom",
-                elf_file, hex_file
-            ]
-            
-            self._run_command(hex_cmd)
-            
-            # Step 10: Generate listing file with source and assembly
-            print("Generating listing file...")
-            lst_file = os.path.join(build_dir, f"{sketch_name}.lst")
-            
-            lst_cmd = [
-                os.path.join(self.avr_gcc_path, "avr-objdump"),
-                "--disassemble", "--source", "--line-numbers", "--demangle",
-                "--section=.text", elf_file
-            ]
+            # Equivalent to avr-objcopy -O ihex/binary -R .eeprom and -O ihex -j .eeprom
+            convert_cmd = ["elf_convert", "hex", hex_file, "bin", bin_file, "eep", eep_file]
             
-            # avr-objdump output needs to be redirected to a file
-            lst_output = self._run_command(lst_cmd)
-            with open(lst_file, 'w') as f:
-                f.write(lst_output)
+            self._run_node(graph, "objcopy", convert_cmd, [elf_file] + ELF_CONVERT_SOURCES, [hex_file, bin_file, eep_file],
+                           action=lambda: elf_convert(elf_file, hex_file, bin_file, eep_file))
             
             # Copy all output files to the output directory
             output_hex = os.path.join(output_dir, f"{sketch_name}.hex")
             output_bin = os.path.join(output_dir, f"{sketch_name}.bin")
             output_eep = os.path.join(output_dir, f"{sketch_name}.eep")
-            output_lst = os.path.join(output_dir, f"{sketch_name}.lst")
+            output_elf = os.path.join(output_dir, f"{sketch_name}.elf")
             
             shutil.copy2(hex_file, output_hex)
             shutil.copy2(bin_file, output_bin)
             shutil.copy2(eep_file, output_eep)
-            shutil.copy2(lst_file, output_lst)
+            shutil.copy2(elf_file, output_elf)
+            
+            # Step 9: The listing is only needed for debugging, so it is opt-in
+            if listing:
+                print("Generating listing file...")
+                lst_file = os.path.join(build_dir, f"{sketch_name}.lst")
+                self._run_node(graph, "lst", self._listing_cmd(elf_file), [elf_file], [lst_file],
+                               stdout_file=lst_file)
+                shutil.copy2(lst_file, os.path.join(output_dir, f"{sketch_name}.lst"))
+            
+            if self.object_cache:
+                self.object_cache.report()
             
             print(f"Compilation successful! Output files saved to: {output_dir}")
             return True
@@ -410,6 +482,202 @@ class ArduinoCompiler:
         except Exception as e:
             print(f"Error during compilation: {str(e)}")
             return False
+        finally:
+            # Keep the record of every step that did succeed
+            graph.save()
+    
+    def _variant_key(self, defines):
+        """Name of the build directory for a set of defines."""
+        if not defines:
+            return "default"
+        text = '\0'.join(f"{name}={value}" for name, value in sorted(defines.items()))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    
+    def _write_if_changed(self, path, content):
+        """Write a generated file only when its content differs, so its timestamp stays stable."""
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                if f.read() == content:
+                    return False
+        with open(path, 'w') as f:
+            f.write(content)
+        return True
+    
+    def _run_node(self, graph, name, cmd, inputs, outputs, stdout_file=None, action=None):
+        """Run a serial build step if the build graph says it is stale.
+        
+        action replaces running cmd for steps done in-process; cmd then only
+        identifies the step in the build graph.
+        """
+        signature = BuildGraph.signature(cmd)
+        if not graph.is_stale(name, inputs, outputs, signature):
+            print(f"  {name}: up to date")
+            return False
+        
+        if action:
+            action()
+            graph.record(name, inputs, outputs, signature)
+            return True
+        
+        output = self._run_command(cmd)
+        if stdout_file:
+            with open(stdout_file, 'w') as f:
+                f.write(output)
+        
+        graph.record(name, inputs, outputs, signature)
+        return True
+    
+    def _listing_cmd(self, elf_file):
+        """avr-objdump command that prints a source-annotated disassembly."""
+        return [
+            os.path.join(self.avr_gcc_path, "avr-objdump"),
+            "--disassemble", "--source", "--line-numbers", "--demangle",
+            "--section=.text", elf_file
+        ]
+    
+    def generate_listing(self, elf_file, lst_file=None):
+        """Write the disassembly listing of a compiled ELF file on demand.
+        
+        Returns:
+            str: Path to the listing file, or None on failure
+        """
+        if lst_file is None:
+            lst_file = os.path.splitext(elf_file)[0] + ".lst"
+        
+        if not self.avr_gcc_path:
+            print("Error: avr-objdump not found.")
+            return None
+        
+        try:
+            output = self._run_command(self._listing_cmd(elf_file))
+        except Exception:
+            return None
+        
+        with open(lst_file, 'w') as f:
+            f.write(output)
+        print(f"Listing written to: {lst_file}")
+        return lst_file
+    
+    def _compile_job(self, job):
+        """Run one compile job and collect its output instead of printing it.
+        
+        Jobs with a 'source' and 'output' are library objects that may be
+        served from the object cache.
+        """
+        result = {'name': job['name'], 'cmd': job['cmd'], 'cached': False,
+                  'returncode': 0, 'stdout': '', 'stderr': ''}
+        start_time = time.perf_counter()
+        
+        source = job.get('source')
+        obj_file = job.get('output')
+        cacheable = self.object_cache is not None and source is not None
+        
+        # The source is hashed by content; everything else in the command is the flag vector
+        flags = [arg for arg in job['cmd'] if arg != source and arg != obj_file]
+        
+        if cacheable and self.object_cache.lookup(source, flags, obj_file):
+            result['cached'] = True
+        else:
+            # Debug info records the working directory; compiling cached objects from
+            # their source directory keeps it the same whichever directory we run from
+            cwd = os.path.dirname(os.path.realpath(source)) if cacheable else None
+            try:
+                process = subprocess.run(job['cmd'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=cwd)
+                result['returncode'] = process.returncode
+                result['stdout'] = process.stdout
+                result['stderr'] = process.stderr
+            except OSError as e:
+                result['returncode'] = -1
+                result['stderr'] = str(e)
+            
+            if result['returncode'] == 0 and cacheable:
+                self.object_cache.store(source, flags, obj_file)
+        
+        result['duration'] = time.perf_counter() - start_time
+        return result
+    
+    def _run_compile_jobs(self, jobs, graph=None):
+        """Run independent compile jobs on a bounded worker pool.
+        
+        Each job's output is printed in job order once all jobs are done, so
+        error messages from concurrent compiles do not interleave. With a build
+        graph, jobs that are up to date are skipped.
+        """
+        stale_jobs = []
+        for job in jobs:
+            job['signature'] = BuildGraph.signature(job['cmd'])
+            if graph is None or graph.is_stale(job['name'], job['inputs'], job['outputs'], job['signature']):
+                stale_jobs.append(job)
+            else:
+                print(f"  {job['name']}: up to date")
+        
+        if not stale_jobs:
+            return []
+        
+        workers = max(1, min(self.jobs, len(stale_jobs)))
+        print(f"Compiling {len(stale_jobs)} translation units with {workers} worker(s)...")
+        
+        if workers == 1:
+            results = [self._compile_job(job) for job in stale_jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._compile_job, stale_jobs))
+        
+        failed = []
+        for job, result in zip(stale_jobs, results):
+            if result['returncode'] == 0 and graph is not None:
+                dep_file = job.get('dep_file', os.path.splitext(job['outputs'][0])[0] + '.d')
+                graph.record(job['name'], job['inputs'], job['outputs'], job['signature'], dep_file)
+            
+            if result['cached']:
+                print(f"  {result['name']}: cached")
+            elif result['returncode'] == 0:
+                print(f"  {result['name']}: {result['duration']:.2f}s")
+            else:
+                print(f"  {result['name']}: failed with return code {result['returncode']}")
+                print(f"  Command: {' '.join(result['cmd'])}")
+                print(f"  Error output: {result['stderr']}")
+                failed.append(result['name'])
+        
+        if failed:
+            raise Exception(f"Compilation failed for: {', '.join(failed)}")
+        
+        return results
+    
+    def benchmark(self, sketch_path, runs=3):
+        """Compare build times of serial and parallel compilation.
+        
+        The object cache is disabled and every run is a forced full rebuild,
+        so each run compiles all translation units.
+        """
+        saved_jobs = self.jobs
+        saved_cache = self.object_cache
+        self.object_cache = None
+        output_dir = tempfile.mkdtemp(prefix='arduino_benchmark_')
+        
+        timings = {}
+        try:
+            for mode, jobs in (("serial", 1), ("parallel", saved_jobs)):
+                self.jobs = jobs
+                timings[mode] = []
+                for _ in range(runs):
+                    start_time = time.perf_counter()
+                    if not self.compile_attiny1616(sketch_path, output_dir, force=True):
+                        print(f"Benchmark aborted: {mode} build failed.")
+                        return None
+                    timings[mode].append(time.perf_counter() - start_time)
+        finally:
+            self.jobs = saved_jobs
+            self.object_cache = saved_cache
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        print("\n=== Build Benchmark ===")
+        for mode, values in timings.items():
+            print(f"{mode:>8}: best {min(values):.2f}s, average {sum(values) / len(values):.2f}s over {runs} run(s)")
+        speedup = min(timings["serial"]) / min(timings["parallel"])
+        print(f"Speedup with {saved_jobs} worker(s): {speedup:.2f}x")
+        
+        return timings
     
     def _run_command(self, cmd):
         """Run a command and print its output."""
@@ -433,6 +701,24 @@ def main():
     """Main function for standalone usage."""
     if len(sys.argv) < 2:
         print("Usage: python arduino_compiler.py <sketch_path> [output_dir]")
+        print("       python arduino_compiler.py --benchmark <sketch_path> [runs]")
+        print("       python arduino_compiler.py --listing <elf_file> [lst_file]")
+        return
+    
+    if sys.argv[1] == "--benchmark":
+        if len(sys.argv) < 3:
+            print("Usage: python arduino_compiler.py --benchmark <sketch_path> [runs]")
+            return
+        runs = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+        ArduinoCompiler().benchmark(sys.argv[2], runs)
+        return
+    
+    if sys.argv[1] == "--listing":
+        if len(sys.argv) < 3:
+            print("Usage: python arduino_compiler.py --listing <elf_file> [lst_file]")
+            return
+        lst_file = sys.argv[3] if len(sys.argv) > 3 else None
+        ArduinoCompiler().generate_listing(sys.argv[2], lst_file)
         return
     
     sketch_path = sys.argv[1]
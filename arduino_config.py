@@ -7,6 +7,13 @@ HEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Hex")
 BLINK_HEX = os.path.join(HEX_DIR, "LED_Blink.ino.hex")
 UPDI_HEX = os.path.join(HEX_DIR, "jtag2updi.ino.hex")
 
+# Preprocessor defines that carry per-device calibration values into LE_Final
+CALIBRATION_DEFINES = {
+    "address": "LE_ADDRESS",
+    "sine": "LE_SINE_OFF",
+    "cosine": "LE_COSINE_OFF"
+}
+
 def save_config(config):
     """Save configuration to file."""
     with open(CONFIG_FILE, 'w') as f:
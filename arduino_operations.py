@@ -6,7 +6,8 @@ import subprocess
 from arduino_utils import clear_screen, find_arduino_ports
 from arduino_config import load_config, save_config, HEX_DIR, BLINK_HEX, UPDI_HEX
 from arduino_upload import upload_hex
-from serial_helper import open_serial_with_flush
+from serial_capture import SerialCapture
+from encoder_stats import SessionStats, OffsetCalibration, calibrate
 
 try:
     from address_changer import AddressChanger
@@ -229,7 +230,7 @@ def program_arduino():
     print("1. Upload LE_Test.ino.hex to the ATtiny1616 via UPDI")
     print("2. Upload LE_Reader.ino.hex to the Arduino Uno")
     print("3. Collect sine and cosine values from the Arduino")
-    print("4. Calculate average values and update the LE_Final sketch")
+    print("4. Calculate average values and build LE_Final with them")
     print("\nMake sure both devices are connected.")
     input("Press Enter to continue...")
     
@@ -327,17 +328,9 @@ def program_arduino():
         from arduino_uploader import ArduinoUploader
         uploader = ArduinoUploader()
         
-        # Default fuse settings for ATtiny1616 with 20MHz clock
-        fuse_settings = {
-            "fuse0": "0b00000000",  # APPEND disabled, BOOTEND = 0
-            "fuse2": "0x02",        # OSCLOCK disabled, EESAVE disabled, BODCFG = 2
-            "fuse5": "0b11000101",  # 20MHz oscillator, RUNSTDBY disabled, STARTUP = 1 (16ms)
-            "fuse6": "0x04",        # SYSCFG0 = 0x04 (default)
-            "fuse7": "0x00",        # SYSCFG1 = 0x00 (default)
-            "fuse8": "0x00"         # BOOTSIZE = 0 (default)
-        }
-        
-        if not uploader.upload_to_attiny1616(le_test_hex, updi_port, fuse_settings):
+        # Comparing first costs a whole extra avrdude run, so only the updi backend skips identical images
+        policy = 'if-different' if uploader.backend == 'updi' else 'always'
+        if not uploader.upload_to_attiny1616(le_test_hex, updi_port, policy=policy, delta=True):
             print("\nFailed to upload LE_Test.ino.hex to ATtiny1616.")
             input("Press Enter to continue...")
             return
@@ -347,6 +340,7 @@ def program_arduino():
         return
     
     # Step 2: Upload LE_Reader.ino.hex to Arduino Uno (if not already uploaded)
+    reader_started = False
     if config.get("le_reader_uploaded", False):
         print(f"\n2. LE_Reader.ino.hex already uploaded to Arduino Uno on {arduino_port}. Skipping...")
     else:
@@ -357,6 +351,7 @@ def program_arduino():
             return
         config["le_reader_uploaded"] = True
         save_config(config)
+        reader_started = True
     
     # Step 3: Read and analyze serial output from Arduino Uno
     print(f"\n3. Reading serial data from Arduino Uno on {arduino_port}...")
@@ -364,62 +359,43 @@ def program_arduino():
     print("\nWaiting for data...")
     
     try:
-        # Open serial connection with proper buffer flushing
-        ser = open_serial_with_flush(arduino_port, 115200, 1)
+        # Collect until both offsets are known to within the tolerance, which takes
+        # a few samples on a steady encoder and more on a noisy one
+        calibration = OffsetCalibration(tolerance=1.0, min_samples=5, max_samples=200)
         
-        # Initialize data collection
-        cosine_values = []
-        sine_values = []
-        device_addresses = []
-        count = 0
-        max_samples = 10  # Number of samples to collect
-        
-        print("\nReading values (waiting for 10 samples):")
+        print("\nReading values until the offsets settle:")
         print("----------------------------------------")
         print("Sample\tAddr\tCosine\tSine")
         print("----------------------------------------")
         
-        # Read data until we have enough samples
-        timeout_counter = 0
-        max_timeout = 30  # 30 seconds timeout
-        
-        while count < max_samples and timeout_counter < max_timeout:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8').strip()
-                if ',' in line and line.count(',') == 2:  # Make sure we have valid data in format address,cosine,sine
-                    try:
-                        address_str, cosine_str, sine_str = line.split(',')
-                        device_address = int(address_str)
-                        cosine = float(cosine_str)
-                        sine = float(sine_str)
-                        
-                        device_addresses.append(device_address)
-                        cosine_values.append(cosine)
-                        sine_values.append(sine)
-                        
-                        count += 1
-                        print(f"{count}\t{device_address}\t{cosine:.2f}\t{sine:.2f}")
-                        timeout_counter = 0  # Reset timeout counter on successful read
-                    except ValueError:
-                        # Skip invalid data
-                        pass
-            else:
-                time.sleep(0.1)
-                timeout_counter += 0.1
+        def print_sample(sample):
+            print(f"{calibration.stats.samples}\t{sample.address}\t{sample.cosine:.2f}\t{sample.sine:.2f}")
+        
+        # Samples are captured on a background thread; stop after 30 seconds without one.
+        # LE_Reader only looks for the encoder when it boots, so the Uno is reset unless
+        # it was just uploaded after LE_Test. Binary mode streams without the 100 ms
+        # pause between readings where the sketch supports it.
+        max_timeout = 30
         
-        # Close the serial connection
-        ser.close()
+        start_time = time.perf_counter()
+        with SerialCapture(arduino_port, reset=not reader_started, protocol='binary') as capture:
+            calibrate(capture, calibration, timeout=max_timeout, on_sample=print_sample)
+        elapsed = time.perf_counter() - start_time
         
-        if count < max_samples:
+        if not calibration.done():
             print("\nTimeout waiting for data. Check connections and try again.")
             input("Press Enter to continue...")
             return
         
-        # Calculate averages
-        avg_cosine = int(sum(cosine_values) / len(cosine_values))
-        avg_sine = int(sum(sine_values) / len(sine_values))
-        
+        devices = calibration.stats.addresses()
         print("\n----------------------------------------")
+        for device_address in devices:
+            print(calibration.report(device_address))
+        print(f"Collected in {elapsed:.2f}s")
+        if len(devices) > 1:
+            print(f"Warning: {len(devices)} encoders answered; using device {devices[0]}")
+        avg_cosine, avg_sine = calibration.offsets(devices[0])
+        
         print(f"Average Cosine: {avg_cosine}")
         print(f"Average Sine: {avg_sine}")
         print("----------------------------------------")
@@ -434,9 +410,8 @@ def program_arduino():
             f.write(f"Calibration Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Device Address: {address}\n")
             f.write("----------------------------------------\n")
-            f.write("Sample\tCosine\tSine\n")
-            for i in range(len(cosine_values)):
-                f.write(f"{i+1}\t{cosine_values[i]:.2f}\t{sine_values[i]:.2f}\n")
+            for device_address in devices:
+                f.write(f"{calibration.report(device_address)}\n")
             f.write("----------------------------------------\n")
             f.write(f"Average Cosine: {avg_cosine}\n")
             f.write(f"Average Sine: {avg_sine}\n")
@@ -444,35 +419,29 @@ def program_arduino():
         
         print(f"\nResults saved to {results_file}")
         
-        # Step 4: Update LE_Final with the new values
-        print("\n4. Updating LE_Final sketch with new values...")
+        # Step 4: Build LE_Final with the new values
+        print("\n4. Building LE_Final with the new values...")
         
         try:
             # Create AddressChanger instance
             from address_changer import AddressChanger
             changer = AddressChanger(le_final_dir)
             
-            # Update the settings
-            if changer.update_settings(address, avg_sine, avg_cosine):
-                print("\nLE_Final sketch updated successfully!")
-                
-                # Ask if user wants to compile and upload
-                compile_choice = input("\nDo you want to compile and upload these changes to ATtiny1616? (y/n): ").lower().strip()
-                if compile_choice == 'y':
-                    # Compile the sketch
-                    hex_file = changer.compile_sketch()
-                    if hex_file and os.path.exists(hex_file):
-                        # Upload to ATtiny1616
-                        if changer.upload_to_attiny(hex_file, updi_port):
-                            print("\nCalibration and programming completed successfully!")
-                        else:
-                            print("\nSettings updated but upload failed.")
+            # Ask if user wants to compile and upload
+            compile_choice = input("\nDo you want to compile and upload these changes to ATtiny1616? (y/n): ").lower().strip()
+            if compile_choice == 'y':
+                # Build the firmware by patching the prebuilt template; the sketch source is not modified
+                hex_file = changer.compile_sketch(mode="patch", address=address, sine=avg_sine, cosine=avg_cosine)
+                if hex_file and os.path.exists(hex_file):
+                    # Upload to ATtiny1616
+                    if changer.upload_to_attiny(hex_file, updi_port):
+                        print("\nCalibration and programming completed successfully!")
                     else:
-                        print("\nSettings updated but compilation failed.")
-            else:
-                print("\nFailed to update LE_Final sketch.")
+                        print("\nFirmware built but upload failed.")
+                else:
+                    print("\nCompilation failed.")
         except Exception as e:
-            print(f"\nError updating LE_Final sketch: {str(e)}")
+            print(f"\nError building LE_Final: {str(e)}")
         
         print("\nCalibration process completed.")
     
@@ -482,12 +451,6 @@ def program_arduino():
         print("\nProcess stopped by user.")
     except Exception as e:
         print(f"\nError during serial reading: {str(e)}")
-    finally:
-        # Make sure to close the serial connection
-        try:
-            ser.close()
-        except:
-            pass
     
     input("Press Enter to continue...")
 
@@ -540,105 +503,65 @@ def read_arduino():
     print("\nWaiting for data...")
     
     try:
-        # Open serial connection with proper buffer flushing
-        ser = open_serial_with_flush(arduino_port, 115200, 1)
-        
-        # Initialize data collection
-        cosine_values = []
-        sine_values = []
-        device_addresses = []
-        count = 0
-        max_samples = 20  # Number of samples to collect
+        # Statistics are updated as samples arrive and nothing else is kept,
+        # so the reading can go on for as long as it is useful
+        stats = SessionStats()
+        summary_every = 20  # Print running averages every this many samples
         
         print("\nReading values (press Ctrl+C to stop):")
         print("----------------------------------------")
         print("Sample\tAddr\tCosine\tSine")
         print("----------------------------------------")
         
-        # Read data until we have enough samples or user interrupts
-        timeout_counter = 0
-        max_timeout = 60  # 60 seconds timeout
-        
-        try:
-            while count < max_samples and timeout_counter < max_timeout:
-                if ser.in_waiting > 0:
-                    line = ser.readline().decode('utf-8').strip()
-                    if ',' in line and line.count(',') == 2:  # Make sure we have valid data in format address,cosine,sine
-                        try:
-                            address_str, cosine_str, sine_str = line.split(',')
-                            device_address = int(address_str)
-                            cosine = float(cosine_str)
-                            sine = float(sine_str)
-                            
-                            device_addresses.append(device_address)
-                            cosine_values.append(cosine)
-                            sine_values.append(sine)
-                            
-                            count += 1
-                            print(f"{count}\t{device_address}\t{cosine:.2f}\t{sine:.2f}")
-                            timeout_counter = 0  # Reset timeout counter on successful read
-                        except ValueError:
-                            # Skip invalid data
-                            pass
-                else:
-                    time.sleep(0.1)
-                    timeout_counter += 0.1
-        except KeyboardInterrupt:
-            print("\nReading stopped by user.")
-        
-        # Close the serial connection
-        ser.close()
-        
-        if count == 0:
+        # Samples are captured on a background thread; stop after 60 seconds without one.
+        # Opening the port resets the Uno so LE_Reader finds the encoder that is attached now.
+        max_timeout = 60
+        
+        with SerialCapture(arduino_port) as capture:
+            try:
+                while True:
+                    batch = capture.pull(timeout=max_timeout)
+                    if not batch:
+                        break
+                    for sample in batch:
+                        stats.add(sample)
+                        print(f"{stats.samples}\t{sample.address}\t{sample.cosine:.2f}\t{sample.sine:.2f}")
+                        if stats.samples % summary_every == 0:
+                            for address, encoder in sorted(stats.encoders.items()):
+                                print(f"  [{address}] cosine {encoder.cosine.mean:.2f} +/- {encoder.cosine.stdev:.2f}, "
+                                      f"sine {encoder.sine.mean:.2f} +/- {encoder.sine.stdev:.2f} "
+                                      f"over {encoder.count} samples")
+            except KeyboardInterrupt:
+                print("\nReading stopped by user.")
+        
+        if stats.samples == 0:
             print("\nNo data received. Make sure the Arduino is running the LE_Reader sketch")
             print("and that the LE device is powered on and functioning correctly.")
             input("Press Enter to continue...")
             return
         
-        # Calculate statistics
-        avg_cosine = sum(cosine_values) / len(cosine_values)
-        avg_sine = sum(sine_values) / len(sine_values)
-        
-        # Find min and max values
-        min_cosine = min(cosine_values)
-        max_cosine = max(cosine_values)
-        min_sine = min(sine_values)
-        max_sine = max(sine_values)
-        
-        # Calculate magnitude
-        magnitudes = [(c**2 + s**2)**0.5 for c, s in zip(cosine_values, sine_values)]
-        avg_magnitude = sum(magnitudes) / len(magnitudes)
+        # Summarise each encoder, and suggest integer values for address_changer
+        report = []
+        for address in stats.addresses():
+            encoder = stats.encoders[address]
+            report.append(f"Device Address: {address}")
+            report.extend(encoder.summary())
+            report.append("Recommended values for Address Changer:")
+            report.append(f"COSINE: {round(encoder.cosine.mean)}")
+            report.append(f"SINE: {round(encoder.sine.mean)}")
+            report.append("----------------------------------------")
         
         print("\n----------------------------------------")
-        print(f"Samples collected: {count}")
-        print(f"Average Cosine: {avg_cosine:.2f} (range: {min_cosine:.2f} to {max_cosine:.2f})")
-        print(f"Average Sine: {avg_sine:.2f} (range: {min_sine:.2f} to {max_sine:.2f})")
-        print(f"Average Magnitude: {avg_magnitude:.2f}")
-        print("----------------------------------------")
-        
-        # Suggest integer values for address_changer
-        int_cosine = int(avg_cosine)
-        int_sine = int(avg_sine)
-        
-        print("\nRecommended values for Address Changer:")
-        print(f"COSINE: {int_cosine}")
-        print(f"SINE: {int_sine}")
+        for line in report:
+            print(line)
         
         # Save results to a file
         results_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reading_results.txt")
         with open(results_file, 'w') as f:
             f.write(f"Reading Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write("----------------------------------------\n")
-            f.write("Sample\tCosine\tSine\tMagnitude\n")
-            for i in range(len(cosine_values)):
-                f.write(f"{i+1}\t{cosine_values[i]:.2f}\t{sine_values[i]:.2f}\t{magnitudes[i]:.2f}\n")
-            f.write("----------------------------------------\n")
-            f.write(f"Average Cosine: {avg_cosine:.2f} (range: {min_cosine:.2f} to {max_cosine:.2f})\n")
-            f.write(f"Average Sine: {avg_sine:.2f} (range: {min_sine:.2f} to {max_sine:.2f})\n")
-            f.write(f"Average Magnitude: {avg_magnitude:.2f}\n")
-            f.write("\nRecommended values for Address Changer:\n")
-            f.write(f"COSINE: {int_cosine}\n")
-            f.write(f"SINE: {int_sine}\n")
+            for line in report:
+                f.write(f"{line}\n")
         
         print(f"\nResults saved to {results_file}")
     
@@ -647,12 +570,6 @@ def read_arduino():
         print("Make sure the Arduino is properly connected and not in use by another program.")
     except Exception as e:
         print(f"\nError during reading: {str(e)}")
-    finally:
-        # Make sure to close the serial connection
-        try:
-            ser.close()
-        except:
-            pass
     
     input("\nPress Enter to continue...")
 
@@ -1,37 +1,40 @@
 import os
 import time
-import subprocess
 import serial
 
+from toolchain_registry import get_registry
+from avrdude_conf import resolve_conf
+from avrdude_runner import print_progress
+from programmer_baud import run_with_fallback
+from port_manager import get_port_manager
 from arduino_utils import find_avrdude, is_avrdude_available
 from arduino_config import HEX_DIR
 
-def upload_hex_direct(port, hex_file, baudrate=115200):
-    """Upload a hex file to an Arduino using direct serial communication.
-    This is a simplified version that works for basic Arduino uploads when avrdude is not available.
+def upload_hex_direct(port, hex_file, baudrate=115200, verify=True):
+    """Upload a hex file to an Arduino Uno through its bootloader, without avrdude.
     
-    Note: This is a fallback method and may not work for all Arduino boards.
+    Speaks STK500v1 to Optiboot directly: the board is reset once when the port
+    is opened, and only the flash pages the hex file occupies are written.
+    
+    Args:
+        port (str): Serial port of the Uno
+        hex_file (str): Image to upload
+        baudrate (int): Bootloader baud rate (115200 for Optiboot on the Uno)
+        verify (bool): Read the written pages back and compare
     """
+    from stk500_programmer import Stk500Client, Stk500Error
+    
+    print(f"\nUploading {hex_file} to Arduino at {port}...")
     try:
-        # Read the hex file
-        with open(hex_file, 'r') as f:
-            hex_data = f.read()
-        
-        # Open serial connection
-        ser = serial.Serial(port, baudrate, timeout=1)
-        time.sleep(2)  # Allow time for Arduino to reset
-        
-        # Send the hex data
-        ser.write(hex_data.encode())
-        ser.flush()
-        
-        # Close the connection
-        ser.close()
-        
-        print(f"Hex file sent to {port}.")
+        start_time = time.perf_counter()
+        with Stk500Client(port, baudrate) as client:
+            pages = client.upload(hex_file, verify)
+        print(f"Upload successful! {pages} pages written{' and verified' if verify else ''} "
+              f"in {time.perf_counter() - start_time:.2f}s")
         return True
-    except Exception as e:
-        print(f"Error during direct upload: {str(e)}")
+    except (Stk500Error, serial.SerialException, OSError, ValueError) as e:
+        print(f"Upload failed: {str(e)}")
+        print("Please check if the Arduino is properly connected and the port is correct.")
         return False
 
 def upload_hex(port, hex_file, is_updi=False):
@@ -41,90 +44,72 @@ def upload_hex(port, hex_file, is_updi=False):
         print(f"Error: Hex file not found at {hex_file}")
         return False
     
+    port_manager = get_port_manager()
+    if not port_manager.claim(port, 'upload'):
+        print(f"Error: Port {port} is in use by {port_manager.owner(port)}.")
+        return False
+    
+    try:
+        # Uno uploads go straight to the bootloader; opening the port is the only reset
+        if not is_updi:
+            return upload_hex_direct(port, hex_file)
+        return _upload_hex_updi(port, hex_file)
+    finally:
+        port_manager.release(port, 'upload')
+
+def _upload_hex_updi(port, hex_file):
+    """Upload a hex file to an ATtiny1616 with avrdude through the jtag2updi programmer on port."""
     # Get avrdude path
     avrdude_path = find_avrdude()
     
-    # If avrdude is not available, try direct upload
     if not avrdude_path:
-        print("Warning: avrdude not found in system path or Arduino installation.")
-        print("Attempting direct upload method (limited functionality).")
-        return upload_hex_direct(port, hex_file)
+        print("Error: avrdude not found in system path or Arduino installation.")
+        return False
         
-    # Verify the port exists and is available
-    try:
-        # Try to open the port briefly to check if it's available
-        ser = serial.Serial(port, 9600, timeout=1)
-        ser.close()
-        print(f"Port {port} is available.")
-    except serial.SerialException as e:
-        print(f"Error: Could not open port {port}. {str(e)}")
+    # Presence comes from port enumeration; the port is only opened to check it
+    # the first time it is seen or after it was unplugged and plugged back in
+    available, reason = get_port_manager().check(port, 9600, 'upload')
+    if not available:
+        print(f"Error: Port {port} {reason}.")
         print("Please check if the Arduino is properly connected and the port is correct.")
         return False
     
     try:
-        # Find avrdude.conf
-        avrdude_dir = os.path.dirname(avrdude_path)
-        avrdude_conf = os.path.join(os.path.dirname(avrdude_dir), "etc", "avrdude.conf")
+        # Find avrdude.conf through the toolchain registry
+        avrdude_conf = get_registry().get('avrdude_conf')
+        if not avrdude_conf:
+            avrdude_conf = os.path.join(os.path.dirname(os.path.dirname(avrdude_path)), "etc", "avrdude.conf")
         
-        # If avrdude.conf doesn't exist in the expected location, try to find it
-        if not os.path.exists(avrdude_conf):
-            # Try common locations
-            possible_conf_locations = [
-                os.path.join(avrdude_dir, "avrdude.conf"),
-                os.path.join(os.path.dirname(avrdude_dir), "etc", "avrdude.conf"),
-                os.path.join(os.path.dirname(os.path.dirname(avrdude_dir)), "etc", "avrdude.conf")
-            ]
-            
-            for conf_location in possible_conf_locations:
-                if os.path.exists(conf_location):
-                    avrdude_conf = conf_location
-                    break
+        # A config trimmed to the parts and programmers we use makes avrdude start faster
+        avrdude_conf = resolve_conf(avrdude_conf, "attiny1614", "jtag2updi")
         
-        if is_updi:
-            # For UPDI upload (ATtiny1616)
-            cmd = [
-                avrdude_path, 
-                "-C", avrdude_conf, 
-                "-v", 
-                "-p", "attiny1614",  # ATtiny1616 uses the same parameters as ATtiny1614
-                "-c", "jtag2updi", 
-                "-P", port, 
-                "-U", f"flash:w:{hex_file}:i"
-            ]
-        else:
-            # For regular Arduino upload (e.g., Arduino Uno)
-            cmd = [
-                avrdude_path, 
-                "-C", avrdude_conf, 
-                "-v", 
-                "-p", "atmega328p",  # Arduino Uno uses ATmega328P
-                "-c", "arduino", 
-                "-P", port, 
-                "-b", "115200", 
-                "-D", 
-                "-U", f"flash:w:{hex_file}:i"
-            ]
+        # For UPDI upload (ATtiny1616)
+        cmd = [
+            avrdude_path, 
+            "-C", avrdude_conf, 
+            "-v", 
+            "-p", "attiny1614",  # ATtiny1616 uses the same parameters as ATtiny1614
+            "-c", "jtag2updi", 
+            "-P", port, 
+            "-U", f"flash:w:{hex_file}:i"
+        ]
         
         print(f"Using avrdude at: {avrdude_path}")
         print(f"Using configuration: {avrdude_conf}")
         print(f"Command: {' '.join(cmd)}")
         
         print(f"\nUploading {hex_file} to Arduino at {port}...")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        run, baud_rate = run_with_fallback(cmd, port, on_progress=print_progress)
         
-        if result.returncode == 0:
-            print("Upload successful!")
+        if run.success:
+            print(f"Upload successful at {baud_rate} baud! ({run.summary()})")
             return True
         else:
-            print(f"Upload failed with return code: {result.returncode}")
-            if result.stderr:
-                print(f"Error output: {result.stderr}")
+            print(f"Upload failed after {run.elapsed:.2f}s ({run.error['kind']}): {run.error['message']}")
+            if run.output and run.error['kind'] == 'exit_code':
+                print(f"avrdude output:\n{run.output}")
             return False
     
-    except FileNotFoundError:
-        print("Error: avrdude executable not found.")
-        print("Please install avrdude or ensure it's in your system PATH.")
-        return False
     except Exception as e:
         print(f"Error during upload: {str(e)}")
         return False
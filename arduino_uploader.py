@@ -1,5 +1,4 @@
 import os
-import subprocess
 import sys
 import json
 import serial
@@ -7,54 +6,48 @@ import serial.tools.list_ports
 import time
 import shutil
 
+from toolchain_registry import get_registry
+from avrdude_conf import resolve_conf, part_has_memory
+from fuse_manager import (FUSE_PROFILE, get_fuse_manager, fuse_values, format_fuse_settings,
+                          AvrdudeReadback)
+from intel_hex import HexImage
+from avrdude_runner import print_progress
+from programmer_baud import run_with_fallback
+from port_manager import get_port_manager
+
+# Upload backends: avrdude through a jtag2updi programmer, or the in-process
+# UPDI driver talking to the target through a serial adapter
+BACKENDS = ('avrdude', 'updi')
+
+# What an upload does when the device may already hold the image
+UPLOAD_POLICIES = ('always', 'if-different', 'verify-only')
+
+# Post-flash verification: none, read back only the pages written, or every page of the image
+VERIFY_MODES = ('none', 'pages', 'full')
+
+# Open UPDI sessions by port, shared by every uploader in the process so the
+# port stays open, and the flash baseline for delta uploads known, between uploads
+_updi_sessions = {}
+
 class ArduinoUploader:
-    def __init__(self):
+    def __init__(self, backend='avrdude'):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown upload backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        
+        self.backend = backend
         # Paths to Arduino tools
         self.avrdude_path = self._find_avrdude_path()
         self.avrdude_conf = self._find_avrdude_conf()
         
     def _find_avrdude_path(self):
         """Find avrdude executable path."""
-        possible_paths = [
-            # DxCore paths
-            os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'DxCore', 'tools', 'avrdude', '6.3.0-arduino17or18', 'bin', 'avrdude.exe'),
-            # MegaTinyCore paths
-            os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'megaTinyCore', 'tools', 'avrdude', '6.3.0-arduino17or18', 'bin', 'avrdude.exe'),
-            # Arduino AVR paths
-            os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'arduino', 'tools', 'avrdude', '6.3.0-arduino17', 'bin', 'avrdude.exe'),
-            # Standard Arduino installation paths
-            os.path.join(os.environ.get('ProgramFiles', 'C:\\Program Files'), 'Arduino', 'hardware', 'tools', 'avr', 'bin', 'avrdude.exe'),
-            os.path.join(os.environ.get('ProgramFiles(x86)', 'C:\\Program Files (x86)'), 'Arduino', 'hardware', 'tools', 'avr', 'bin', 'avrdude.exe')
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path):
-                return path
-        
-        return None
+        return get_registry().get('avrdude')
     
     def _find_avrdude_conf(self):
         """Find avrdude.conf file."""
         if not self.avrdude_path:
             return None
-            
-        # First check in the same directory as avrdude
-        avrdude_dir = os.path.dirname(self.avrdude_path)
-        conf_path = os.path.join(avrdude_dir, 'avrdude.conf')
-        if os.path.exists(conf_path):
-            return conf_path
-            
-        # Check in parent directory's etc folder
-        conf_path = os.path.join(os.path.dirname(avrdude_dir), 'etc', 'avrdude.conf')
-        if os.path.exists(conf_path):
-            return conf_path
-            
-        # Check MegaTinyCore specific location
-        conf_path = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Arduino15', 'packages', 'megaTinyCore', 'hardware', 'megaavr', '2.6.10', 'avrdude.conf')
-        if os.path.exists(conf_path):
-            return conf_path
-            
-        return None
+        return get_registry().get('avrdude_conf')
     
     def find_arduino_ports(self):
         """Find all connected Arduino devices."""
@@ -71,8 +64,171 @@ class ArduinoUploader:
         
         return arduino_ports
     
-    def upload_to_attiny1616(self, hex_file, port, fuse_settings=None, verbose=True):
-        """Upload a hex file to an ATtiny1616 using UPDI programmer."""
+    def close(self):
+        """Close the UPDI sessions kept open between uploads."""
+        for session in _updi_sessions.values():
+            try:
+                session.close()
+            except Exception:
+                pass
+        _updi_sessions.clear()
+    
+    def _get_updi_session(self, port):
+        """Return the open UPDI session for port, opening it on first use."""
+        from updi_programmer import UpdiSession
+        
+        session = _updi_sessions.get(port)
+        if session is None:
+            session = UpdiSession(port)
+            _updi_sessions[port] = session
+        return session
+    
+    def _drop_updi_session(self, port):
+        """Close and forget the session for port, e.g. after the adapter was unplugged."""
+        session = _updi_sessions.pop(port, None)
+        if session is not None:
+            try:
+                session.link.close()
+            except Exception:
+                pass
+    
+    def _upload_updi(self, hex_file, port, fuse_settings, policy, delta, verify):
+        """Upload with the in-process UPDI driver over a persistent session."""
+        from updi_programmer import UpdiError, VerifyError
+        
+        fuse_manager = get_fuse_manager()
+        
+        # A stale session (adapter replugged, target power-cycled) gets one reconnect
+        for attempt in range(2):
+            session = None
+            try:
+                start_time = time.perf_counter()
+                session = self._get_updi_session(port)
+                
+                # Read the fuses in one block unless this device was seen before
+                identity = session.device_id()
+                current = fuse_manager.state(identity)
+                if current is None:
+                    current = dict(enumerate(session.read_fuses()))
+                fuse_writes = fuse_manager.changes(current, fuse_settings)
+                
+                if policy != 'always':
+                    matches = session.image_matches(HexImage.load(hex_file))
+                    if matches or policy == 'verify-only':
+                        if matches and policy == 'if-different':
+                            # Same image: only the fuses that differ are written
+                            for number, value in sorted(fuse_writes.items()):
+                                session.write_fuse(number, value)
+                        else:
+                            fuse_writes = {}
+                        session.release()
+                        fuse_manager.record(identity, {**current, **fuse_writes}, port)
+                        return self._report_policy_result(hex_file, policy, matches)
+                
+                summary = session.program(hex_file, fuse_writes, delta, verify)
+                session.release()
+                fuse_manager.record(identity, {**current, **fuse_writes}, port)
+                
+                print(f"Upload successful in {time.perf_counter() - start_time:.2f}s")
+                self._report_flash_summary(summary, "full flash, no baseline for this device yet"
+                                           if delta and summary['full'] else None)
+                print(f"Fuses: {len(fuse_writes)} written, {len(fuse_settings) - len(fuse_writes)} unchanged")
+                return True
+            except VerifyError as e:
+                # The link works but the flash is wrong; retrying the same way would not help
+                session.release()
+                print(f"Error: {str(e)}")
+                return False
+            except (UpdiError, serial.SerialException, OSError) as e:
+                self._drop_updi_session(port)
+                fuse_manager.forget(port=port)
+                if attempt == 0:
+                    print(f"UPDI session on {port} failed ({str(e)}), reconnecting...")
+                    continue
+                print(f"Error: UPDI upload failed: {str(e)}")
+                return False
+            except ValueError as e:
+                # A bad hex file or fuse setting; the session stays open but the target is let go
+                if session is not None and session.in_progmode:
+                    try:
+                        session.release()
+                    except (UpdiError, serial.SerialException, OSError):
+                        self._drop_updi_session(port)
+                print(f"Error: {str(e)}")
+                return False
+    
+    def _report_flash_summary(self, summary, note=None):
+        """Print pages written versus skipped."""
+        line = f"Flash: {summary['written']} pages written, {summary['skipped']} skipped"
+        if summary['erased']:
+            line += f", {summary['erased']} erased"
+        if note:
+            line += f" ({note})"
+        print(line)
+    
+    def _report_policy_result(self, hex_file, policy, matches):
+        """Report the outcome of an upload that compared the device flash instead of writing it."""
+        name = os.path.basename(hex_file)
+        if matches:
+            if policy == 'verify-only':
+                print(f"Verified: device flash matches {name}.")
+            else:
+                print(f"Skipped flashing: device already holds {name}.")
+            return True
+        print(f"Verification failed: device flash differs from {name}.")
+        return False
+    
+    def upload_to_attiny1616(self, hex_file, port, fuse_settings=None, verbose=True, policy='always', delta=False,
+                             verify=None):
+        """Upload a hex file to an ATtiny1616 using UPDI programmer.
+        
+        Args:
+            hex_file (str): Image to program
+            port (str): Serial port of the programmer
+            fuse_settings (dict): Fuse profile, FUSE_PROFILE by default
+            verbose (bool): Unused, kept for existing callers
+            policy (str): 'always' writes the image; 'if-different' first compares the
+                device flash with the image and skips the write when they match;
+                'verify-only' only compares and never writes
+            delta (bool): Erase and write only the pages that changed since the last
+                upload to this device (updi backend; avrdude always does a full flash)
+            verify (str): 'none', 'pages' (read back only the pages written and stop at
+                the first mismatch; updi backend only) or 'full'. Defaults to 'pages'
+                with the updi backend and 'full' with avrdude, which reads back the
+                range the image covers after writing it.
+        
+        Returns:
+            bool: True if the device holds the image afterwards
+        """
+        if policy not in UPLOAD_POLICIES:
+            print(f"Error: Unknown upload policy '{policy}', expected one of {', '.join(UPLOAD_POLICIES)}")
+            return False
+        if verify is None:
+            verify = 'pages' if self.backend == 'updi' else 'full'
+        if verify not in VERIFY_MODES:
+            print(f"Error: Unknown verify mode '{verify}', expected one of {', '.join(VERIFY_MODES)}")
+            return False
+        if verify == 'pages' and self.backend != 'updi':
+            print("Error: Verify mode 'pages' needs the updi backend; avrdude can only verify 'full' or 'none'")
+            return False
+        
+        port_manager = get_port_manager()
+        if not port_manager.claim(port, 'upload'):
+            print(f"Error: Port {port} is in use by {port_manager.owner(port)}.")
+            return False
+        
+        try:
+            if self.backend == 'updi':
+                if not os.path.exists(hex_file):
+                    print(f"Error: Hex file {hex_file} not found.")
+                    return False
+                return self._upload_updi(hex_file, port, fuse_settings or FUSE_PROFILE, policy, delta, verify)
+            return self._upload_avrdude(hex_file, port, fuse_settings, policy, delta, verify)
+        finally:
+            port_manager.release(port, 'upload')
+    
+    def _upload_avrdude(self, hex_file, port, fuse_settings, policy, delta, verify):
+        """Upload with avrdude through a jtag2updi programmer."""
         if not self.avrdude_path:
             print("Error: avrdude not found. Please install Arduino IDE with megaTinyCore.")
             return False
@@ -85,86 +241,174 @@ class ArduinoUploader:
             print(f"Error: Hex file {hex_file} not found.")
             return False
             
-        # Verify the port exists
-        try:
-            # Try to open the port briefly to check if it's available
-            ser = serial.Serial(port, 115200, timeout=1)
-            ser.close()
-            print(f"Port {port} is available.")
-        except serial.SerialException as e:
-            print(f"Error: Could not open port {port}. {str(e)}")
+        # Presence comes from port enumeration; the port is only opened to check it
+        # the first time it is seen or after it was unplugged and plugged back in
+        available, reason = get_port_manager().check(port, 115200, 'upload')
+        if not available:
+            print(f"Error: Port {port} {reason}.")
             print("Please check if the Arduino is properly connected and the port is correct.")
             return False
             
-        # Default fuse settings for ATtiny1616 with 20MHz clock
-        if fuse_settings is None:
-            fuse_settings = {
-                "fuse0": "0b00000000",  # APPEND disabled, BOOTEND = 0
-                "fuse2": "0x02",        # OSCLOCK disabled, EESAVE disabled, BODCFG = 2
-                "fuse5": "0b11000101",  # 20MHz oscillator, RUNSTDBY disabled, STARTUP = 1 (16ms)
-                "fuse6": "0x04",        # SYSCFG0 = 0x04 (default)
-                "fuse7": "0x00",        # SYSCFG1 = 0x00 (default)
-                "fuse8": "0x00"         # BOOTSIZE = 0 (default)
-            }
-            
+        # A config trimmed to the parts and programmers we use makes avrdude start faster
+        avrdude_conf = resolve_conf(self.avrdude_conf, "attiny1616", "jtag2updi")
+        
         # Build the avrdude command
-        cmd = [
+        base_cmd = [
             self.avrdude_path,
-            f"-C{self.avrdude_conf}",
+            f"-C{avrdude_conf}",
             "-v",                    # Verbose output
-            "-V",                    # Disable auto-verify
             "-pattiny1616",          # Target device
             "-cjtag2updi",           # Programmer type (UPDI)
-            f"-P{port}",             # Serial port
-            "-b115200"               # Baud rate
+            f"-P{port}"              # Serial port; the baud rate is picked per run
         ]
+        if verify == 'none':
+            base_cmd.insert(3, "-V") # Disable auto-verify; otherwise avrdude reads back what it wrote
+        
+        profile = fuse_settings or FUSE_PROFILE
+        fuse_manager = get_fuse_manager()
+        with_serial = part_has_memory(avrdude_conf, "attiny1616", "prodsig")
+        
+        print("Uploading to ATtiny1616...")
+        print(f"Using avrdude at: {self.avrdude_path}")
+        print(f"Using configuration: {avrdude_conf}")
         
-        # Add fuse settings
-        for fuse, value in fuse_settings.items():
+        if policy != 'always':
+            # Compare the device flash with the image; the fuses and identity are read in the same run
+            readback = AvrdudeReadback(fuse_values(profile), with_serial)
+            cmd = base_cmd + readback.operations() + [f"-Uflash:v:{hex_file}:i"]
+            print(f"Command: {' '.join(cmd)}")
+            try:
+                matches = self._run_avrdude(cmd, verify=True)
+                identity, values = readback.result()
+            finally:
+                readback.cleanup()
+            
+            if matches is None:
+                fuse_manager.forget(port=port)
+                return False
+            if identity is not None:
+                fuse_manager.record(identity, values, port)
+            
+            if policy == 'verify-only':
+                return self._report_policy_result(hex_file, policy, matches)
+            if matches:
+                fuse_writes = fuse_manager.changes(values, profile)
+                if fuse_writes and not self._write_fuses_avrdude(base_cmd, fuse_writes):
+                    fuse_manager.forget(port=port)
+                    return False
+                if identity is not None:
+                    fuse_manager.record(identity, fuse_writes, port)
+                return self._report_policy_result(hex_file, policy, matches)
+        
+        # Fuses are only skipped for a device identified earlier in this upload; the one on
+        # the port may have been swapped since the last upload, so otherwise the whole
+        # profile is written with the flash
+        known = values if policy != 'always' and identity is not None else None
+        fuse_writes = fuse_manager.changes(known, profile)
+        
+        cmd = list(base_cmd)
+        for fuse, value in format_fuse_settings(fuse_writes).items():
             cmd.append(f"-U{fuse}:w:{value}:m")
             
         # Add hex file
         cmd.append(f"-Uflash:w:{hex_file}:i")
         
-        print("Uploading to ATtiny1616...")
-        print(f"Using avrdude at: {self.avrdude_path}")
-        print(f"Using configuration: {self.avrdude_conf}")
+        # Read identity and fuses back in the same run to learn which device this was
+        readback = AvrdudeReadback(fuse_values(profile), with_serial)
+        cmd.extend(readback.operations())
+        
+        print(f"Fuses: {len(fuse_writes)} to write, {len(profile) - len(fuse_writes)} unchanged")
         print(f"Command: {' '.join(cmd)}")
         
+        # avrdude erases the chip and writes every page of the image
+        summary = {'written': len(HexImage.load(hex_file).page_addresses(64)), 'erased': 0, 'skipped': 0, 'full': True}
+        note = "full flash, delta flashing needs the updi backend" if delta else None
+        
         try:
-            # Use a timeout to prevent hanging indefinitely
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            if not self._run_avrdude(cmd):
+                fuse_manager.forget(port=port)
+                return False
             
-            if result.returncode == 0:
+            identity, values = readback.result()
+            if identity is None:
+                # Without a readback the next upload writes every fuse again
+                fuse_manager.forget(port=port)
                 print("Upload successful!")
+                self._report_flash_summary(summary, note)
                 return True
-            else:
-                print(f"Upload failed with return code: {result.returncode}")
-                if result.stderr:
-                    print(f"Error output: {result.stderr}")
-                if result.stdout:
-                    print(f"Standard output: {result.stdout}")
-                return False
-        except subprocess.TimeoutExpired:
+            
+            fuse_manager.record(identity, values, port)
+            
+            # A fuse that did not read back as written
+            remaining = fuse_manager.changes(values, profile)
+            if remaining:
+                if not self._write_fuses_avrdude(base_cmd, remaining):
+                    fuse_manager.forget(port=port)
+                    return False
+                fuse_manager.record(identity, remaining, port)
+            
+            print("Upload successful!")
+            self._report_flash_summary(summary, note)
+            return True
+        finally:
+            readback.cleanup()
+    
+    def _write_fuses_avrdude(self, base_cmd, fuse_writes):
+        """Write fuses in a separate avrdude run."""
+        print(f"Writing {len(fuse_writes)} fuses that differ on this device...")
+        cmd = list(base_cmd)
+        for fuse, value in format_fuse_settings(fuse_writes).items():
+            cmd.append(f"-U{fuse}:w:{value}:m")
+        return self._run_avrdude(cmd)
+    
+    def _run_avrdude(self, cmd, verify=False):
+        """Run an avrdude command and report failures.
+        
+        avrdude's output is parsed as it arrives, so a missing programmer or
+        target stops the run at the first fatal message instead of the timeout.
+        The programmer link runs at the fastest rate that last worked on the
+        port, falling back through JTAG2UPDI_BAUD_RATES when it does not respond.
+        
+        Returns:
+            bool: True on success. With verify=True a verification mismatch returns
+            False and any other failure returns None.
+        """
+        port = next(arg[2:] for arg in cmd if arg.startswith("-P"))
+        run, baud_rate = run_with_fallback(cmd, port, timeout=60, on_progress=print_progress)
+        
+        if run.success:
+            print(f"avrdude finished in {run.elapsed:.2f}s at {baud_rate} baud ({run.summary()})")
+            return True
+        
+        if verify and run.error['kind'] == 'verify_failed':
+            return False
+        
+        if run.error['kind'] == 'timeout':
             print("Upload timed out after 60 seconds.")
             print("This could be due to communication issues with the Arduino.")
             print("Please check your connections and try again.")
-            return False
-        except Exception as e:
-            print(f"Error during upload: {str(e)}")
-            return False
+        else:
+            print(f"Upload failed after {run.elapsed:.2f}s ({run.error['kind']}): {run.error['message']}")
+            if run.output and run.error['kind'] == 'exit_code':
+                print(f"avrdude output:\n{run.output}")
+        return None if verify else False
 
 def main():
     """Main function for standalone usage."""
     if len(sys.argv) < 3:
-        print("Usage: python arduino_uploader.py <hex_file> <port>")
+        print("Usage: python arduino_uploader.py <hex_file> <port> [avrdude|updi] [always|if-different|verify-only]")
         return
     
     hex_file = sys.argv[1]
     port = sys.argv[2]
+    backend = sys.argv[3] if len(sys.argv) > 3 else 'avrdude'
+    policy = sys.argv[4] if len(sys.argv) > 4 else 'always'
     
-    uploader = ArduinoUploader()
-    uploader.upload_to_attiny1616(hex_file, port)
+    uploader = ArduinoUploader(backend)
+    try:
+        uploader.upload_to_attiny1616(hex_file, port, policy=policy)
+    finally:
+        uploader.close()
 
 if __name__ == "__main__":
     main()
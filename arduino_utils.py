@@ -1,40 +1,14 @@
 import os
 import sys
 import platform
-import shutil
 import serial
 import serial.tools.list_ports
 
+from toolchain_registry import get_registry
+
 def find_avrdude():
-    """Find avrdude executable, first in PATH, then in common Arduino installation locations."""
-    # First check if it's in the system PATH
-    avrdude_path = shutil.which("avrdude")
-    
-    if avrdude_path:
-        return avrdude_path
-    
-    # Check common Arduino installation locations
-    if platform.system() == "Windows":
-        common_locations = [
-            os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files"), "Arduino", "hardware", "tools", "avr", "bin", "avrdude.exe"),
-            os.path.join(os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)"), "Arduino", "hardware", "tools", "avr", "bin", "avrdude.exe")
-        ]
-    elif platform.system() == "Darwin":  # macOS
-        common_locations = [
-            "/Applications/Arduino.app/Contents/Java/hardware/tools/avr/bin/avrdude",
-            os.path.expanduser("~/Applications/Arduino.app/Contents/Java/hardware/tools/avr/bin/avrdude")
-        ]
-    else:  # Linux and others
-        common_locations = [
-            "/usr/bin/avrdude",
-            "/usr/local/bin/avrdude"
-        ]
-    
-    for location in common_locations:
-        if os.path.exists(location):
-            return location
-    
-    return None
+    """Find avrdude executable in the Arduino installation, PATH or common system locations."""
+    return get_registry().get('avrdude')
 
 def is_avrdude_available():
     """Check if avrdude is available in the system path or Arduino installation."""
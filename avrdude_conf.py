@@ -0,0 +1,318 @@
+import os
+import re
+import sys
+import time
+import tempfile
+import hashlib
+import subprocess
+
+from toolchain_registry import get_registry
+
+# Parts and programmers this project passes to avrdude with -p and -c
+PROJECT_PARTS = ['attiny1616', 'attiny1614', 'atmega328p']
+PROJECT_PROGRAMMERS = ['jtag2updi', 'arduino']
+
+TRIMMED_DIR = os.path.join(tempfile.gettempdir(), 'arduino_compiler', 'avrdude')
+
+# Header of a generated file; records the stock config it was made from and what it holds
+HEADER_PATTERN = re.compile(r'^# Trimmed from (.+) \(mtime (\d+), size (\d+)\)\n# Parts: (.*); programmers: (.*)\n')
+
+TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|#[^\n]*|[=;,]|[^\s=;,"#]+')
+
+def tokenize(text):
+    """Split avrdude.conf text into (token, start, end) tuples, dropping comments."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        if token.startswith('#'):
+            continue
+        tokens.append((token, match.start(), match.end()))
+    return tokens
+
+def _unquote(token):
+    """Value of a quoted string token."""
+    return token[1:-1] if token.startswith('"') else token
+
+def parse_conf(text):
+    """Split avrdude.conf into top-level items.
+
+    Returns:
+        list: Dicts with 'kind' ('programmer', 'part' or 'other'), 'ids' (lower-case
+        id and desc values), 'parent', and the 'start'/'end' offsets of the item
+    """
+    tokens = tokenize(text)
+    items = []
+    i = 0
+
+    while i < len(tokens):
+        token, start, end = tokens[i]
+
+        if token not in ('programmer', 'part'):
+            # Top-level assignment such as default_serial = "...";
+            while i < len(tokens) and tokens[i][0] != ';':
+                i += 1
+            if i >= len(tokens):
+                raise ValueError(f"Unterminated statement at offset {start}")
+            items.append({'kind': 'other', 'ids': [], 'parent': None, 'start': start, 'end': tokens[i][2]})
+            i += 1
+            continue
+
+        item = {'kind': token, 'ids': [], 'parent': None, 'start': start, 'end': None}
+        i += 1
+
+        if i < len(tokens) and tokens[i][0] == 'parent':
+            item['parent'] = _unquote(tokens[i + 1][0]).lower()
+            i += 2
+
+        depth = 0
+        while i < len(tokens):
+            token = tokens[i][0]
+
+            if token == ';':
+                # A bare ';' closes a memory block or the item itself
+                if depth == 0:
+                    item['end'] = tokens[i][2]
+                    i += 1
+                    break
+                depth -= 1
+                i += 1
+                continue
+
+            if token == 'memory':
+                if i + 2 < len(tokens) and tokens[i + 2][0] == '=':
+                    # memory "userrow" = NULL; removes a memory inherited from the parent
+                    while i < len(tokens) and tokens[i][0] != ';':
+                        i += 1
+                    i += 1
+                    continue
+                # memory "flash" ... ;
+                depth += 1
+                i += 2
+                continue
+
+            # key = value[, value...] ;
+            if i + 1 >= len(tokens) or tokens[i + 1][0] != '=':
+                raise ValueError(f"Unexpected token '{token}' at offset {tokens[i][1]}")
+            key = token
+            i += 2
+            values = []
+            while i < len(tokens) and tokens[i][0] != ';':
+                if tokens[i][0] != ',':
+                    values.append(_unquote(tokens[i][0]))
+                i += 1
+            i += 1
+
+            if depth == 0 and key in ('id', 'desc'):
+                item['ids'].extend(value.lower() for value in values)
+
+        if item['end'] is None:
+            raise ValueError(f"Unterminated {item['kind']} at offset {item['start']}")
+        items.append(item)
+
+    return items
+
+def trim_conf(text, parts=PROJECT_PARTS, programmers=PROJECT_PROGRAMMERS):
+    """Keep only the given parts and programmers, plus the parents they inherit from.
+
+    Global settings are kept as they are. Names the stock config does not
+    define are left out; older avrdude builds have no jtag2updi, for example.
+
+    Returns:
+        tuple: (trimmed text, included part names, included programmer names)
+    """
+    items = parse_conf(text)
+
+    def find(kind, name):
+        for item in items:
+            if item['kind'] == kind and name.lower() in item['ids']:
+                return item
+        return None
+
+    selected = set()
+    included = {'part': [], 'programmer': []}
+    for kind, names in (('part', parts), ('programmer', programmers)):
+        for name in names:
+            chain = []
+            item = find(kind, name)
+            # Follow the inheritance chain so every parent block is included
+            while item is not None:
+                chain.append(item)
+                if not item['parent']:
+                    break
+                item = find(kind, item['parent'])
+                if item is None:
+                    raise ValueError(f"Parent of {kind} '{name}' not found in avrdude.conf")
+            if chain:
+                selected.update(id(item) for item in chain)
+                included[kind].append(name)
+
+    pieces = []
+    for item in items:
+        if item['kind'] == 'other' or id(item) in selected:
+            pieces.append(text[item['start']:item['end']])
+
+    return '\n\n'.join(pieces) + '\n', included['part'], included['programmer']
+
+def part_has_memory(conf, part, memory):
+    """Check whether part (or a part it inherits from) defines memory in conf."""
+    try:
+        with open(conf, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        items = parse_conf(text)
+    except (OSError, ValueError):
+        return False
+
+    pattern = re.compile(r'\bmemory\s+"' + re.escape(memory) + r'"\s*(=)?', re.IGNORECASE)
+    name = part.lower()
+    seen = set()
+    while name and name not in seen:
+        seen.add(name)
+        item = next((item for item in items if item['kind'] == 'part' and name in item['ids']), None)
+        if item is None:
+            return False
+        match = pattern.search(text, item['start'], item['end'])
+        if match:
+            # memory "x" = NULL; removes a memory the parent defines
+            return match.group(1) is None
+        name = item['parent']
+    return False
+
+def trimmed_path(stock_conf):
+    """Location of the trimmed config generated from stock_conf."""
+    digest = hashlib.sha256(os.path.abspath(stock_conf).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(TRIMMED_DIR, f"avrdude_{digest}.conf")
+
+def _source_stamp(stock_conf):
+    """mtime and size of the stock config."""
+    stat = os.stat(stock_conf)
+    return stat.st_mtime_ns, stat.st_size
+
+def generate(stock_conf, output=None):
+    """Write the trimmed config for stock_conf.
+
+    Returns:
+        str: Path to the trimmed config, or None on failure
+    """
+    if output is None:
+        output = trimmed_path(stock_conf)
+
+    try:
+        with open(stock_conf, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        trimmed, parts, programmers = trim_conf(text)
+        mtime, size = _source_stamp(stock_conf)
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not trim {stock_conf}: {str(e)}")
+        return None
+
+    output_dir = os.path.dirname(os.path.abspath(output))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(f"# Trimmed from {stock_conf} (mtime {mtime}, size {size})\n")
+        f.write(f"# Parts: {', '.join(parts)}; programmers: {', '.join(programmers)}\n\n")
+        f.write(trimmed)
+    os.replace(tmp_path, output)
+
+    return output
+
+def is_valid(trimmed_conf, stock_conf, part=None, programmer=None):
+    """Check that a trimmed config matches the current stock config and holds part and programmer."""
+    try:
+        with open(trimmed_conf, 'r', encoding='utf-8') as f:
+            match = HEADER_PATTERN.match(f.readline() + f.readline())
+        mtime, size = _source_stamp(stock_conf)
+    except OSError:
+        return False
+
+    if (match is None or match.group(1) != stock_conf or
+            int(match.group(2)) != mtime or int(match.group(3)) != size):
+        return False
+
+    parts = match.group(4).split(', ')
+    programmers = match.group(5).split(', ')
+    return (part is None or part.lower() in parts) and (programmer is None or programmer.lower() in programmers)
+
+def resolve_conf(stock_conf, part=None, programmer=None):
+    """Return the config avrdude should load: the trimmed one when it is valid, else stock_conf.
+
+    A missing or outdated trimmed config is generated on the spot. The stock
+    config is used unchanged if that fails or the trimmed one lacks part or programmer.
+    """
+    if not stock_conf or not os.path.exists(stock_conf):
+        return stock_conf
+
+    output = trimmed_path(stock_conf)
+    if not is_valid(output, stock_conf):
+        if not generate(stock_conf, output):
+            return stock_conf
+
+    return output if is_valid(output, stock_conf, part, programmer) else stock_conf
+
+def benchmark(stock_conf, runs=5, part='attiny1616', programmer='jtag2updi'):
+    """Compare avrdude startup time with the stock and the trimmed config.
+
+    avrdude is pointed at a port that does not exist, so each run measures
+    process start and config parsing up to the point it would open the port.
+    """
+    avrdude = get_registry().get('avrdude')
+    if not avrdude or not stock_conf:
+        print("Error: avrdude or avrdude.conf not found.")
+        return None
+
+    trimmed_conf = resolve_conf(stock_conf, part, programmer)
+    if trimmed_conf == stock_conf:
+        print("Error: Could not generate a trimmed config.")
+        return None
+
+    missing_port = os.path.join(tempfile.gettempdir(), 'no_such_port')
+    timings = {}
+
+    for label, conf in (('stock', stock_conf), ('trimmed', trimmed_conf)):
+        samples = []
+        for _ in range(runs):
+            cmd = [avrdude, f"-C{conf}", f"-p{part}", f"-c{programmer}", f"-P{missing_port}"]
+            start_time = time.perf_counter()
+            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            samples.append(time.perf_counter() - start_time)
+        samples.sort()
+        timings[label] = samples[len(samples) // 2]
+
+    stock_size = os.path.getsize(stock_conf)
+    trimmed_size = os.path.getsize(trimmed_conf)
+    print(f"Stock config:   {stock_size:8d} bytes, median startup {timings['stock'] * 1000:.1f} ms")
+    print(f"Trimmed config: {trimmed_size:8d} bytes, median startup {timings['trimmed'] * 1000:.1f} ms")
+    print(f"Saved per avrdude invocation: {(timings['stock'] - timings['trimmed']) * 1000:.1f} ms")
+
+    return timings
+
+def main():
+    """Main function for standalone usage."""
+    usage = ("Usage:\n"
+             "  python avrdude_conf.py generate [stock_conf] [output]\n"
+             "  python avrdude_conf.py --benchmark [stock_conf] [runs]")
+
+    if len(sys.argv) < 2:
+        print(usage)
+        return
+
+    stock_conf = sys.argv[2] if len(sys.argv) > 2 else get_registry().get('avrdude_conf')
+    if not stock_conf:
+        print("Error: avrdude.conf not found.")
+        return
+
+    if sys.argv[1] == "generate":
+        output = sys.argv[3] if len(sys.argv) > 3 else None
+        path = generate(stock_conf, output)
+        if path:
+            print(f"Trimmed config written to: {path} ({os.path.getsize(path)} of {os.path.getsize(stock_conf)} bytes)")
+    elif sys.argv[1] == "--benchmark":
+        runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+        benchmark(stock_conf, runs)
+    else:
+        print(usage)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import re
+import sys
+import time
+import queue
+import threading
+import subprocess
+
+# avrdude output that means the run cannot succeed; the process is killed as soon as one appears
+FATAL_PATTERNS = [
+    ('port_error', re.compile(r"can't open device|ser_open\(\)")),
+    ('not_responding', re.compile(r'programmer is not responding|timeout/error communicating with programmer|'
+                                  r'not in sync: resp=|RSP_NO_TARGET_POWER')),
+    # avrdude's table lacks the rate, or the programmer refused the switch (jtagmkII then carries on at 19200)
+    ('baud_rejected', re.compile(r'unsupported baudrate|bad response to set parameter command')),
+    ('signature_mismatch', re.compile(r'Expected signature for .* is|Invalid device signature')),
+    ('init_failed', re.compile(r'initialization failed')),
+    ('verify_failed', re.compile(r'verification error'))
+]
+
+# Lines that start a phase of the run; the first phase, 'connect', starts with the process
+PHASE_PATTERNS = [
+    ('ready', re.compile(r'AVR device initialized and ready')),
+    ('erase', re.compile(r'erasing chip')),
+    ('fuses', re.compile(r'writing (?:fuse\d+|[lhe]fuse|fuses)\b')),
+    ('write', re.compile(r'writing (?:flash|eeprom)\b')),
+    ('verify', re.compile(r'verifying')),
+    ('read', re.compile(r'reading (?:on-chip|\S+ memory)')),
+    ('done', re.compile(r'avrdude(?:\.exe)?: safemode|avrdude(?:\.exe)? done'))
+]
+
+# avrdude draws progress as 50 '#' characters after "Writing | " or "Reading | "
+PROGRESS_START = re.compile(r'(Writing|Reading) \| $')
+PROGRESS_STEPS = 50
+
+class AvrdudeRun:
+    """Result of an avrdude run.
+
+    Attributes:
+        returncode (int): Exit code, or None if the process was killed
+        error (dict): None on success, else {'kind', 'message', 'line'}; kind is one of
+            the FATAL_PATTERNS names, 'timeout', 'exit_code' or 'launch_failed'
+        phases (dict): Seconds spent per phase ('connect', 'erase', 'fuses', 'write', ...)
+        output (str): Everything avrdude printed
+        elapsed (float): Wall time of the run
+    """
+
+    def __init__(self):
+        self.returncode = None
+        self.error = None
+        self.phases = {}
+        self.output = ''
+        self.elapsed = 0.0
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def summary(self):
+        """One line with the phase timings, e.g. "connect 0.41s, fuses 0.12s, write 1.90s"."""
+        return ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+
+class _OutputParser:
+    """Incremental parser for avrdude's stderr, fed arbitrary chunks of text."""
+
+    def __init__(self, start_time, on_progress):
+        self.on_progress = on_progress
+        self.line = ''
+        self.lines = []
+        self.phase = 'connect'
+        self.phase_start = start_time
+        self.phases = {}
+        self.progress_label = None
+        self.progress_steps = 0
+        self.fatal = None
+
+    def _enter_phase(self, name, now):
+        """Close the current phase and start another."""
+        if name == self.phase:
+            return
+        if self.phase not in ('ready', 'done'):
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self.phase_start
+        self.phase = name
+        self.phase_start = now
+
+    def finish(self, now):
+        """Account the time of the phase still open when the process ends."""
+        if self.line:
+            self._end_line(now)
+        self._enter_phase('done', now)
+
+    def _end_line(self, now):
+        line = self.line
+        self.line = ''
+        self.progress_label = None
+        self.lines.append(line)
+
+        for name, pattern in PHASE_PATTERNS:
+            if pattern.search(line):
+                self._enter_phase(name, now)
+                break
+
+        if self.fatal is None:
+            for kind, pattern in FATAL_PATTERNS:
+                if pattern.search(line):
+                    self.fatal = {'kind': kind, 'message': line.strip(), 'line': len(self.lines)}
+                    break
+
+    def feed(self, text, now):
+        """Process a chunk of output."""
+        for char in text:
+            if char in '\r\n':
+                self._end_line(now)
+                continue
+
+            self.line += char
+            if self.progress_label is not None:
+                if char == '#':
+                    self.progress_steps += 1
+                    if self.on_progress:
+                        self.on_progress(self.phase, self.progress_label,
+                                         min(100, self.progress_steps * 100 // PROGRESS_STEPS))
+            elif char == ' ':
+                match = PROGRESS_START.search(self.line)
+                if match:
+                    self.progress_label = match.group(1).lower()
+                    self.progress_steps = 0
+                    if self.on_progress:
+                        self.on_progress(self.phase, self.progress_label, 0)
+
+def _pump(stream, chunks):
+    """Copy a pipe into a queue until EOF."""
+    while True:
+        data = stream.read1(4096) if hasattr(stream, 'read1') else stream.read(4096)
+        if not data:
+            break
+        chunks.put(data)
+    chunks.put(None)
+
+def run_avrdude(cmd, timeout=60, on_progress=None, echo=False):
+    """Run avrdude, parsing its output as it arrives.
+
+    The process is killed as soon as a line matches FATAL_PATTERNS, so a
+    missing programmer or target fails within a second or two instead of
+    running into the timeout.
+
+    Args:
+        cmd (list): avrdude command line
+        timeout (float): Seconds before the process is killed
+        on_progress (callable): Called as on_progress(phase, 'writing'|'reading', percent)
+        echo (bool): Print avrdude's output as it arrives
+
+    Returns:
+        AvrdudeRun: Return code, structured error, phase timings and output
+    """
+    run = AvrdudeRun()
+    start_time = time.perf_counter()
+
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+    except OSError as e:
+        run.error = {'kind': 'launch_failed', 'message': str(e), 'line': 0}
+        return run
+
+    chunks = queue.Queue()
+    reader = threading.Thread(target=_pump, args=(process.stdout, chunks), daemon=True)
+    reader.start()
+
+    parser = _OutputParser(start_time, on_progress)
+    deadline = start_time + timeout
+    killed = False
+
+    while True:
+        try:
+            data = chunks.get(timeout=max(0.0, min(0.1, deadline - time.perf_counter())))
+        except queue.Empty:
+            data = b''
+        now = time.perf_counter()
+
+        if data is None:
+            break
+        if data:
+            text = data.decode('utf-8', errors='replace')
+            if echo:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            parser.feed(text, now)
+
+        if parser.fatal is not None and parser.fatal['kind'] != 'verify_failed':
+            process.kill()
+            killed = True
+            run.error = parser.fatal
+            break
+        if now >= deadline:
+            process.kill()
+            killed = True
+            run.error = {'kind': 'timeout', 'message': f"avrdude did not finish within {timeout} seconds",
+                         'line': len(parser.lines)}
+            break
+
+    process.wait()
+    reader.join(timeout=1)
+    end_time = time.perf_counter()
+    parser.finish(end_time)
+
+    run.returncode = None if killed else process.returncode
+    run.phases = parser.phases
+    run.output = '\n'.join(parser.lines)
+    run.elapsed = end_time - start_time
+
+    if run.error is None and process.returncode != 0:
+        run.error = parser.fatal or {'kind': 'exit_code', 'message': f"avrdude exited with code {process.returncode}",
+                                     'line': len(parser.lines)}
+    return run
+
+def print_progress(phase, label, percent):
+    """on_progress callback that draws a one-line progress bar."""
+    bar = '#' * (percent // 4)
+    sys.stdout.write(f"\r{label.capitalize():8} {phase:7} |{bar:25}| {percent:3d}%")
+    if percent >= 100:
+        sys.stdout.write('\n')
+    sys.stdout.flush()
+
+def main():
+    """Run an avrdude command line and print its progress and phase timings."""
+    if len(sys.argv) < 2:
+        print("Usage: python avrdude_runner.py <avrdude> [avrdude arguments...]")
+        return
+
+    run = run_avrdude(sys.argv[1:], on_progress=print_progress)
+    if run.success:
+        print(f"avrdude finished in {run.elapsed:.2f}s ({run.summary()})")
+    else:
+        print(f"avrdude failed after {run.elapsed:.2f}s: {run.error['kind']}: {run.error['message']}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
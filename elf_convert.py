@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+
+from elf_reader import ElfFile
+
+# objcopy writes at most 16 data bytes per Intel HEX record
+IHEX_CHUNK = 16
+
+def ihex_record(address, record_type, data=b''):
+    """Format one Intel HEX record, without the line ending."""
+    raw = bytearray([len(data), (address >> 8) & 0xFF, address & 0xFF, record_type])
+    raw += data
+    raw.append((-sum(raw)) & 0xFF)
+    return ':' + raw.hex().upper()
+
+def format_ihex(sections, start_address=0):
+    """Format loadable sections as Intel HEX text, record for record like avr-objcopy -O ihex.
+
+    Every section starts a fresh run of records at its own load address, and
+    records never cross a 64K boundary.
+
+    Args:
+        sections (list): (name, load address, data) tuples
+        start_address (int): Entry point; 0 writes no start record
+    """
+    lines = []
+    segbase = 0
+    extbase = 0
+
+    for name, lma, data in sections:
+        offset = 0
+        while offset < len(data):
+            where = lma + offset
+            count = min(len(data) - offset, IHEX_CHUNK)
+
+            if where > segbase + extbase + 0xFFFF:
+                # Switch base address the same way BFD does
+                if extbase == 0 and where <= 0xFFFFF:
+                    segbase = where & 0xF0000
+                    lines.append(ihex_record(0, 0x02, (segbase >> 4).to_bytes(2, 'big')))
+                else:
+                    if segbase != 0:
+                        segbase = 0
+                        lines.append(ihex_record(0, 0x02, b'\x00\x00'))
+                    extbase = where & 0xFFFF0000
+                    lines.append(ihex_record(0, 0x04, (extbase >> 16).to_bytes(2, 'big')))
+
+            record_address = where - (extbase + segbase)
+            if record_address + count > 0x10000:
+                count = 0x10000 - record_address
+
+            lines.append(ihex_record(record_address, 0x00, data[offset:offset + count]))
+            offset += count
+
+    if start_address:
+        if start_address <= 0xFFFFF:
+            cs_ip = ((start_address & 0xF0000) << 12) | (start_address & 0xFFFF)
+            lines.append(ihex_record(0, 0x03, cs_ip.to_bytes(4, 'big')))
+        else:
+            lines.append(ihex_record(0, 0x05, start_address.to_bytes(4, 'big')))
+
+    lines.append(ihex_record(0, 0x01))
+    return '\n'.join(lines) + '\n'
+
+def format_binary(sections):
+    """Lay loadable sections out as a flat image starting at the lowest load address.
+
+    Gaps between sections are filled with zeros, like avr-objcopy -O binary.
+    """
+    if not sections:
+        return b''
+
+    low = min(lma for name, lma, data in sections)
+    high = max(lma + len(data) for name, lma, data in sections)
+    image = bytearray(high - low)
+    for name, lma, data in sections:
+        image[lma - low:lma - low + len(data)] = data
+    return bytes(image)
+
+def _write_atomic(path, content):
+    """Write content to path so readers never see a partial file."""
+    if isinstance(content, str):
+        content = content.encode('ascii')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def elf_start_address(elf):
+    """Entry point recorded in the ELF header."""
+    return int.from_bytes(elf.data[24:28], 'little')
+
+def write_hex(elf, hex_file):
+    """Write the flash image (everything except .eeprom) as Intel HEX."""
+    sections = elf.loadable_sections(exclude=('.eeprom',))
+    _write_atomic(hex_file, format_ihex(sections, elf_start_address(elf)))
+
+def write_bin(elf, bin_file):
+    """Write the flash image (everything except .eeprom) as a raw binary."""
+    _write_atomic(bin_file, format_binary(elf.loadable_sections(exclude=('.eeprom',))))
+
+def write_eep(elf, eep_file):
+    """Write the .eeprom section as Intel HEX, relocated to address 0."""
+    sections = [(name, 0, data) for name, lma, data in elf.loadable_sections(only=('.eeprom',))]
+    _write_atomic(eep_file, format_ihex(sections, elf_start_address(elf)))
+
+def convert(elf_file, hex_file=None, bin_file=None, eep_file=None):
+    """Produce the requested output files from one read of the ELF file."""
+    elf = ElfFile(elf_file)
+    if hex_file:
+        write_hex(elf, hex_file)
+    if bin_file:
+        write_bin(elf, bin_file)
+    if eep_file:
+        write_eep(elf, eep_file)
+
+def main():
+    """Main function for standalone usage."""
+    if len(sys.argv) < 2:
+        print("Usage: python elf_convert.py <elf_file> [output_dir]")
+        return
+
+    elf_file = sys.argv[1]
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(os.path.abspath(elf_file))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(elf_file))[0])
+
+    convert(elf_file, base + '.hex', base + '.bin', base + '.eep')
+    print(f"Wrote {base}.hex, {base}.bin and {base}.eep")
+
+if __name__ == "__main__":
+    main()
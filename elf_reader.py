@@ -0,0 +1,206 @@
+import struct
+import sys
+
+# ELF constants used by the AVR toolchain output
+ELF_MAGIC = b'\x7fELF'
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHF_ALLOC = 0x2
+PT_LOAD = 1
+
+class ElfFile:
+    """Minimal reader for the 32-bit little-endian ELF files produced by avr-gcc."""
+
+    def __init__(self, elf_path):
+        """Load and parse the ELF file at elf_path."""
+        self.path = elf_path
+        with open(elf_path, 'rb') as f:
+            self.data = f.read()
+
+        if self.data[:4] != ELF_MAGIC:
+            raise ValueError(f"{elf_path} is not an ELF file")
+        if self.data[4] != 1 or self.data[5] != 1:
+            raise ValueError(f"{elf_path} is not a 32-bit little-endian ELF file")
+
+        self.sections = []
+        self.segments = []
+        self.symbols = {}
+
+        self._parse_segments()
+        self._parse_sections()
+        self._parse_symbols()
+
+    def _parse_segments(self):
+        """Read the program headers (load segments)."""
+        e_phoff, = struct.unpack_from('<I', self.data, 28)
+        e_phentsize, e_phnum = struct.unpack_from('<HH', self.data, 42)
+
+        for i in range(e_phnum):
+            (p_type, p_offset, p_vaddr, p_paddr,
+             p_filesz, p_memsz, p_flags, p_align) = struct.unpack_from('<8I', self.data, e_phoff + i * e_phentsize)
+            self.segments.append({
+                'type': p_type,
+                'offset': p_offset,
+                'vaddr': p_vaddr,
+                'paddr': p_paddr,
+                'filesz': p_filesz,
+                'memsz': p_memsz,
+                'flags': p_flags
+            })
+
+    def _parse_sections(self):
+        """Read the section headers and resolve their names."""
+        e_shoff, = struct.unpack_from('<I', self.data, 32)
+        e_shentsize, e_shnum, e_shstrndx = struct.unpack_from('<HHH', self.data, 46)
+
+        headers = []
+        for i in range(e_shnum):
+            headers.append(struct.unpack_from('<10I', self.data, e_shoff + i * e_shentsize))
+
+        names_offset = headers[e_shstrndx][4] if e_shnum else 0
+
+        for (sh_name, sh_type, sh_flags, sh_addr, sh_offset,
+             sh_size, sh_link, sh_info, sh_addralign, sh_entsize) in headers:
+            self.sections.append({
+                'name': self._read_string(names_offset + sh_name),
+                'type': sh_type,
+                'flags': sh_flags,
+                'addr': sh_addr,
+                'offset': sh_offset,
+                'size': sh_size,
+                'link': sh_link,
+                'entsize': sh_entsize
+            })
+
+    def _parse_symbols(self):
+        """Read the symbol table into a name -> symbol dictionary."""
+        for section in self.sections:
+            if section['type'] != SHT_SYMTAB:
+                continue
+
+            strtab_offset = self.sections[section['link']]['offset']
+            entsize = section['entsize'] or 16
+
+            for pos in range(section['offset'], section['offset'] + section['size'], entsize):
+                st_name, st_value, st_size, st_info, st_other, st_shndx = struct.unpack_from('<IIIBBH', self.data, pos)
+                name = self._read_string(strtab_offset + st_name)
+                if not name:
+                    continue
+
+                section_name = None
+                if 0 < st_shndx < len(self.sections):
+                    section_name = self.sections[st_shndx]['name']
+
+                self.symbols[name] = {
+                    'name': name,
+                    'value': st_value,
+                    'size': st_size,
+                    'section': section_name
+                }
+
+    def _read_string(self, offset):
+        """Read a NUL-terminated string from the file."""
+        end = self.data.index(b'\x00', offset)
+        return self.data[offset:end].decode('ascii', errors='replace')
+
+    def find_symbol(self, name):
+        """Find a symbol by name, also accepting the suffixed names LTO gives to local objects."""
+        if name in self.symbols:
+            return self.symbols[name]
+
+        for symbol_name, symbol in self.symbols.items():
+            if symbol_name.startswith(name + '.'):
+                return symbol
+
+        return None
+
+    def section(self, name):
+        """Return the section header with the given name, or None."""
+        for section in self.sections:
+            if section['name'] == name:
+                return section
+        return None
+
+    def section_lma(self, section):
+        """Return the load address of a section, derived from the segment holding it like objcopy does."""
+        for segment in self.segments:
+            if segment['type'] != PT_LOAD:
+                continue
+            if (segment['offset'] <= section['offset'] < segment['offset'] + segment['filesz'] and
+                    segment['vaddr'] <= section['addr'] < segment['vaddr'] + segment['memsz']):
+                return segment['paddr'] + (section['addr'] - segment['vaddr'])
+        return section['addr']
+
+    def section_data(self, section):
+        """Return the bytes stored in the file for a section."""
+        if section['type'] == SHT_NOBITS:
+            return b''
+        return self.data[section['offset']:section['offset'] + section['size']]
+
+    def loadable_sections(self, only=None, exclude=()):
+        """Return the sections that end up in a flash image, ordered by load address.
+
+        Args:
+            only (list): Keep just these section names (objcopy -j)
+            exclude (list): Drop these section names (objcopy -R)
+
+        Returns:
+            list: (name, load address, data) tuples for sections with contents
+        """
+        loadable = []
+        for section in self.sections:
+            if only is not None:
+                # Selected sections are loaded even without the alloc flag
+                if section['name'] not in only:
+                    continue
+            elif not section['flags'] & SHF_ALLOC:
+                continue
+            if section['name'] in exclude or section['type'] == SHT_NOBITS or section['size'] == 0:
+                continue
+            loadable.append((section['name'], self.section_lma(section), self.section_data(section)))
+
+        loadable.sort(key=lambda item: item[1])
+        return loadable
+
+    def load_address(self, vaddr):
+        """Translate a virtual address to its load (flash) address using the program headers."""
+        for segment in self.segments:
+            if segment['type'] != PT_LOAD or segment['filesz'] == 0:
+                continue
+            if segment['vaddr'] <= vaddr < segment['vaddr'] + segment['filesz']:
+                return segment['paddr'] + (vaddr - segment['vaddr'])
+        return None
+
+    def read(self, vaddr, size):
+        """Read size bytes of initialised data stored at the given virtual address."""
+        for segment in self.segments:
+            if segment['type'] != PT_LOAD:
+                continue
+            if segment['vaddr'] <= vaddr and vaddr + size <= segment['vaddr'] + segment['filesz']:
+                start = segment['offset'] + (vaddr - segment['vaddr'])
+                return self.data[start:start + size]
+        return None
+
+def main():
+    """Main function for standalone usage."""
+    if len(sys.argv) < 2:
+        print("Usage: python elf_reader.py <elf_file> [symbol ...]")
+        return
+
+    elf = ElfFile(sys.argv[1])
+
+    for segment in elf.segments:
+        print(f"LOAD vaddr=0x{segment['vaddr']:06x} paddr=0x{segment['paddr']:06x} "
+              f"filesz=0x{segment['filesz']:04x} memsz=0x{segment['memsz']:04x}")
+
+    for name in sys.argv[2:]:
+        symbol = elf.find_symbol(name)
+        if symbol is None:
+            print(f"{name}: not found")
+            continue
+        load = elf.load_address(symbol['value'])
+        load_text = f"0x{load:06x}" if load is not None else "not loaded"
+        print(f"{name}: vaddr=0x{symbol['value']:06x} size={symbol['size']} section={symbol['section']} load={load_text}")
+
+if __name__ == "__main__":
+    main()
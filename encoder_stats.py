@@ -0,0 +1,333 @@
+import sys
+import math
+import time
+
+# Two-sided 95% Student t quantiles by degrees of freedom, largest first; between
+# entries the smaller df is used, which errs on the wide side
+_T_95 = ((120, 1.980), (60, 2.000), (30, 2.042), (20, 2.086), (15, 2.131), (12, 2.179), (10, 2.228),
+         (9, 2.262), (8, 2.306), (7, 2.365), (6, 2.447), (5, 2.571), (4, 2.776), (3, 3.182), (2, 4.303),
+         (1, 12.706))
+
+def t_quantile(df):
+    """Two-sided 95% Student t quantile for df degrees of freedom (df >= 1)."""
+    for table_df, value in _T_95:
+        if df >= table_df:
+            return value
+    return _T_95[-1][1]
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream, updated in O(1) per value.
+
+    The mean and the sum of squared deviations follow Welford's update, which
+    stays accurate where sum-of-squares formulas cancel out on large offsets.
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Fold one value into the statistics."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Fold in the statistics of another stream (Chan's parallel update)."""
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """Sample variance, or 0.0 below two values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        """Sample standard deviation."""
+        return math.sqrt(self.variance)
+
+    @property
+    def stderr(self):
+        """Standard error of the mean, or None below two values."""
+        return math.sqrt(self.variance / self.count) if self.count > 1 else None
+
+    @property
+    def half_width(self):
+        """Half-width of the 95% confidence interval of the mean, or None below two values."""
+        stderr = self.stderr
+        return None if stderr is None else t_quantile(self.count - 1) * stderr
+
+    def snapshot(self):
+        """The current statistics as a plain dict."""
+        return {'count': self.count, 'mean': self.mean, 'stdev': self.stdev, 'min': self.min, 'max': self.max}
+
+class EncoderStats:
+    """Running cosine, sine and magnitude statistics of one encoder."""
+
+    __slots__ = ('cosine', 'sine', 'magnitude', 'first_time', 'last_time')
+
+    def __init__(self):
+        self.cosine = RunningStats()
+        self.sine = RunningStats()
+        self.magnitude = RunningStats()
+        self.first_time = None
+        self.last_time = None
+
+    @property
+    def count(self):
+        return self.cosine.count
+
+    def add(self, cosine, sine, sample_time=None):
+        """Fold one reading into the statistics."""
+        self.cosine.add(cosine)
+        self.sine.add(sine)
+        self.magnitude.add(math.hypot(cosine, sine))
+        if sample_time is not None:
+            if self.first_time is None:
+                self.first_time = sample_time
+            self.last_time = sample_time
+
+    def merge(self, other):
+        """Fold in the statistics of another encoder or session."""
+        self.cosine.merge(other.cosine)
+        self.sine.merge(other.sine)
+        self.magnitude.merge(other.magnitude)
+        if other.first_time is not None:
+            self.first_time = other.first_time if self.first_time is None else min(self.first_time, other.first_time)
+            self.last_time = other.last_time if self.last_time is None else max(self.last_time, other.last_time)
+
+    def rate(self):
+        """Readings per second between the first and last timed reading, or None."""
+        if self.first_time is None or self.last_time <= self.first_time:
+            return None
+        return (self.count - 1) / (self.last_time - self.first_time)
+
+    def snapshot(self):
+        """The current statistics as a plain dict."""
+        return {'count': self.count, 'cosine': self.cosine.snapshot(), 'sine': self.sine.snapshot(),
+                'magnitude': self.magnitude.snapshot(), 'rate': self.rate()}
+
+    def summary(self):
+        """Lines describing the statistics, as read_arduino prints them."""
+        cosine, sine = self.cosine, self.sine
+        return [f"Samples collected: {self.count}",
+                f"Average Cosine: {cosine.mean:.2f} (range: {cosine.min:.2f} to {cosine.max:.2f}, stdev {cosine.stdev:.2f})",
+                f"Average Sine: {sine.mean:.2f} (range: {sine.min:.2f} to {sine.max:.2f}, stdev {sine.stdev:.2f})",
+                f"Average Magnitude: {self.magnitude.mean:.2f}"]
+
+class SessionStats:
+    """Per-address EncoderStats of a capture session, in constant memory per address.
+
+    Samples are folded in as they arrive and nothing is kept, so a session can
+    run indefinitely and snapshot() is instant at any point.
+    """
+
+    __slots__ = ('encoders', 'samples', 'started')
+
+    def __init__(self):
+        self.encoders = {}
+        self.samples = 0
+        self.started = time.perf_counter()
+
+    def add(self, sample):
+        """Fold one Sample into the statistics of its address."""
+        encoder = self.encoders.get(sample.address)
+        if encoder is None:
+            encoder = self.encoders[sample.address] = EncoderStats()
+        encoder.add(sample.cosine, sample.sine, sample.time)
+        self.samples += 1
+
+    def extend(self, samples):
+        """Fold a batch of Samples into the statistics."""
+        for sample in samples:
+            self.add(sample)
+
+    def addresses(self):
+        """Addresses seen so far, sorted."""
+        return sorted(self.encoders)
+
+    def combined(self):
+        """EncoderStats over every address together."""
+        combined = EncoderStats()
+        for encoder in self.encoders.values():
+            combined.merge(encoder)
+        return combined
+
+    def snapshot(self):
+        """{address: EncoderStats.snapshot()} of the session so far."""
+        return {address: self.encoders[address].snapshot() for address in self.addresses()}
+
+class OffsetCalibration:
+    """Sequential estimate of each encoder's cosine and sine offsets.
+
+    An encoder is settled once it has min_samples readings and the 95%
+    confidence intervals of both means are within tolerance, so the rounded
+    offsets are known to about +/- tolerance; max_samples settles it anyway.
+    A steady encoder is done after min_samples readings, a noisy one gets as
+    many as it needs up to max_samples.
+    """
+
+    def __init__(self, tolerance=0.5, min_samples=5, max_samples=100):
+        self.tolerance = tolerance
+        # A confidence interval needs two readings
+        self.min_samples = max(2, min_samples)
+        self.max_samples = max_samples
+        self.stats = SessionStats()
+        self.settled_at = {}
+
+    def add(self, sample):
+        """Fold in one Sample; readings of an encoder that has settled are ignored.
+
+        Returns:
+            bool: True if the sample was used
+        """
+        if sample.address in self.settled_at:
+            return False
+        self.stats.add(sample)
+        encoder = self.stats.encoders[sample.address]
+        if self._settled(encoder):
+            self.settled_at[sample.address] = encoder.count
+        return True
+
+    def _settled(self, encoder):
+        if encoder.count >= self.max_samples:
+            return True
+        if encoder.count < self.min_samples:
+            return False
+        return max(encoder.cosine.half_width, encoder.sine.half_width) <= self.tolerance
+
+    def done(self):
+        """True once at least one encoder has been seen and every one seen has settled."""
+        return bool(self.stats.encoders) and len(self.settled_at) == len(self.stats.encoders)
+
+    def offsets(self, address):
+        """Rounded (cosine, sine) offsets of an encoder."""
+        encoder = self.stats.encoders[address]
+        return round(encoder.cosine.mean), round(encoder.sine.mean)
+
+    def report(self, address):
+        """Line describing an encoder's estimate and how many samples it needed."""
+        encoder = self.stats.encoders[address]
+        cosine, sine = self.offsets(address)
+        half_width = max(encoder.cosine.half_width or 0.0, encoder.sine.half_width or 0.0)
+        if address not in self.settled_at:
+            state = "not settled"
+        elif half_width > self.tolerance:
+            state = "hit the sample limit"
+        else:
+            state = "settled"
+        return (f"Device {address}: cosine {cosine}, sine {sine} after {encoder.count} samples "
+                f"(+/-{half_width:.2f} at 95%, {state})")
+
+def calibrate(capture, calibration=None, timeout=30, on_sample=None):
+    """Pull samples from a SerialCapture until every encoder's offsets have settled.
+
+    Args:
+        capture (SerialCapture): Running capture
+        calibration (OffsetCalibration): Estimator with the bounds to use; a default one if None
+        timeout (float): Give up after this many seconds without a sample
+        on_sample (callable): Called with each Sample that was used
+
+    Returns:
+        OffsetCalibration: The estimator; check done() to see whether it finished
+    """
+    if calibration is None:
+        calibration = OffsetCalibration()
+    while not calibration.done():
+        batch = capture.pull(timeout=timeout)
+        if not batch:
+            break
+        for sample in batch:
+            if calibration.add(sample) and on_sample is not None:
+                on_sample(sample)
+    return calibration
+
+def benchmark(samples=1000000):
+    """Time folding samples into SessionStats and compare with the list-and-passes approach."""
+    from le_protocol import Sample
+
+    stream = [Sample(float(i), 8 + i % 2, (i * 7919) % 2001 - 1000, (i * 104729) % 2001 - 1000)
+              for i in range(samples)]
+
+    start_time = time.perf_counter()
+    stats = SessionStats()
+    stats.extend(stream)
+    snapshot = stats.snapshot()
+    streaming_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    cosine_values = [sample.cosine for sample in stream]
+    sine_values = [sample.sine for sample in stream]
+    averages = (sum(cosine_values) / len(cosine_values), sum(sine_values) / len(sine_values),
+                min(cosine_values), max(cosine_values), min(sine_values), max(sine_values))
+    magnitudes = [(c**2 + s**2)**0.5 for c, s in zip(cosine_values, sine_values)]
+    averages += (sum(magnitudes) / len(magnitudes),)
+    lists_time = time.perf_counter() - start_time
+
+    print(f"{samples} samples from {len(snapshot)} encoders")
+    print(f"Streaming: {samples / streaming_time:10.0f} samples/s, constant memory, snapshot at any time")
+    print(f"Lists:     {samples / lists_time:10.0f} samples/s, {3 * samples} values kept, one summary at the end")
+    combined = stats.combined()
+    if abs(combined.cosine.mean - averages[0]) > 1e-6 or abs(combined.magnitude.mean - averages[6]) > 1e-6:
+        print("Warning: streaming and list statistics disagree")
+
+def benchmark_calibration(noise_levels=(0.5, 2.0, 5.0), tolerance=1.0):
+    """Compare fixed 10-sample calibration with OffsetCalibration on a simulated LE_Reader.
+
+    Each noise level (standard deviation in counts) runs the old fixed count
+    over ASCII, then the sequential estimate over ASCII and over binary frames.
+    """
+    from serial_capture import SerialCapture
+    from le_reader_simulator import SimulatedLeReader
+
+    print(f"{'Noise':>5} {'Method':24} {'Seconds':>8} {'Samples':>8} {'95% +/-':>8}")
+    for noise in noise_levels:
+        runs = (('fixed 10, ascii', 'ascii', OffsetCalibration(tolerance=0, min_samples=10, max_samples=10)),
+                ('sequential, ascii', 'ascii', OffsetCalibration(tolerance, 5, 200)),
+                ('sequential, binary', 'binary', OffsetCalibration(tolerance, 5, 200)))
+        for name, protocol, calibration in runs:
+            target = SimulatedLeReader(addresses=(8,), noise=noise)
+            port = target.start()
+            try:
+                with SerialCapture(port, protocol=protocol) as capture:
+                    start_time = time.perf_counter()
+                    calibrate(capture, calibration, timeout=5)
+                    elapsed = time.perf_counter() - start_time
+            finally:
+                target.stop()
+            encoder = calibration.stats.encoders[8]
+            half_width = max(encoder.cosine.half_width or 0.0, encoder.sine.half_width or 0.0)
+            print(f"{noise:5.1f} {name:24} {elapsed:8.2f} {encoder.count:8} {half_width:8.2f}")
+
+def main():
+    """Main function for standalone usage."""
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark-calibration":
+        benchmark_calibration()
+    else:
+        print("Usage: python encoder_stats.py --benchmark | --benchmark-calibration")
+
+if __name__ == "__main__":
+    main()
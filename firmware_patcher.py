@@ -0,0 +1,329 @@
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import time
+
+from arduino_compiler import ArduinoCompiler
+from arduino_config import CALIBRATION_DEFINES
+from elf_reader import ElfFile
+
+# Firmware globals holding each calibration setting
+CALIBRATION_SYMBOLS = {
+    'address': 'address',
+    'sine': 'sine_off',
+    'cosine': 'cosine_off'
+}
+
+# Matches the default value of any calibration define in the sketch source
+CALIBRATION_PATTERN = re.compile(r'(#define\s+(' + '|'.join(CALIBRATION_DEFINES.values()) + r')\s+)(-?\d+)')
+
+def normalize_calibration_source(content):
+    """Return the sketch source with the calibration defaults blanked out.
+
+    Two sources that only differ in their calibration defaults normalize to the
+    same text, so the result can be used to decide if a template is still valid.
+    """
+    return CALIBRATION_PATTERN.sub(lambda m: m.group(1) + '#', content)
+
+def parse_calibration_defaults(content):
+    """Return the default calibration values defined in the sketch source."""
+    settings = {define: setting for setting, define in CALIBRATION_DEFINES.items()}
+    values = {}
+    for match in CALIBRATION_PATTERN.finditer(content):
+        values[settings[match.group(2)]] = int(match.group(3))
+    return values
+
+def patch_hex_lines(lines, patches):
+    """Patch bytes in Intel HEX records without changing the record layout.
+
+    Args:
+        lines (list): Lines of the hex file, including their line endings
+        patches (dict): Absolute flash address -> new byte value
+
+    Returns:
+        tuple: (patched lines, set of addresses that were patched)
+    """
+    patched_lines = []
+    applied = set()
+    base = 0
+
+    for line in lines:
+        record = line.strip()
+        if not record.startswith(':'):
+            patched_lines.append(line)
+            continue
+
+        raw = bytearray.fromhex(record[1:])
+        count = raw[0]
+        offset = (raw[1] << 8) | raw[2]
+        record_type = raw[3]
+
+        if record_type == 0x02:
+            base = ((raw[4] << 8) | raw[5]) << 4
+        elif record_type == 0x04:
+            base = ((raw[4] << 8) | raw[5]) << 16
+
+        if record_type != 0x00:
+            patched_lines.append(line)
+            continue
+
+        changed = False
+        for i in range(count):
+            address = base + offset + i
+            if address in patches:
+                raw[4 + i] = patches[address]
+                applied.add(address)
+                changed = True
+
+        if not changed:
+            patched_lines.append(line)
+            continue
+
+        raw[4 + count] = (-sum(raw[:4 + count])) & 0xFF
+        ending = line[len(line.rstrip('\r\n')):]
+        patched_lines.append(':' + raw.hex().upper() + ending)
+
+    return patched_lines, applied
+
+class FirmwarePatcher:
+    """Build per-device LE_Final hex files by patching a prebuilt template image.
+
+    The template is compiled once. Its ELF symbol table gives the flash location
+    of every calibration global, so a device image only needs those bytes replaced.
+    """
+
+    def __init__(self, le_final_dir=None, template_dir=None):
+        """Initialize the patcher with the LE_Final directory and template location."""
+        if le_final_dir is None:
+            le_final_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LE_Final")
+
+        if template_dir is None:
+            template_dir = os.path.join(le_final_dir, "template")
+
+        self.le_final_dir = le_final_dir
+        self.ino_file = os.path.join(le_final_dir, "LE_Final.ino")
+        self.template_dir = template_dir
+        self.manifest_file = os.path.join(template_dir, "template.json")
+
+    def _source_hash(self):
+        """Hash of the sketch source, ignoring the calibration values."""
+        with open(self.ino_file, 'r') as f:
+            content = f.read()
+        return hashlib.sha256(normalize_calibration_source(content).encode('utf-8')).hexdigest()
+
+    def load_manifest(self):
+        """Load the template manifest if it exists and matches the current sketch."""
+        if not os.path.exists(self.manifest_file):
+            return None
+
+        try:
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if manifest.get("source_hash") != self._source_hash():
+            return None
+
+        if not os.path.exists(os.path.join(self.template_dir, manifest.get("hex_file", ""))):
+            return None
+
+        return manifest
+
+    def build_template(self, force=False):
+        """Compile LE_Final once and record where the calibration globals live in flash."""
+        if not force:
+            manifest = self.load_manifest()
+            if manifest:
+                return manifest
+
+        print("Building LE_Final template image...")
+
+        with open(self.ino_file, 'r') as f:
+            content = f.read()
+
+        values = parse_calibration_defaults(content)
+
+        missing = [CALIBRATION_DEFINES[setting] for setting in CALIBRATION_SYMBOLS if setting not in values]
+        if missing:
+            print(f"Error: Could not find {', '.join(missing)} in {self.ino_file}.")
+            return None
+
+        if os.path.exists(self.template_dir):
+            shutil.rmtree(self.template_dir)
+        os.makedirs(self.template_dir)
+
+        compiler = ArduinoCompiler()
+        if not compiler.compile_attiny1616(self.ino_file, self.template_dir):
+            print("Error: Template compilation failed.")
+            return None
+
+        elf_file = os.path.join(self.template_dir, "LE_Final.elf")
+        hex_file = os.path.join(self.template_dir, "LE_Final.hex")
+        if not os.path.exists(elf_file) or not os.path.exists(hex_file):
+            print("Error: Template ELF or hex file missing after compilation.")
+            return None
+
+        try:
+            elf = ElfFile(elf_file)
+        except (OSError, ValueError) as e:
+            print(f"Error: Could not read template ELF: {str(e)}")
+            return None
+
+        symbols = {}
+
+        for setting, name in CALIBRATION_SYMBOLS.items():
+            symbol = elf.find_symbol(name)
+            if symbol is None or symbol['size'] == 0:
+                print(f"Error: Symbol '{name}' not found in the template ELF.")
+                print("The value was probably folded into the code by the optimizer.")
+                print("Declare it as 'const volatile int' in LE_Final.ino so it stays in flash.")
+                return None
+
+            load_address = elf.load_address(symbol['value'])
+            stored = elf.read(symbol['value'], symbol['size'])
+            if load_address is None or stored is None:
+                print(f"Error: Symbol '{name}' has no initialised data in flash.")
+                return None
+
+            # Make sure the bytes we found really hold the value from the source
+            if int.from_bytes(stored, 'little', signed=True) != values[setting]:
+                print(f"Error: Template value of '{name}' does not match the sketch source.")
+                return None
+
+            symbols[setting] = {
+                "symbol": name,
+                "offset": load_address,
+                "size": symbol['size'],
+                "section": symbol['section']
+            }
+
+        manifest = {
+            "source_hash": self._source_hash(),
+            "created": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "hex_file": "LE_Final.hex",
+            "elf_file": "LE_Final.elf",
+            "values": values,
+            "symbols": symbols
+        }
+
+        with open(self.manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+        for setting, symbol in symbols.items():
+            print(f"  {symbol['symbol']}: flash 0x{symbol['offset']:04x} ({symbol['size']} bytes, {symbol['section']})")
+        print(f"Template saved to: {self.template_dir}")
+
+        return manifest
+
+    def patch(self, address, sine, cosine, output_hex):
+        """Write a hex file for one device by patching the template image.
+
+        Returns:
+            str: Path to the patched hex file, or None on failure
+        """
+        manifest = self.build_template()
+        if not manifest:
+            return None
+
+        start_time = time.perf_counter()
+
+        values = {'address': address, 'sine': sine, 'cosine': cosine}
+        patches = {}
+
+        for setting, symbol in manifest["symbols"].items():
+            try:
+                data = int(values[setting]).to_bytes(symbol["size"], 'little', signed=True)
+            except OverflowError:
+                print(f"Error: Value {values[setting]} for '{symbol['symbol']}' does not fit in {symbol['size']} bytes.")
+                return None
+
+            for i, byte in enumerate(data):
+                patches[symbol["offset"] + i] = byte
+
+        template_hex = os.path.join(self.template_dir, manifest["hex_file"])
+        with open(template_hex, 'r', newline='') as f:
+            lines = f.readlines()
+
+        patched_lines, applied = patch_hex_lines(lines, patches)
+        if applied != set(patches):
+            print("Error: Template hex file does not contain all calibration bytes.")
+            return None
+
+        output_dir = os.path.dirname(os.path.abspath(output_hex))
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        with open(output_hex, 'w', newline='') as f:
+            f.writelines(patched_lines)
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"Patched firmware written to {output_hex} in {elapsed_ms:.2f} ms")
+        return output_hex
+
+    def verify(self, address, sine, cosine):
+        """Check that a patched image is byte-identical to a full compile with the same values."""
+        work_dir = tempfile.mkdtemp(prefix='le_patch_verify_')
+
+        try:
+            patched_hex = self.patch(address, sine, cosine, os.path.join(work_dir, "patched", "LE_Final.hex"))
+            if not patched_hex:
+                return False
+
+            # Full compile with the values passed as defines
+            values = {'address': address, 'sine': sine, 'cosine': cosine}
+            defines = {CALIBRATION_DEFINES[setting]: value for setting, value in values.items()}
+
+            full_dir = os.path.join(work_dir, "full")
+            compiler = ArduinoCompiler()
+            if not compiler.compile_attiny1616(self.ino_file, full_dir, defines=defines,
+                                               build_dir=os.path.join(work_dir, "build")):
+                print("Error: Reference compilation failed.")
+                return False
+
+            with open(patched_hex, 'rb') as f:
+                patched_data = f.read()
+            with open(os.path.join(full_dir, "LE_Final.hex"), 'rb') as f:
+                full_data = f.read()
+
+            if patched_data == full_data:
+                print(f"Verified: patched image matches a full compile (address={address}, sine={sine}, cosine={cosine}).")
+                return True
+
+            print("Mismatch: patched image differs from a full compile.")
+            return False
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    """Main function for standalone usage."""
+    usage = ("Usage:\n"
+             "  python firmware_patcher.py template\n"
+             "  python firmware_patcher.py patch <address> <sine> <cosine> [output_hex]\n"
+             "  python firmware_patcher.py verify <address> <sine> <cosine>")
+
+    if len(sys.argv) < 2:
+        print(usage)
+        return
+
+    patcher = FirmwarePatcher()
+    command = sys.argv[1]
+
+    if command == "template":
+        patcher.build_template(force=True)
+    elif command in ("patch", "verify") and len(sys.argv) >= 5:
+        address, sine, cosine = (int(value) for value in sys.argv[2:5])
+        if command == "patch":
+            output_hex = sys.argv[5] if len(sys.argv) > 5 else os.path.join(patcher.le_final_dir, "build", "LE_Final.hex")
+            patcher.patch(address, sine, cosine, output_hex)
+        else:
+            sys.exit(0 if patcher.verify(address, sine, cosine) else 1)
+    else:
+        print(usage)
+
+if __name__ == "__main__":
+    main()
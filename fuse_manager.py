@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import threading
+
+# Canonical fuse profile for the ATtiny1616 with 20MHz clock; every upload path uses this one
+FUSE_PROFILE = {
+    "fuse0": "0b00000000",  # APPEND disabled, BOOTEND = 0
+    "fuse2": "0x02",        # OSCLOCK disabled, EESAVE disabled, BODCFG = 2
+    "fuse5": "0b11000101",  # 20MHz oscillator, RUNSTDBY disabled, STARTUP = 1 (16ms)
+    "fuse6": "0x04",        # SYSCFG0 = 0x04 (default)
+    "fuse7": "0x00",        # SYSCFG1 = 0x00 (default)
+    "fuse8": "0x00"         # BOOTSIZE = 0 (default)
+}
+
+def fuse_values(fuse_settings):
+    """Convert a {"fuse0": "0b00000000", ...} profile to {0: 0x00, ...}."""
+    return {int(name[4:]): int(value, 0) for name, value in fuse_settings.items()}
+
+def format_fuse_settings(values):
+    """Convert {0: 0x00, ...} back to the {"fuse0": "0x00", ...} form avrdude takes."""
+    return {f"fuse{number}": f"0x{value:02x}" for number, value in sorted(values.items())}
+
+def read_hex_file(path):
+    """Read a file written by avrdude in 'h' format ("0x1e,0x94,0x21") into bytes."""
+    with open(path, 'r') as f:
+        text = f.read().replace('\n', ',')
+    return bytes(int(value, 0) for value in text.split(',') if value.strip())
+
+class FuseManager:
+    """Remembers the fuse bytes of every device programmed in this session.
+
+    Devices are identified by signature and serial number. The state of a
+    device is what was read back from it, updated with whatever was written
+    since, so a second upload to the same device writes no fuses at all.
+    Each port also remembers the device last seen on it, so that a failed
+    upload can drop what is known about it. Fixtures swap devices between
+    uploads, so the port never stands in for a device that was not read.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._port_devices = {}
+        self._lock = threading.Lock()
+
+    def state(self, identity):
+        """Last known {fuse number: value} of a device, or None."""
+        with self._lock:
+            state = self._states.get(identity)
+            return dict(state) if state is not None else None
+
+    def record(self, identity, values, port=None):
+        """Store fuse values known to be on a device."""
+        with self._lock:
+            state = self._states.setdefault(identity, {})
+            state.update(values)
+            if port is not None:
+                self._port_devices[port] = identity
+
+    def forget(self, port=None, identity=None):
+        """Drop what is known about a port or device, e.g. after a failed upload."""
+        with self._lock:
+            if port is not None:
+                identity = self._port_devices.pop(port, identity)
+            if identity is not None:
+                self._states.pop(identity, None)
+
+    def changes(self, current, profile=None):
+        """Fuses of the profile whose value differs from current (all of them if current is None).
+
+        Args:
+            current (dict): {fuse number: value} read from or known for the device
+            profile (dict): Fuse profile in {"fuse0": "0b..."} form, FUSE_PROFILE by default
+
+        Returns:
+            dict: {fuse number: value} to write
+        """
+        wanted = fuse_values(profile or FUSE_PROFILE)
+        if current is None:
+            return wanted
+        return {number: value for number, value in wanted.items() if current.get(number) != value}
+
+_fuse_manager = None
+
+def get_fuse_manager():
+    """Return the process-wide fuse manager."""
+    global _fuse_manager
+    if _fuse_manager is None:
+        _fuse_manager = FuseManager()
+    return _fuse_manager
+
+class AvrdudeReadback:
+    """avrdude -U operations that read the device identity and fuses back after an upload.
+
+    The reads go at the end of the upload command, so avrdude is started once
+    per upload as before. Reading the serial number needs the prodsig memory
+    in avrdude.conf; without it the signature alone identifies the device.
+    """
+
+    def __init__(self, fuse_numbers, with_serial=True):
+        self.fuse_numbers = sorted(fuse_numbers)
+        self.with_serial = with_serial
+        self.directory = tempfile.mkdtemp(prefix='fuses_')
+
+    def _path(self, memory):
+        return os.path.join(self.directory, f"{memory}.txt")
+
+    def operations(self):
+        """-U arguments to append to the avrdude command."""
+        memories = ['signature'] + (['prodsig'] if self.with_serial else [])
+        memories += [f"fuse{number}" for number in self.fuse_numbers]
+        return [f"-U{memory}:r:{self._path(memory)}:h" for memory in memories]
+
+    def result(self):
+        """Parse the files avrdude wrote.
+
+        Returns:
+            tuple: (identity, {fuse number: value}), or (None, None) if a read is missing
+        """
+        try:
+            identity = read_hex_file(self._path('signature'))
+            if self.with_serial:
+                # The serial number is the first 10 bytes of the production signature row
+                identity += read_hex_file(self._path('prodsig'))[:10]
+            values = {}
+            for number in self.fuse_numbers:
+                values[number] = read_hex_file(self._path(f"fuse{number}"))[0]
+        except (OSError, ValueError, IndexError):
+            return None, None
+        return identity.hex(), values
+
+    def cleanup(self):
+        """Remove the temporary files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def main():
+    """Print the canonical fuse profile."""
+    for name, value in FUSE_PROFILE.items():
+        print(f"{name}: {value} (0x{int(value, 0):02x})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import os
+import sys
+import time
+import hashlib
+import tempfile
+
+# Record types
+DATA = 0x00
+END_OF_FILE = 0x01
+EXTENDED_SEGMENT_ADDRESS = 0x02
+START_SEGMENT_ADDRESS = 0x03
+EXTENDED_LINEAR_ADDRESS = 0x04
+START_LINEAR_ADDRESS = 0x05
+
+# Largest image held in memory; AVR hex files put EEPROM and fuses at 0x810000 and up
+MAX_IMAGE_SIZE = 0x1000000
+
+class IntelHexError(ValueError):
+    """Raised for malformed Intel HEX input."""
+
+def _record(address, record_type, data):
+    """One Intel HEX record line, without the line ending."""
+    raw = bytearray((len(data), (address >> 8) & 0xFF, address & 0xFF, record_type))
+    raw += data
+    raw.append(-sum(raw) & 0xFF)
+    return ':' + raw.hex().upper()
+
+class HexImage:
+    """A flash image held as one bytearray, with the address ranges the hex file defined.
+
+    Bytes between and around the defined ranges hold the fill value, as erased
+    flash reads. Pages and ranges are handed out as memoryviews into the one
+    buffer, so slicing an image into pages copies nothing. Reads never grow
+    the buffer, so views stay valid: a range reaching past its end is served
+    as a padded copy instead. Only write_bytes() past the end grows it, which
+    raises BufferError while views are held.
+    """
+
+    def __init__(self, fill=0xFF):
+        self.fill = fill
+        self.data = bytearray()
+        # Sorted, non-overlapping [start, end) ranges defined by data records
+        self.segments = []
+        self.start_address = None
+
+    @classmethod
+    def parse(cls, text, source='<hex>', fill=0xFF):
+        """Parse Intel HEX text, validating the length and checksum of every record."""
+        image = cls(fill)
+        data = image.data
+        ranges = []
+        base = 0
+
+        for line_number, line in enumerate(text.splitlines(), 1):
+            if not line:
+                continue
+            if line[0] != ':':
+                line = line.strip()
+                if not line:
+                    continue
+                if line[0] != ':':
+                    raise IntelHexError(f"{source}:{line_number}: not an Intel HEX record")
+
+            try:
+                raw = bytes.fromhex(line[1:])
+            except ValueError:
+                raise IntelHexError(f"{source}:{line_number}: invalid hex digits")
+            if len(raw) < 5 or len(raw) != raw[0] + 5:
+                raise IntelHexError(f"{source}:{line_number}: record length does not match its byte count")
+            if sum(raw) & 0xFF:
+                raise IntelHexError(f"{source}:{line_number}: checksum mismatch")
+
+            record_type = raw[3]
+            if record_type == DATA:
+                start = base + ((raw[1] << 8) | raw[2])
+                end = start + raw[0]
+                if end > len(data):
+                    if end > MAX_IMAGE_SIZE:
+                        raise IntelHexError(f"{source}:{line_number}: address 0x{start:x} is out of range")
+                    data.extend(bytes([fill]) * (end - len(data)))
+                data[start:end] = raw[4:-1]
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1][1] = end
+                else:
+                    ranges.append([start, end])
+            elif record_type == END_OF_FILE:
+                break
+            elif record_type == EXTENDED_SEGMENT_ADDRESS:
+                base = int.from_bytes(raw[4:6], 'big') << 4
+            elif record_type == EXTENDED_LINEAR_ADDRESS:
+                base = int.from_bytes(raw[4:6], 'big') << 16
+            elif record_type == START_SEGMENT_ADDRESS:
+                image.start_address = (int.from_bytes(raw[4:6], 'big') << 4) + int.from_bytes(raw[6:8], 'big')
+            elif record_type == START_LINEAR_ADDRESS:
+                image.start_address = int.from_bytes(raw[4:8], 'big')
+            else:
+                raise IntelHexError(f"{source}:{line_number}: unknown record type {record_type:02x}")
+
+        image.segments = image._merge(ranges)
+        return image
+
+    @classmethod
+    def load(cls, path, fill=0xFF):
+        """Read and parse an Intel HEX file."""
+        with open(path, 'r') as f:
+            return cls.parse(f.read(), path, fill)
+
+    @classmethod
+    def from_bytes(cls, data, address=0, fill=0xFF):
+        """Image holding data at address."""
+        image = cls(fill)
+        image.write_bytes(address, data)
+        return image
+
+    @staticmethod
+    def _merge(ranges):
+        """Sort ranges and join the ones that touch or overlap."""
+        if all(ranges[i][1] <= ranges[i + 1][0] for i in range(len(ranges) - 1)):
+            merged = []
+            for start, end in ranges:
+                if merged and merged[-1][1] == start:
+                    merged[-1][1] = end
+                else:
+                    merged.append([start, end])
+            return merged
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def _ensure(self, end):
+        """Grow the buffer with fill bytes so it reaches end."""
+        if end > len(self.data):
+            self.data.extend(bytes([self.fill]) * (end - len(self.data)))
+
+    def write_bytes(self, address, data):
+        """Store data at address and mark the range as defined."""
+        end = address + len(data)
+        self._ensure(end)
+        self.data[address:end] = data
+        self.segments = self._merge(self.segments + [[address, end]])
+
+    @property
+    def start(self):
+        """First defined address (0 for an empty image)."""
+        return self.segments[0][0] if self.segments else 0
+
+    @property
+    def end(self):
+        """One past the last defined address (0 for an empty image)."""
+        return self.segments[-1][1] if self.segments else 0
+
+    def __len__(self):
+        """Number of bytes the hex file defined."""
+        return sum(end - start for start, end in self.segments)
+
+    def _range(self, start, end):
+        """memoryview of start..end, copied and padded with fill where it passes the end of the buffer."""
+        size = len(self.data)
+        if end <= size:
+            return memoryview(self.data)[start:end]
+        padded = bytearray([self.fill]) * (end - start)
+        if start < size:
+            padded[:size - start] = self.data[start:size]
+        return memoryview(padded)
+
+    def view(self, start=None, end=None):
+        """memoryview of the image from start to end, by default the occupied range."""
+        start = self.start if start is None else start
+        end = self.end if end is None else end
+        return self._range(start, end)
+
+    def page_addresses(self, page_size):
+        """Addresses of the pages that hold defined bytes, in order."""
+        addresses = []
+        for start, end in self.segments:
+            address = start - start % page_size
+            if addresses and addresses[-1] >= address:
+                address = addresses[-1] + page_size
+            while address < end:
+                addresses.append(address)
+                address += page_size
+        return addresses
+
+    def page(self, address, page_size):
+        """memoryview of one page, padded with fill past the defined bytes."""
+        return self.view(address, address + page_size)
+
+    def pages(self, page_size):
+        """{page address: memoryview} for every page that holds defined bytes."""
+        return {address: self._range(address, address + page_size) for address in self.page_addresses(page_size)}
+
+    def diff(self, other, page_size):
+        """Addresses of pages whose contents differ between this image and other.
+
+        Pages only one image defines compare against erased (fill) bytes.
+        """
+        addresses = sorted(set(self.page_addresses(page_size)) | set(other.page_addresses(page_size)))
+        return [address for address in addresses
+                if self._range(address, address + page_size) != other._range(address, address + page_size)]
+
+    def digest(self, start=None, end=None):
+        """SHA-256 of a range, by default the occupied range."""
+        return hashlib.sha256(self.view(start, end)).hexdigest()
+
+    def to_ihex(self, record_size=16):
+        """Format the defined ranges as Intel HEX text."""
+        lines = []
+        upper = 0
+        data = self.data
+
+        for start, end in self.segments:
+            address = start
+            while address < end:
+                if address >> 16 != upper:
+                    upper = address >> 16
+                    lines.append(_record(0, EXTENDED_LINEAR_ADDRESS, upper.to_bytes(2, 'big')))
+                # Records never cross a 64K boundary
+                chunk_end = min(end, address + record_size, (upper + 1) << 16)
+                lines.append(_record(address & 0xFFFF, DATA, data[address:chunk_end]))
+                address = chunk_end
+
+        if self.start_address is not None:
+            lines.append(_record(0, START_LINEAR_ADDRESS, self.start_address.to_bytes(4, 'big')))
+        lines.append(':00000001FF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the image as an Intel HEX file, replacing path atomically."""
+        output_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.to_ihex())
+        os.replace(tmp_path, path)
+
+def benchmark(hex_file, runs=200):
+    """Time parsing and emitting hex_file; reports the median of runs."""
+    with open(hex_file, 'r') as f:
+        text = f.read()
+
+    timings = {}
+    for label, action in (('parse', lambda: HexImage.parse(text)),
+                          ('emit', lambda image=HexImage.parse(text): image.to_ihex()),
+                          ('pages', lambda image=HexImage.parse(text): image.pages(64))):
+        samples = []
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            action()
+            samples.append(time.perf_counter() - start_time)
+        samples.sort()
+        timings[label] = samples[len(samples) // 2]
+
+    image = HexImage.parse(text)
+    print(f"{hex_file}: {len(image)} bytes in {len(image.segments)} segment(s), {len(text.splitlines())} records")
+    for label, seconds in timings.items():
+        print(f"  {label:6} {seconds * 1000:.3f} ms (median of {runs})")
+    return timings
+
+def main():
+    """Main function for standalone usage."""
+    usage = ("Usage:\n"
+             "  python intel_hex.py info <hex_file>\n"
+             "  python intel_hex.py diff <hex_file> <other_hex_file> [page_size]\n"
+             "  python intel_hex.py --benchmark <hex_file> [runs]")
+
+    if len(sys.argv) < 3:
+        print(usage)
+        return
+
+    try:
+        if sys.argv[1] == "info":
+            image = HexImage.load(sys.argv[2])
+            print(f"{len(image)} bytes, digest {image.digest()}")
+            for start, end in image.segments:
+                print(f"  0x{start:06x}-0x{end - 1:06x} ({end - start} bytes)")
+        elif sys.argv[1] == "diff" and len(sys.argv) > 3:
+            page_size = int(sys.argv[4]) if len(sys.argv) > 4 else 64
+            image, other = HexImage.load(sys.argv[2]), HexImage.load(sys.argv[3])
+            changed = image.diff(other, page_size)
+            total = len(set(image.page_addresses(page_size)) | set(other.page_addresses(page_size)))
+            print(f"{len(changed)} of {total} pages differ")
+            for address in changed:
+                print(f"  0x{address:06x}")
+        elif sys.argv[1] == "--benchmark":
+            runs = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+            benchmark(sys.argv[2], runs)
+        else:
+            print(usage)
+    except (OSError, IntelHexError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import io
+import re
+import sys
+import json
+import time
+import struct
+import itertools
+import binascii
+import collections
+
+# One reading of one encoder; time is time.perf_counter() when its bytes were read.
+# The ASCII stream carries no distance or sequence number, so those are None there.
+Sample = collections.namedtuple('Sample', 'time address cosine sine distance seq', defaults=(None, None))
+
+# Binary mode: LE_Reader switches when it receives CMD_BINARY at 115200 baud,
+# answers with one ASCII line ("LE_Reader binary 500000") and continues at
+# BINARY_BAUD_RATE; CMD_ASCII switches it back to 115200 and lines.
+CMD_BINARY = b'B'
+CMD_ASCII = b'A'
+BINARY_BAUD_RATE = 500000
+BINARY_ACK = b'LE_Reader binary'
+
+# Frame: sync, address, sequence number, distance, cosine, sine, CRC-16/XMODEM
+# of the nine bytes from address to sine; little endian, as the AVR stores them
+FRAME_SYNC = 0xA5
+FRAME = struct.Struct('<BBHhhhH')
+FRAME_SIZE = FRAME.size
+
+def encode_frame(address, seq, distance, cosine, sine):
+    """One binary frame, as LE_Reader sends it."""
+    body = struct.pack('<BHhhh', address, seq & 0xFFFF, distance, cosine, sine)
+    return bytes([FRAME_SYNC]) + body + struct.pack('<H', binascii.crc_hqx(body, 0))
+
+# A complete sample line, matched on raw bytes; \r is left over from println
+SAMPLE_LINES = re.compile(rb'^(\d{1,3}),(-?\d{1,6}),(-?\d{1,6})\r?$', re.MULTILINE)
+BLANK_LINES = re.compile(rb'^\r?$', re.MULTILINE)
+
+# Largest address and absolute value SAMPLE_LINES accepts (3 and 6 digits)
+MAX_ADDRESS = 999
+MAX_VALUE = 999999
+
+# What a sample line is left with once its digits and signs are deleted
+NUMBER_BYTES = b'0123456789-'
+LINE_SHAPE = b',,\r\n'
+
+# Longest partial line kept between chunks; anything longer is noise, not a line
+MAX_PENDING = 256
+
+class AsciiDecoder:
+    """Parses LE_Reader's address,cosine,sine lines from arbitrary chunks of bytes.
+
+    The complete lines of a chunk are parsed together, never one by one:
+    when deleting the digits and signs leaves exactly one ",,\r\n" per line,
+    the whole chunk is read as one JSON array of ints, kept if every field is
+    within the widths SAMPLE_LINES allows. Any other chunk goes through one
+    regex pass that picks out the well-formed lines, and int() converts the
+    captured bytes directly. Nothing is decoded to str, and a
+    malformed line costs no exception; malformed lines are counted from the
+    line, blank and banner counts instead of being visited.
+    """
+
+    def __init__(self):
+        self.pending = b''
+        self.bad = 0
+
+    def columns(self, data):
+        """Parse the complete lines in data; an incomplete last line is kept for the next call.
+
+        Returns:
+            tuple: (addresses, cosines, sines), three lists of ints in stream order
+        """
+        end = data.rfind(b'\n')
+        if end < 0:
+            self.pending += data
+            if len(self.pending) > MAX_PENDING:
+                self.pending = b''
+                self.bad += 1
+            return [], [], []
+        body = self.pending + data[:end]
+        self.pending = data[end + 1:]
+        lines = body.count(b'\n') + 1
+
+        if body.translate(None, NUMBER_BYTES) + b'\n' == LINE_SHAPE * lines:
+            try:
+                values = json.loads(b'[' + body[:-1].replace(b'\r\n', b',') + b']')
+            except ValueError:
+                # Right shape, but a stray sign or leading zero somewhere
+                values = None
+            if values is not None:
+                addresses, cosines, sines = values[0::3], values[1::3], values[2::3]
+                # Same field widths as SAMPLE_LINES, so a line is accepted whatever else is in the chunk
+                if (body[:1] != b'-' and b'\n-' not in body and max(addresses) <= MAX_ADDRESS
+                        and max(map(abs, cosines)) <= MAX_VALUE and max(map(abs, sines)) <= MAX_VALUE):
+                    return addresses, cosines, sines
+
+        fields = SAMPLE_LINES.findall(body)
+        others = lines - len(fields)
+        if others:
+            others -= len(BLANK_LINES.findall(body)) + body.count(b'LE_Reader')
+            self.bad += max(0, others)
+        if not fields:
+            return [], [], []
+        addresses, cosines, sines = zip(*fields)
+        return list(map(int, addresses)), list(map(int, cosines)), list(map(int, sines))
+
+    def decode(self, data, now):
+        """Samples of the complete lines in data; an incomplete last line is kept for the next call."""
+        addresses, cosines, sines = self.columns(data)
+        return list(map(Sample, itertools.repeat(now, len(addresses)), addresses, cosines, sines))
+
+    def stats(self):
+        return {'bad_lines': self.bad}
+
+class FrameDecoder:
+    """Decodes binary frames from arbitrary chunks of bytes.
+
+    A run of back-to-back frames is unpacked in one struct.iter_unpack pass and
+    checked with one C-level CRC call per frame. When a frame in the run has no
+    sync byte or a wrong CRC, the frames before it are kept and decoding
+    resynchronises at the next sync byte after its start.
+
+    Counters:
+        bad: Frames rejected for a missing sync byte or CRC mismatch
+        lost: Frames missing according to the sequence numbers
+    """
+
+    def __init__(self):
+        self.pending = b''
+        self.bad = 0
+        self.lost = 0
+        self._last_seq = None
+
+    def decode(self, data, now):
+        """Samples of the complete frames in data; a partial frame is kept for the next call."""
+        buffer = self.pending + data
+        size = len(buffer)
+        sync = bytes([FRAME_SYNC])
+        crc = binascii.crc_hqx
+        samples = []
+        position = 0
+
+        while True:
+            start = buffer.find(sync, position)
+            if start < 0:
+                position = size
+                break
+            count = (size - start) // FRAME_SIZE
+            if count == 0:
+                position = start
+                break
+
+            block = buffer[start:start + count * FRAME_SIZE]
+            frames = list(FRAME.iter_unpack(block))
+            checks = [crc(block[offset + 1:offset + 10], 0) for offset in range(0, len(block), FRAME_SIZE)]
+            valid = [frame[0] == FRAME_SYNC and frame[6] == check for frame, check in zip(frames, checks)]
+            good = valid.index(False) if not all(valid) else count
+
+            if good:
+                frames = frames[:good]
+                samples.extend([Sample(now, frame[1], frame[4], frame[5], frame[3], frame[2]) for frame in frames])
+                if self._last_seq is not None:
+                    self.lost += ((frames[-1][2] - self._last_seq) & 0xFFFF) - good
+                self._last_seq = frames[-1][2]
+            if good == count:
+                position = start + count * FRAME_SIZE
+                continue
+
+            # Skip the bad frame's sync byte and look for the next frame start
+            self.bad += 1
+            position = start + good * FRAME_SIZE + 1
+
+        self.pending = buffer[position:]
+        return samples
+
+    def stats(self):
+        return {'bad_frames': self.bad, 'lost_frames': self.lost}
+
+def _parse_lines_per_line(stream):
+    """The per-line parse the readers used before AsciiDecoder, for comparison."""
+    addresses, cosines, sines = [], [], []
+    for line in io.BytesIO(stream):
+        line = line.decode('utf-8', errors='replace').strip()
+        if ',' in line and line.count(',') == 2:
+            try:
+                address_str, cosine_str, sine_str = line.split(',')
+                address, cosine, sine = int(address_str), float(cosine_str), float(sine_str)
+            except ValueError:
+                continue
+            addresses.append(address)
+            cosines.append(cosine)
+            sines.append(sine)
+    return addresses, cosines, sines
+
+def benchmark_lines(capture_file=None, lines=1000000, chunk_size=4096):
+    """Lines per second of the per-line parse against AsciiDecoder.
+
+    Args:
+        capture_file (str): Raw bytes recorded from LE_Reader's port; without
+            one, a capture of the given number of lines from two encoders with
+            a malformed line every thousand is generated
+        lines (int): Lines to generate when no capture file is given
+        chunk_size (int): Chunk size fed to AsciiDecoder, like the capture thread's reads
+    """
+    if capture_file:
+        with open(capture_file, 'rb') as f:
+            stream = f.read()
+    else:
+        stream = b''.join(b'8,12,x\r\n' if i % 2000 == 999 else
+                          b'\xfe9,1\r\n' if i % 2000 == 1999 else
+                          f"{8 + i % 2},{i % 2000 - 1000},{1000 - i % 2000}\r\n".encode()
+                          for i in range(lines))
+    total = stream.count(b'\n')
+    print(f"Parsing {total} lines ({len(stream) / 1e6:.1f} MB)")
+
+    start_time = time.perf_counter()
+    before = _parse_lines_per_line(stream)
+    before_time = time.perf_counter() - start_time
+
+    decoder = AsciiDecoder()
+    after = ([], [], [])
+    start_time = time.perf_counter()
+    for offset in range(0, len(stream), chunk_size):
+        for column, values in zip(after, decoder.columns(stream[offset:offset + chunk_size])):
+            column.extend(values)
+    after_time = time.perf_counter() - start_time
+
+    if list(map(int, before[1])) != after[1] or before[0] != after[0]:
+        print("Warning: the two parsers disagree on this capture")
+    print(f"Per-line parse: {total / before_time:12.0f} lines/s, {len(before[0])} samples")
+    print(f"AsciiDecoder:   {total / after_time:12.0f} lines/s, {len(after[0])} samples, "
+          f"{decoder.bad} malformed lines")
+    print(f"Speedup: {before_time / after_time:.1f}x")
+    return total / before_time, total / after_time
+
+def benchmark(samples=20000, seconds=3.0):
+    """Compare the ASCII and binary modes.
+
+    Host decoding is timed on synthetic streams of the given number of
+    samples, fed in 4 KiB chunks the way the capture thread reads them. The
+    end-to-end rate is what SerialCapture receives from the simulated
+    LE_Reader with two encoders in each mode.
+    """
+    from serial_capture import SerialCapture
+    from le_reader_simulator import SimulatedLeReader
+
+    ascii_stream = b''.join(f"{8 + i % 2},{i % 2000 - 1000},{1000 - i % 2000}\r\n".encode() for i in range(samples))
+    binary_stream = b''.join(encode_frame(8 + i % 2, i, 512, i % 2000 - 1000, 1000 - i % 2000) for i in range(samples))
+
+    print(f"{'Mode':8} {'Decode samples/s':>17} {'Stream samples/s':>17} {'Bytes/sample':>13}")
+    results = {}
+    for mode, decoder_class, stream in (('ascii', AsciiDecoder, ascii_stream), ('binary', FrameDecoder, binary_stream)):
+        decoder = decoder_class()
+        start_time = time.perf_counter()
+        decoded = 0
+        for offset in range(0, len(stream), 4096):
+            decoded += len(decoder.decode(stream[offset:offset + 4096], 0.0))
+        decode_rate = decoded / (time.perf_counter() - start_time)
+
+        target = SimulatedLeReader(addresses=(8, 9))
+        port = target.start()
+        try:
+            with SerialCapture(port, protocol=mode) as capture:
+                capture.pull(timeout=1)
+                start_time = time.perf_counter()
+                received = 0
+                while time.perf_counter() - start_time < seconds:
+                    received += len(capture.pull(timeout=0.2))
+                stream_rate = received / (time.perf_counter() - start_time)
+        finally:
+            target.stop()
+
+        results[mode] = (decode_rate, stream_rate)
+        print(f"{mode:8} {decode_rate:17.0f} {stream_rate:17.1f} {len(stream) / samples:13.1f}")
+
+    print(f"Binary mode delivers {results['binary'][1] / results['ascii'][1]:.0f}x the samples per second")
+    return results
+
+def main():
+    """Main function for standalone usage."""
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark-lines":
+        benchmark_lines(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        print("Usage: python le_protocol.py --benchmark | --benchmark-lines [capture_file]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import tty
+import time
+import math
+import random
+import select
+import termios
+import threading
+
+from le_protocol import CMD_BINARY, CMD_ASCII, BINARY_BAUD_RATE, encode_frame
+
+# termios speed constant -> baud rate, for pacing at the rate the host selected
+_BAUD_RATES = {getattr(termios, f"B{rate}"): rate
+               for rate in (9600, 19200, 38400, 57600, 115200, 230400, 460800, 500000, 1000000)
+               if hasattr(termios, f"B{rate}")}
+
+class SimulatedLeReader:
+    """An Arduino Uno running LE_Reader on a pseudo-terminal.
+
+    Point SerialCapture (or any reader) at the slave side returned by start().
+    Like the sketch, it prints the ready banner, then one address,cosine,sine
+    line per encoder every 100 ms; CMD_BINARY switches it to binary frames at
+    BINARY_BAUD_RATE with no delay between rounds, and CMD_ASCII back. Output
+    is paced at the baud rate the host set on the port, and each encoder read
+    takes the time of a 6-byte I2C transfer at 100 kHz.
+    """
+
+    def __init__(self, addresses=(8,), noise=3.0, i2c_time=0.0007):
+        """Create a reader with one encoder per address, each at a random angle."""
+        self.addresses = tuple(addresses)
+        self.noise = noise
+        self.i2c_time = i2c_time
+        self.angles = {address: random.uniform(0, 2 * math.pi) for address in self.addresses}
+        self.binary = False
+        self.seq = 0
+        self.stats = {'lines': 0, 'frames': 0, 'mode_switches': 0}
+        self._master = None
+        self._slave_fd = None
+        self._thread = None
+        self._running = False
+        self._wire_time = 0.0
+
+    def start(self):
+        """Open a pty and run the sketch on it from a background thread.
+
+        Returns:
+            str: Path of the slave side to open as the serial port
+        """
+        master, slave = os.openpty()
+        tty.setraw(master)
+        # A UART does not wait for a reader; output nobody reads is lost
+        os.set_blocking(master, False)
+        self._master = master
+        self._slave_fd = slave
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return os.ttyname(slave)
+
+    def stop(self):
+        """Stop the sketch and close the pty."""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        for fd in (self._master, self._slave_fd):
+            try:
+                os.close(fd)
+            except (OSError, TypeError):
+                pass
+
+    def _baud_rate(self):
+        """Rate the host set on the slave side."""
+        return _BAUD_RATES.get(termios.tcgetattr(self._slave_fd)[5], 115200)
+
+    def _send(self, data):
+        """Write data, holding it for its time on the wire (10 bits per byte)."""
+        now = time.perf_counter()
+        self._wire_time = max(self._wire_time, now) + len(data) * 10 / self._baud_rate()
+        if self._wire_time > now:
+            time.sleep(self._wire_time - now)
+        try:
+            os.write(self._master, data)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._running = False
+
+    def _reading(self, address):
+        """(distance, cosine, sine) of one encoder, with noise."""
+        angle = self.angles[address]
+        cosine = int(1000 * math.cos(angle) + random.gauss(0, self.noise))
+        sine = int(1000 * math.sin(angle) + random.gauss(0, self.noise))
+        return 512, cosine, sine
+
+    def _handle_commands(self):
+        """Switch modes on CMD_BINARY / CMD_ASCII, like the sketch's checkHostCommand()."""
+        ready, _, _ = select.select([self._master], [], [], 0)
+        if not ready:
+            return
+        try:
+            data = os.read(self._master, 64)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._running = False
+            return
+        for byte in data:
+            command = bytes([byte])
+            if command == CMD_BINARY and not self.binary:
+                self._send(f"LE_Reader binary {BINARY_BAUD_RATE}\r\n".encode())
+                self.binary = True
+                self.seq = 0
+                self.stats['mode_switches'] += 1
+            elif command == CMD_ASCII and self.binary:
+                self.binary = False
+                self.stats['mode_switches'] += 1
+                self._send(b"LE_Reader ascii\r\n")
+
+    def _run(self):
+        """The sketch's setup() and loop()."""
+        self._send(f"LE_Reader ready: {len(self.addresses)} devices\r\n".encode())
+        while self._running:
+            self._handle_commands()
+            for address in self.addresses:
+                time.sleep(self.i2c_time)
+                distance, cosine, sine = self._reading(address)
+                if self.binary:
+                    self._send(encode_frame(address, self.seq, distance, cosine, sine))
+                    self.seq = (self.seq + 1) & 0xFFFF
+                    self.stats['frames'] += 1
+                else:
+                    self._send(f"{address},{cosine},{sine}\r\n".encode())
+                    self.stats['lines'] += 1
+            if not self.binary:
+                time.sleep(0.1)
+
+def main():
+    """Run a simulated LE_Reader until interrupted."""
+    target = SimulatedLeReader(addresses=(8, 9))
+    port = target.start()
+    print(f"Simulated LE_Reader on {port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        target.stop()
+        print(f"Stats: {target.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_dep_file(dep_file):
+    """Parse a make-style dependency file written by avr-gcc -MMD.
+
+    Returns:
+        list: Prerequisite paths of the first rule (source file first, then headers)
+    """
+    with open(dep_file, 'r') as f:
+        content = f.read()
+
+    # Join continuation lines and keep only the first rule
+    content = content.replace('\\\r\n', ' ').replace('\\\n', ' ')
+    rule = content.split('\n\n')[0].strip().splitlines()[0] if content.strip() else ''
+
+    # The target is separated by ": "; Windows drive letters use ":" without a space
+    separator = rule.find(': ')
+    if separator == -1:
+        return []
+    prerequisites = rule[separator + 2:]
+
+    paths = []
+    current = ''
+    i = 0
+    while i < len(prerequisites):
+        char = prerequisites[i]
+        if char == '\\' and i + 1 < len(prerequisites) and prerequisites[i + 1] == ' ':
+            # Escaped space inside a path
+            current += ' '
+            i += 2
+            continue
+        if char.isspace():
+            if current:
+                paths.append(current)
+                current = ''
+        else:
+            current += char
+        i += 1
+
+    if current:
+        paths.append(current)
+
+    return paths
+
+class ObjectCache:
+    """Persistent content-addressed cache for compiled object files.
+
+    An entry is found in two steps. The source file and flag vector select a
+    manifest listing the headers seen on the previous compile. If those headers
+    are unchanged, their hashes complete the key of the cached object.
+    """
+
+    def __init__(self, cache_dir, max_size=64 * 1024 * 1024):
+        """Initialize the cache in cache_dir, bounded to max_size bytes of objects."""
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Compile jobs may run on several threads at once
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def reset_stats(self):
+        """Reset the hit/miss counters."""
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+    def _manifest_key(self, source, flags):
+        """Key of the manifest for a source compiled with the given flags."""
+        digest = hashlib.sha256()
+        digest.update(os.path.realpath(source).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(hash_file(source).encode('ascii'))
+        for flag in flags:
+            digest.update(b'\0')
+            digest.update(flag.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _object_key(self, manifest_key, headers):
+        """Key of an object from its manifest key and header hashes."""
+        digest = hashlib.sha256(manifest_key.encode('ascii'))
+        for path in sorted(headers):
+            digest.update(b'\0')
+            digest.update(path.encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(headers[path].encode('ascii'))
+        return digest.hexdigest()
+
+    def _path(self, key, extension):
+        """Path of a cache file for the given key."""
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    def _write_atomic(self, src, dest):
+        """Copy src to dest so readers never see a partial file."""
+        dest_dir = os.path.dirname(dest)
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dest)
+
+    def lookup(self, source, flags, obj_file):
+        """Restore obj_file from the cache.
+
+        Returns:
+            bool: True on a cache hit, False if the object must be compiled
+        """
+        manifest_key = self._manifest_key(source, flags)
+        manifest_file = self._path(manifest_key, '.json')
+
+        try:
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+
+            # Any changed or missing header invalidates the entry
+            headers = manifest['headers']
+            for path, digest in headers.items():
+                if hash_file(path) != digest:
+                    raise ValueError(f"{path} changed")
+
+            cached_obj = self._path(self._object_key(manifest_key, headers), '.o')
+            shutil.copyfile(cached_obj, obj_file)
+
+            cached_dep = cached_obj[:-2] + '.d'
+            if os.path.exists(cached_dep):
+                shutil.copyfile(cached_dep, os.path.splitext(obj_file)[0] + '.d')
+
+            # Touch the entry so LRU eviction keeps it
+            os.utime(cached_obj, None)
+            os.utime(manifest_file, None)
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.stats['misses'] += 1
+            return False
+
+        with self._lock:
+            self.stats['hits'] += 1
+        return True
+
+    def store(self, source, flags, obj_file, dep_file=None):
+        """Add a freshly compiled object to the cache."""
+        if dep_file is None:
+            dep_file = os.path.splitext(obj_file)[0] + '.d'
+
+        manifest_key = self._manifest_key(source, flags)
+
+        headers = {}
+        if os.path.exists(dep_file):
+            source_path = os.path.normcase(os.path.abspath(source))
+            for path in parse_dep_file(dep_file):
+                if os.path.normcase(os.path.abspath(path)) == source_path:
+                    continue
+                if os.path.exists(path):
+                    headers[path] = hash_file(path)
+
+        cached_obj = self._path(self._object_key(manifest_key, headers), '.o')
+        self._write_atomic(obj_file, cached_obj)
+        if os.path.exists(dep_file):
+            self._write_atomic(dep_file, cached_obj[:-2] + '.d')
+
+        manifest_file = self._path(manifest_key, '.json')
+        os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(manifest_file), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'source': source, 'headers': headers}, f, indent=4)
+        os.replace(tmp_path, manifest_file)
+
+        with self._lock:
+            self.stats['stored'] += 1
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used objects and manifests until the cache fits in max_size."""
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        """Evict entries; the caller holds the cache lock."""
+        entries = []
+        total = 0
+
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(('.o', '.json')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            stale_files = (path, path[:-2] + '.d') if path.endswith('.o') else (path,)
+            for stale in stale_files:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+            if path.endswith('.o'):
+                self.stats['evicted'] += 1
+
+    def report(self):
+        """Print the hit/miss counters."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = (self.stats['hits'] / lookups * 100) if lookups else 0.0
+        print(f"Object cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+              f"({hit_rate:.0f}% hit rate), {self.stats['stored']} stored, {self.stats['evicted']} evicted")
@@ -0,0 +1,204 @@
+import sys
+import time
+import threading
+import serial
+import serial.tools.list_ports
+
+class PortManager:
+    """Tracks which serial ports are present and which operation owns each one.
+
+    Presence comes from port enumeration, which needs no open and so never
+    resets a board: a scan compares the enumerated ports with the last scan
+    and turns the difference into appeared/disappeared events. A port is
+    probed with one open/close only the first time it is seen and again after
+    it has disappeared and reappeared; otherwise check() answers from the
+    recorded state. Ports that enumeration does not list are probed every
+    time, as before. Scans run on demand, or continuously from watch().
+    """
+
+    def __init__(self, max_age=0.5):
+        """
+        Args:
+            max_age (float): Seconds a scan stays valid before check() scans again
+        """
+        self.max_age = max_age
+        # port -> {'hwid', 'description', 'probed'}
+        self._ports = {}
+        # Every port enumeration has listed, so an unplugged one is known to be gone
+        self._seen = set()
+        # port -> name of the operation holding it
+        self._owners = {}
+        self._listeners = []
+        self._last_scan = None
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._watching = False
+
+    def add_listener(self, callback):
+        """Call callback(port, present) whenever a port appears or disappears."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def scan(self):
+        """Enumerate the ports and record what appeared and disappeared since the last scan.
+
+        Returns:
+            tuple: (appeared ports, disappeared ports)
+        """
+        current = {info.device: info for info in serial.tools.list_ports.comports()}
+        events = []
+
+        with self._lock:
+            for port in list(self._ports):
+                # A different hwid on the same name is another device: treat it as a replug
+                if port not in current or current[port].hwid != self._ports[port]['hwid']:
+                    del self._ports[port]
+                    events.append((port, False))
+            for port, info in current.items():
+                if port not in self._ports:
+                    self._ports[port] = {'hwid': info.hwid, 'description': info.description, 'probed': False}
+                    self._seen.add(port)
+                    events.append((port, True))
+            self._last_scan = time.monotonic()
+            listeners = list(self._listeners)
+
+        for port, present in events:
+            for callback in listeners:
+                callback(port, present)
+
+        appeared = [port for port, present in events if present]
+        disappeared = [port for port, present in events if not present and port not in appeared]
+        return appeared, disappeared
+
+    def _refresh(self):
+        """Scan unless the watcher or a recent scan keeps the state current."""
+        if self._watching:
+            return
+        if self._last_scan is None or time.monotonic() - self._last_scan > self.max_age:
+            self.scan()
+
+    def ports(self):
+        """{port: description} of the ports currently present."""
+        self._refresh()
+        with self._lock:
+            return {port: state['description'] for port, state in self._ports.items()}
+
+    def is_present(self, port):
+        """Whether port is currently enumerated."""
+        self._refresh()
+        with self._lock:
+            return port in self._ports
+
+    def owner(self, port):
+        """Name of the operation holding port, or None."""
+        with self._lock:
+            return self._owners.get(port)
+
+    def claim(self, port, operation):
+        """Mark port as owned by operation.
+
+        Returns:
+            bool: True if claimed (or already held by the same operation),
+            False if another operation holds it
+        """
+        with self._lock:
+            holder = self._owners.get(port)
+            if holder is not None and holder != operation:
+                return False
+            self._owners[port] = operation
+            return True
+
+    def release(self, port, operation):
+        """Give up ownership of port taken by operation."""
+        with self._lock:
+            if self._owners.get(port) == operation:
+                del self._owners[port]
+
+    def check(self, port, baud_rate=115200, operation=None):
+        """Whether port can be used now, probing it only if it is new or came back.
+
+        Args:
+            port (str): Serial port
+            baud_rate (int): Rate of the probe open, when one is needed
+            operation (str): The caller's operation; its own claim does not count as in use
+
+        Returns:
+            tuple: (True, None) if the port is usable, else (False, reason)
+        """
+        self._refresh()
+        with self._lock:
+            state = self._ports.get(port)
+            holder = self._owners.get(port)
+            unplugged = state is None and port in self._seen
+        if unplugged:
+            return False, "is not connected"
+        if holder is not None and holder != operation:
+            return False, f"is in use by {holder}"
+        if state is not None and state['probed']:
+            return True, None
+
+        try:
+            ser = serial.Serial(port, baud_rate, timeout=1)
+            ser.close()
+        except serial.SerialException as e:
+            return False, f"could not be opened ({str(e)})"
+
+        with self._lock:
+            if state is not None and self._ports.get(port) is state:
+                state['probed'] = True
+        return True, None
+
+    def watch(self, interval=1.0):
+        """Keep the port state current from a background thread."""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watching = True
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self.scan()
+        self._watcher.start()
+
+    def stop(self):
+        """Stop the background watcher."""
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+            self._watching = False
+        if watcher is not None:
+            watcher.join(timeout=2)
+
+    def _watch(self, interval):
+        while self._watching:
+            time.sleep(interval)
+            try:
+                self.scan()
+            except Exception:
+                # Enumeration can fail while a device is half attached; the next scan catches up
+                pass
+
+_port_manager = None
+
+def get_port_manager():
+    """Return the process-wide port manager."""
+    global _port_manager
+    if _port_manager is None:
+        _port_manager = PortManager()
+    return _port_manager
+
+def main():
+    """Print port changes as they happen."""
+    manager = get_port_manager()
+    manager.add_listener(lambda port, present: print(f"{'+' if present else '-'} {port}"))
+    manager.scan()
+    if len(sys.argv) > 1 and sys.argv[1] == "--once":
+        return
+
+    print("Watching serial ports (Ctrl+C to stop)")
+    manager.watch()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        manager.stop()
+
+if __name__ == "__main__":
+    main()
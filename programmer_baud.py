@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+
+from avrdude_runner import run_avrdude
+
+# Host link rates of the jtag2updi programmer, fastest first, all in the set
+# avrdude's jtagmkII driver can request. On the 16MHz ATmega328P (Uno or Nano)
+# the firmware runs on, 1000000 and 500000 are exact and 115200, the rate the
+# link always worked at before, is 2.1% off; 230400 is left out, as the
+# nearest rates the UART can make are 3.5% and 8.5% off.
+JTAG2UPDI_BAUD_RATES = (1000000, 500000, 115200)
+
+# Run failures that mean the programmer did not understand us at this rate,
+# so a slower rate may work; anything else fails the same way at every rate
+LINK_ERRORS = ('not_responding', 'baud_rejected', 'timeout')
+
+class BaudMemory:
+    """Remembers, per programmer port, the link rate that last worked.
+
+    Uploads start at the remembered rate, so the fallback through faster
+    rates that do not work happens once per programmer rather than on every
+    upload. The memory is kept in a small JSON file next to the other caches.
+    """
+
+    def __init__(self, cache_file=None):
+        if cache_file is None:
+            cache_file = os.path.join(tempfile.gettempdir(), 'arduino_compiler', 'programmer_baud.json')
+
+        self.cache_file = cache_file
+        self._rates = {}
+        self._lock = threading.Lock()
+        try:
+            with open(cache_file, 'r') as f:
+                self._rates = {port: int(rate) for port, rate in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _save(self):
+        """Write the remembered rates to the cache file."""
+        cache_dir = os.path.dirname(self.cache_file)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._rates, f, indent=4)
+        os.replace(tmp_path, self.cache_file)
+
+    def get(self, port):
+        """Rate that last worked on port, or None."""
+        with self._lock:
+            return self._rates.get(port)
+
+    def remembered(self):
+        """{port: rate} for every port with a remembered rate."""
+        with self._lock:
+            return dict(self._rates)
+
+    def rates(self, port, ranked=JTAG2UPDI_BAUD_RATES):
+        """Rates to try on port, in order: the remembered one, then the ranked list."""
+        remembered = self.get(port)
+        if remembered is None:
+            return list(ranked)
+        return [remembered] + [rate for rate in ranked if rate != remembered]
+
+    def succeeded(self, port, rate):
+        """Record that rate worked on port."""
+        with self._lock:
+            if self._rates.get(port) == rate:
+                return
+            self._rates[port] = rate
+            self._save()
+
+    def failed(self, port, rate):
+        """Record that rate did not work on port; forgets it if it was the remembered one."""
+        with self._lock:
+            if self._rates.get(port) != rate:
+                return
+            del self._rates[port]
+            self._save()
+
+_baud_memory = None
+
+def get_baud_memory():
+    """Return the process-wide baud rate memory."""
+    global _baud_memory
+    if _baud_memory is None:
+        _baud_memory = BaudMemory()
+    return _baud_memory
+
+def run_with_fallback(cmd, port, ranked=JTAG2UPDI_BAUD_RATES, memory=None, **kwargs):
+    """Run avrdude at the fastest rate the programmer on port accepts.
+
+    Tries the remembered rate first, then the ranked rates, moving to the next
+    one when a run fails with one of LINK_ERRORS. The rate that works is
+    remembered for port.
+
+    Args:
+        cmd (list): avrdude command line without a -b option
+        port (str): Programmer port, the key of the remembered rate
+        ranked (tuple): Rates to try, fastest first
+        memory (BaudMemory): Where rates are remembered, the process-wide memory by default
+        **kwargs: Passed on to run_avrdude
+
+    Returns:
+        tuple: (AvrdudeRun of the last attempt, rate it ran at)
+    """
+    memory = memory or get_baud_memory()
+    rates = memory.rates(port, ranked)
+
+    for index, rate in enumerate(rates):
+        run = run_avrdude([cmd[0], f"-b{rate}"] + list(cmd[1:]), **kwargs)
+        if run.success or run.error['kind'] == 'verify_failed':
+            # A verify mismatch still means every byte crossed the link intact
+            memory.succeeded(port, rate)
+            return run, rate
+        if run.error['kind'] not in LINK_ERRORS:
+            return run, rate
+
+        memory.failed(port, rate)
+        if index + 1 < len(rates):
+            print(f"Programmer on {port} not responding at {rate} baud ({run.error['kind']}), "
+                  f"trying {rates[index + 1]}...")
+    return run, rate
+
+def benchmark(hex_file, rates=JTAG2UPDI_BAUD_RATES, max_baud_rate=500000):
+    """Measure effective programming throughput at each rate on a simulated target.
+
+    The simulated target runs paced, holding every byte for its time on the
+    wire at the rate the host selected, and ignores rates above max_baud_rate,
+    like a programmer whose clock cannot produce them. Each rate programs the
+    full image with no verification; the effective rate is image bytes per
+    second of upload time. The fallback is then run twice through a scratch
+    BaudMemory to show the first upload settling on a rate and the second
+    starting there.
+    """
+    from intel_hex import HexImage
+    from updi_programmer import UpdiSession, UpdiError
+    from updi_simulator import SimulatedUpdiTarget
+
+    image_size = len(HexImage.load(hex_file))
+    target = SimulatedUpdiTarget(paced=True, max_baud_rate=max_baud_rate)
+    port = target.start()
+    # One port for the whole run, switched between rates like a programmer that is kept open
+    session = UpdiSession(port, baud_rate=rates[-1], timeout=0.2)
+
+    def upload(rate):
+        session.link.set_baud_rate(rate)
+        try:
+            session.program(hex_file)
+        finally:
+            if session.in_progmode:
+                session.release()
+
+    results = []
+    try:
+        print(f"{hex_file}: {image_size} bytes; simulated target accepts up to {max_baud_rate} baud")
+        failed = []
+        for rate in rates:
+            start_time = time.perf_counter()
+            try:
+                upload(rate)
+            except UpdiError:
+                failed.append(rate)
+                continue
+            elapsed = time.perf_counter() - start_time
+            results.append((rate, elapsed, image_size / elapsed))
+
+        print(f"{'Baud':>8} {'Upload s':>9} {'Bytes/s':>9} {'Speedup':>8}")
+        for rate in failed:
+            print(f"{rate:8d} {'no response':>19}")
+        for rate, elapsed, throughput in results:
+            print(f"{rate:8d} {elapsed:9.3f} {throughput:9.0f} {throughput / results[-1][2]:7.1f}x")
+
+        fd, memory_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        os.remove(memory_file)
+        memory = BaudMemory(memory_file)
+        try:
+            for label in ('first upload', 'second upload'):
+                start_time = time.perf_counter()
+                tried = []
+                for rate in memory.rates(port, rates):
+                    tried.append(rate)
+                    try:
+                        upload(rate)
+                    except UpdiError:
+                        memory.failed(port, rate)
+                        continue
+                    memory.succeeded(port, rate)
+                    break
+                print(f"{label}: tried {', '.join(map(str, tried))} baud, "
+                      f"{time.perf_counter() - start_time:.3f}s including fallback")
+        finally:
+            if os.path.exists(memory_file):
+                os.remove(memory_file)
+    finally:
+        session.link.close()
+        target.stop()
+    return results
+
+def main():
+    """Main function for standalone usage."""
+    usage = ("Usage:\n"
+             "  python programmer_baud.py show\n"
+             "  python programmer_baud.py --benchmark <hex_file> [max_baud_rate]")
+
+    if len(sys.argv) < 2:
+        print(usage)
+        return
+
+    if sys.argv[1] == "show":
+        memory = get_baud_memory()
+        print(f"Ranked rates: {', '.join(map(str, JTAG2UPDI_BAUD_RATES))}")
+        print(f"Remembered rates ({memory.cache_file}):")
+        for port, rate in sorted(memory.remembered().items()):
+            print(f"  {port}: {rate}")
+    elif sys.argv[1] == "--benchmark" and len(sys.argv) > 2:
+        benchmark(sys.argv[2], max_baud_rate=int(sys.argv[3]) if len(sys.argv) > 3 else 500000)
+    else:
+        print(usage)
+
+if __name__ == "__main__":
+    main()
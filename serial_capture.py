@@ -0,0 +1,298 @@
+import sys
+import time
+import threading
+import serial
+
+from serial_helper import open_serial_with_flush
+from port_manager import get_port_manager
+from le_protocol import (AsciiDecoder, FrameDecoder, CMD_BINARY, CMD_ASCII, BINARY_BAUD_RATE,
+                         BINARY_ACK)
+
+# Stream formats LE_Reader can send
+PROTOCOLS = ('ascii', 'binary')
+
+class SampleRing:
+    """Fixed-size ring of samples with independent reader cursors.
+
+    Samples are numbered from 0 as they are pushed. A reader keeps the number
+    of the next sample it wants; once the ring has wrapped past it, the
+    samples in between are gone and counted as dropped for that reader.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self.head = 0
+        self.closed = False
+        self._ready = threading.Condition()
+
+    def extend(self, samples):
+        """Append samples, overwriting the oldest ones when full, and wake waiting readers."""
+        if not samples:
+            return
+        with self._ready:
+            slots, capacity, head = self._slots, self.capacity, self.head
+            for sample in samples:
+                slots[head % capacity] = sample
+                head += 1
+            self.head = head
+            self._ready.notify_all()
+
+    def close(self):
+        """Wake every waiting reader; no more samples will arrive."""
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+    def read(self, cursor, max_count=None, timeout=None):
+        """Samples from cursor on, waiting up to timeout for at least one.
+
+        Returns:
+            tuple: (samples, next cursor, samples dropped before cursor could be served)
+        """
+        with self._ready:
+            if self.head == cursor and timeout != 0:
+                self._ready.wait_for(lambda: self.head != cursor or self.closed, timeout)
+            head = self.head
+            dropped = max(0, head - cursor - self.capacity)
+            cursor += dropped
+            end = head if max_count is None else min(head, cursor + max_count)
+            samples = [self._slots[index % self.capacity] for index in range(cursor, end)]
+        return samples, end, dropped
+
+class Subscription:
+    """A consumer's position in the capture ring."""
+
+    def __init__(self, ring):
+        self._ring = ring
+        self.cursor = ring.head
+        self.dropped = 0
+
+    def pull(self, max_count=None, timeout=None):
+        """Samples that arrived since the last pull, waiting up to timeout for the first.
+
+        Returns:
+            list: Samples, oldest first; empty if none arrived within timeout
+        """
+        samples, self.cursor, dropped = self._ring.read(self.cursor, max_count, timeout)
+        self.dropped += dropped
+        return samples
+
+class SerialCapture:
+    """Reads LE_Reader samples on a dedicated thread into a ring buffer.
+
+    The thread reads whatever the port has buffered in one call, decodes the
+    complete lines or frames and appends the samples to the ring; consumers
+    pull batches through their own Subscription and never hold up the reads.
+    With protocol='binary' LE_Reader is switched to binary frames at
+    BINARY_BAUD_RATE after the stream is ready, and back to ASCII on stop();
+    firmware without binary mode keeps sending ASCII, which is then used.
+    
+    Opening the port resets the Uno, so LE_Reader scans the I2C bus again; it
+    only scans once at boot. reset=False skips the reset and the boot time, for
+    when LE_Reader was started after the encoder was already running.
+
+    Counters (see stats()):
+        samples: Samples captured
+        dropped: Samples overwritten before the default subscription pulled them
+        overruns: Reads that found the input buffer at the read size, i.e. the
+            thread had fallen behind and the driver may have discarded bytes
+        bad_lines (ascii): Lines that were not address,cosine,sine
+        bad_frames, lost_frames (binary): Frames rejected by their CRC, and
+            frames missing from the sequence numbers
+    """
+
+    def __init__(self, port, baud_rate=115200, capacity=4096, reset=True, read_size=4096, protocol='ascii'):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol '{protocol}', expected one of {', '.join(PROTOCOLS)}")
+
+        self.port = port
+        self.baud_rate = baud_rate
+        self.reset = reset
+        self.read_size = read_size
+        self.protocol = protocol
+        self.decoder = AsciiDecoder()
+        self.ring = SampleRing(capacity)
+        self.ser = None
+        self.samples = 0
+        self.overruns = 0
+        self.bytes_read = 0
+        self.error = None
+        self._thread = None
+        self._running = False
+        self._default = Subscription(self.ring)
+
+    def start(self):
+        """Claim and open the port, wait for the stream, and start capturing.
+
+        Raises:
+            serial.SerialException: The port is in use, cannot be opened or stays silent
+        """
+        port_manager = get_port_manager()
+        if not port_manager.claim(self.port, 'capture'):
+            raise serial.SerialException(f"Port {self.port} is in use by {port_manager.owner(self.port)}")
+        try:
+            self.ser = self._open()
+        except serial.SerialException:
+            port_manager.release(self.port, 'capture')
+            raise
+
+        try:
+            self._default = Subscription(self.ring)
+            if self.protocol == 'binary':
+                self._enter_binary()
+            self._running = True
+            self._thread = threading.Thread(target=self._capture, daemon=True)
+            self._thread.start()
+        except BaseException:
+            # Leave the port closed and free for the next claim
+            self._running = False
+            self.ser.close()
+            self.ser = None
+            port_manager.release(self.port, 'capture')
+            raise
+        return self
+
+    def stop(self):
+        """Stop capturing and close the port."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self.ser is not None:
+            if isinstance(self.decoder, FrameDecoder):
+                # Leave LE_Reader in ASCII mode for the next open
+                try:
+                    self.ser.write(CMD_ASCII)
+                    self.ser.flush()
+                except (serial.SerialException, OSError):
+                    pass
+            self.ser.close()
+            self.ser = None
+            get_port_manager().release(self.port, 'capture')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _open(self):
+        """Open the port and wait for LE_Reader's ASCII stream.
+
+        Without a reset, a host that died in binary mode has left LE_Reader
+        sending frames at BINARY_BAUD_RATE; it is switched back and the wait retried.
+        """
+        try:
+            return open_serial_with_flush(self.port, self.baud_rate, 0.05, reset=self.reset)
+        except serial.SerialTimeoutException:
+            if self.reset:
+                raise
+
+        print("No ASCII stream from LE_Reader; switching it back from binary mode")
+        ser = serial.Serial()
+        ser.port = self.port
+        ser.baudrate = BINARY_BAUD_RATE
+        ser.dtr = False
+        ser.open()
+        try:
+            ser.write(CMD_ASCII)
+            ser.flush()
+        finally:
+            ser.close()
+        return open_serial_with_flush(self.port, self.baud_rate, 0.05, reset=False)
+
+    def _enter_binary(self, deadline=0.5):
+        """Ask LE_Reader for binary frames and follow it to BINARY_BAUD_RATE."""
+        self.ser.write(CMD_BINARY)
+        buffer = b''
+        end_time = time.perf_counter() + deadline
+        while time.perf_counter() < end_time:
+            buffer += self.ser.read(max(1, self.ser.in_waiting))
+            index = buffer.find(BINARY_ACK)
+            if index >= 0 and b'\n' in buffer[index:]:
+                self.ser.baudrate = BINARY_BAUD_RATE
+                # Whatever arrived while both sides changed rate is noise
+                self.ser.reset_input_buffer()
+                self.decoder = FrameDecoder()
+                return
+
+        print("LE_Reader did not switch to binary mode (sketch without binary support?); staying with ASCII")
+        self.protocol = 'ascii'
+        samples = self.decoder.decode(buffer, time.perf_counter())
+        self.samples += len(samples)
+        self.ring.extend(samples)
+
+    def subscribe(self):
+        """New Subscription that receives every sample captured from now on."""
+        return Subscription(self.ring)
+
+    def pull(self, max_count=None, timeout=None):
+        """Pull from the default subscription; see Subscription.pull.
+
+        Raises:
+            serial.SerialException: The port failed and every captured sample has been pulled
+        """
+        samples = self._default.pull(max_count, timeout)
+        if not samples and self.error is not None:
+            raise serial.SerialException(f"Capture on {self.port} failed: {self.error}")
+        return samples
+
+    @property
+    def dropped(self):
+        """Samples the default subscription lost, including ones already overwritten but not yet pulled."""
+        subscription, ring = self._default, self.ring
+        return subscription.dropped + max(0, ring.head - subscription.cursor - ring.capacity)
+
+    def stats(self):
+        """Counters of the capture so far."""
+        stats = {'samples': self.samples, 'dropped': self.dropped, 'overruns': self.overruns,
+                 'bytes': self.bytes_read}
+        stats.update(self.decoder.stats())
+        return stats
+
+    def _capture(self):
+        """Capture thread: bulk reads, parse, append to the ring."""
+        ser = self.ser
+        while self._running:
+            try:
+                waiting = ser.in_waiting
+                if waiting >= self.read_size:
+                    self.overruns += 1
+                # Blocks for up to the port timeout when nothing is buffered
+                data = ser.read(min(max(waiting, 1), self.read_size))
+            except (serial.SerialException, OSError) as e:
+                self.error = str(e)
+                self._running = False
+                self.ring.close()
+                return
+            if not data:
+                continue
+            self.bytes_read += len(data)
+            samples = self.decoder.decode(data, time.perf_counter())
+            self.samples += len(samples)
+            self.ring.extend(samples)
+
+def main():
+    """Capture from LE_Reader and print samples and counters."""
+    if len(sys.argv) < 2:
+        print("Usage: python serial_capture.py <port> [seconds] [ascii|binary]")
+        return
+
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    protocol = sys.argv[3] if len(sys.argv) > 3 else 'ascii'
+    try:
+        with SerialCapture(sys.argv[1], protocol=protocol) as capture:
+            end_time = time.perf_counter() + seconds
+            while time.perf_counter() < end_time:
+                for sample in capture.pull(timeout=0.5):
+                    print(f"{sample.address}\t{sample.cosine:.0f}\t{sample.sine:.0f}")
+            print(f"Counters: {capture.stats()}")
+    except serial.SerialException as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,113 @@
+import re
+import sys
 import time
 import serial
 
-def open_serial_with_flush(port, baud_rate=115200, timeout=1):
+# A complete LE_Reader sample line: address,cosine,sine
+SAMPLE_LINE = re.compile(rb'^\d{1,3},-?\d+,-?\d+$')
+
+# Printed by LE_Reader once its I2C scan is done and samples follow
+READY_BANNER = b'LE_Reader ready'
+
+# Seconds from opening the port to the stream being ready, one entry per open
+_ready_times = []
+
+def ready_time_median():
+    """Median time-to-first-sample of the opens so far, or None."""
+    if not _ready_times:
+        return None
+    times = sorted(_ready_times)
+    middle = len(times) // 2
+    return times[middle] if len(times) % 2 else (times[middle - 1] + times[middle]) / 2
+
+def wait_until_ready(ser, deadline=10):
+    """
+    Read lines until LE_Reader's stream is ready: its ready banner or the first
+    complete address,cosine,sine line. Anything before that (a line cut off by
+    the open, bootloader noise) is discarded.
+
+    Args:
+        ser (serial.Serial): Open connection
+        deadline (float): Seconds to wait in total
+
+    Returns:
+        bytes: The line that showed the stream is ready, or None at the deadline
+    """
+    end_time = time.perf_counter() + deadline
+    timeout = ser.timeout
+    try:
+        while True:
+            remaining = end_time - time.perf_counter()
+            if remaining <= 0:
+                return None
+            ser.timeout = min(remaining, timeout) if timeout else remaining
+            line = ser.readline().strip()
+            if line.startswith(READY_BANNER) or SAMPLE_LINE.match(line):
+                return line
+    finally:
+        ser.timeout = timeout
+
+def open_serial_with_flush(port, baud_rate=115200, timeout=1, deadline=10, reset=True):
     """
-    Open a serial connection and properly flush all buffers to ensure fresh data.
-    
+    Open a serial connection and wait until LE_Reader is sending fresh data.
+
+    Readiness is taken from the stream itself (see wait_until_ready) instead of
+    fixed sleeps, so the call returns as soon as the sketch is up.
+
     Args:
         port (str): Serial port to open
         baud_rate (int): Baud rate for the connection
         timeout (int): Read timeout in seconds
-        
+        deadline (float): Seconds to wait for the stream before giving up
+        reset (bool): Let the open pulse DTR and reset the board. With False DTR
+            is held low, so a sketch that is already running keeps running
+            (where the OS allows it; Linux raises DTR briefly on every open).
+
     Returns:
-        serial.Serial: Open serial connection with flushed buffers
+        serial.Serial: Open serial connection positioned after the ready line
+
+    Raises:
+        serial.SerialTimeoutException: Nothing valid arrived before the deadline
     """
-    # Open the serial connection
-    ser = serial.Serial(port, baud_rate, timeout=timeout)
-    
-    # Wait for connection to establish
-    time.sleep(2)
-    
-    # Flush any stale data in the buffer
+    start_time = time.perf_counter()
+
+    ser = serial.Serial()
+    ser.port = port
+    ser.baudrate = baud_rate
+    ser.timeout = timeout
+    if not reset:
+        ser.dtr = False
+    ser.open()
+
+    # Drop whatever was buffered before the open
     ser.reset_input_buffer()
-    ser.reset_output_buffer()
-    
-    # Additional wait to ensure buffer is truly cleared
-    time.sleep(0.5)
-    
-    # Discard any data that might have arrived during the flush
-    while ser.in_waiting > 0:
-        ser.read(ser.in_waiting)
-    
+
+    if wait_until_ready(ser, deadline) is None:
+        ser.close()
+        raise serial.SerialTimeoutException(f"No data from LE_Reader on {port} within {deadline} seconds")
+
+    _ready_times.append(time.perf_counter() - start_time)
+    print(f"Serial stream ready after {_ready_times[-1]:.2f}s "
+          f"(median {ready_time_median():.2f}s over {len(_ready_times)} opens)")
     return ser
+
+def main():
+    """Measure time-to-first-sample with and without resetting the board."""
+    if len(sys.argv) < 2:
+        print("Usage: python serial_helper.py <port> [opens]")
+        return
+
+    port = sys.argv[1]
+    opens = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for reset in (True, False):
+        del _ready_times[:]
+        for _ in range(opens):
+            try:
+                open_serial_with_flush(port, reset=reset).close()
+            except serial.SerialException as e:
+                print(f"Error: {str(e)}")
+                return
+        print(f"{'With' if reset else 'Without'} reset: median {ready_time_median():.2f}s to the first sample")
+
+if __name__ == "__main__":
+    main()
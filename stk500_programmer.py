@@ -0,0 +1,238 @@
+import sys
+import time
+import errno
+import serial
+
+from intel_hex import HexImage
+
+# STK500 version 1 protocol, as spoken by the Optiboot bootloader on the Uno
+STK_OK = 0x10
+STK_FAILED = 0x11
+STK_NOSYNC = 0x15
+STK_INSYNC = 0x14
+CRC_EOP = 0x20
+
+STK_GET_SYNC = 0x30
+STK_GET_PARAMETER = 0x41
+STK_SET_DEVICE = 0x42
+STK_SET_DEVICE_EXT = 0x45
+STK_ENTER_PROGMODE = 0x50
+STK_LEAVE_PROGMODE = 0x51
+STK_LOAD_ADDRESS = 0x55
+STK_UNIVERSAL = 0x56
+STK_PROG_PAGE = 0x64
+STK_READ_PAGE = 0x74
+STK_READ_SIGN = 0x75
+
+STK_SW_MAJOR = 0x81
+STK_SW_MINOR = 0x82
+
+# Supported targets: signature -> (name, flash size, page size)
+DEVICES = {
+    bytes([0x1E, 0x95, 0x0F]): ('atmega328p', 32768, 128),
+    bytes([0x1E, 0x95, 0x14]): ('atmega328', 32768, 128)
+}
+
+class Stk500Error(Exception):
+    """Raised when the bootloader does not respond as expected."""
+
+class VerifyError(Stk500Error):
+    """Raised when flash read back after programming does not match the image."""
+
+class Stk500Client:
+    """Programs an Arduino Uno through its serial bootloader.
+
+    The port is opened once; opening it asserts DTR, which resets the board
+    into the bootloader, so no separate reset or port probe is needed.
+    """
+
+    def __init__(self, port, baud_rate=115200, timeout=0.5):
+        """Open the port, resetting the board into its bootloader."""
+        self.port = port
+        self.ser = serial.Serial()
+        self.ser.port = port
+        self.ser.baudrate = baud_rate
+        self.ser.timeout = timeout
+        # Hold DTR and RTS off while opening, then pulse them once below
+        self.ser.dtr = False
+        self.ser.rts = False
+        self.ser.open()
+        self.device = None
+        self._reset()
+
+    def close(self):
+        """Close the serial port."""
+        self.ser.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _set_lines(self, state):
+        """Drive DTR and RTS together."""
+        try:
+            self.ser.dtr = state
+            self.ser.rts = state
+        except (OSError, serial.SerialException) as e:
+            # Pseudo-terminals (the simulator) have no modem lines
+            if getattr(e, 'errno', None) not in (errno.EINVAL, errno.ENOTTY):
+                raise
+
+    def _reset(self):
+        """Pulse DTR/RTS; the auto-reset capacitor turns the edge into a reset pulse."""
+        self._set_lines(False)
+        time.sleep(0.05)
+        self._set_lines(True)
+        # The bootloader needs a moment after reset before it listens
+        time.sleep(0.05)
+        self.ser.reset_input_buffer()
+
+    def _command(self, data, reply_size=0):
+        """Send a command terminated by CRC_EOP and return the reply payload."""
+        self.ser.write(bytes(data) + bytes([CRC_EOP]))
+        reply = self.ser.read(reply_size + 2)
+        if len(reply) != reply_size + 2:
+            raise Stk500Error(f"Timeout on {self.port}: no reply to command 0x{data[0]:02x}")
+        if reply[0] != STK_INSYNC:
+            raise Stk500Error(f"Not in sync with the bootloader (got 0x{reply[0]:02x})")
+        if reply[-1] != STK_OK:
+            raise Stk500Error(f"Command 0x{data[0]:02x} failed (got 0x{reply[-1]:02x})")
+        return reply[1:-1]
+
+    def sync(self, attempts=10):
+        """Get in sync with the bootloader."""
+        for attempt in range(attempts):
+            self.ser.reset_input_buffer()
+            self.ser.write(bytes([STK_GET_SYNC, CRC_EOP]))
+            if self.ser.read(2) == bytes([STK_INSYNC, STK_OK]):
+                self.ser.reset_input_buffer()
+                return
+        raise Stk500Error(f"No bootloader responding on {self.port}")
+
+    def get_parameter(self, parameter):
+        """Read a bootloader parameter such as STK_SW_MAJOR."""
+        return self._command([STK_GET_PARAMETER, parameter], 1)[0]
+
+    def read_signature(self):
+        """Return the three signature bytes."""
+        return self._command([STK_READ_SIGN], 3)
+
+    def enter_progmode(self):
+        """Sync, identify the target and enter programming mode."""
+        self.sync()
+        signature = self.read_signature()
+        if signature not in DEVICES:
+            raise Stk500Error(f"Unsupported device signature {signature.hex()}")
+        self.device = DEVICES[signature]
+        self._command([STK_ENTER_PROGMODE])
+
+    def leave_progmode(self):
+        """Leave programming mode; the bootloader starts the application."""
+        self._command([STK_LEAVE_PROGMODE])
+
+    def _load_address(self, address):
+        """Set the address of the next page operation (flash byte address)."""
+        word = address >> 1
+        self._command([STK_LOAD_ADDRESS, word & 0xFF, (word >> 8) & 0xFF])
+
+    def write_page(self, address, data):
+        """Write one flash page; the bootloader erases it first."""
+        self._load_address(address)
+        self._command(bytes([STK_PROG_PAGE, len(data) >> 8, len(data) & 0xFF, ord('F')]) + bytes(data))
+
+    def read_page(self, address, size):
+        """Read size bytes of flash starting at address."""
+        self._load_address(address)
+        return self._command([STK_READ_PAGE, size >> 8, size & 0xFF, ord('F')], size)
+
+    def upload(self, hex_file, verify=True):
+        """Write the pages an Intel HEX image occupies, optionally reading them back.
+
+        Pages the image does not touch are left as they are; the bootloader
+        erases each page as it writes it.
+
+        Returns:
+            int: Number of pages written
+
+        Raises:
+            VerifyError: A page read back differs from the image
+        """
+        image = HexImage.load(hex_file)
+        self.enter_progmode()
+
+        try:
+            name, flash_size, page_size = self.device
+            if image.end > flash_size:
+                raise Stk500Error(f"Image does not fit in the {flash_size} byte flash of the {name}")
+
+            pages = image.pages(page_size)
+            for address, data in pages.items():
+                self.write_page(address, data)
+
+            if verify:
+                for address, data in pages.items():
+                    if self.read_page(address, page_size) != data:
+                        raise VerifyError(f"Verification failed: flash page 0x{address:04x} differs from the image")
+        except BaseException:
+            # Let the bootloader start the application; the error to report is the first one
+            try:
+                self.leave_progmode()
+            except (Stk500Error, serial.SerialException, OSError):
+                pass
+            raise
+
+        self.leave_progmode()
+        return len(pages)
+
+def main():
+    """Main function for standalone usage."""
+    usage = ("Usage:\n"
+             "  python stk500_programmer.py <port> info\n"
+             "  python stk500_programmer.py <port> flash <hex_file>\n"
+             "  python stk500_programmer.py --simulate <hex_file>")
+
+    if len(sys.argv) < 3:
+        print(usage)
+        return
+
+    if sys.argv[1] == "--simulate":
+        # Upload to a simulated Optiboot on a pty and check the result
+        from stk500_simulator import SimulatedOptiboot
+        target = SimulatedOptiboot()
+        port = target.start()
+        try:
+            start_time = time.perf_counter()
+            with Stk500Client(port) as client:
+                pages = client.upload(sys.argv[2])
+            elapsed = time.perf_counter() - start_time
+
+            image = HexImage.load(sys.argv[2])
+            ok = target.flash[image.start:image.end] == image.view()
+            print(f"Uploaded {pages} pages to simulated Optiboot {port} in {elapsed:.3f}s: "
+                  f"{'flash matches image' if ok else 'FLASH MISMATCH'}")
+            sys.exit(0 if ok else 1)
+        finally:
+            target.stop()
+
+    port, command = sys.argv[1], sys.argv[2]
+    try:
+        with Stk500Client(port) as client:
+            if command == "info":
+                client.enter_progmode()
+                print(f"Device: {client.device[0]} (signature {client.read_signature().hex()})")
+                print(f"Bootloader version: {client.get_parameter(STK_SW_MAJOR)}.{client.get_parameter(STK_SW_MINOR)}")
+                client.leave_progmode()
+            elif command == "flash" and len(sys.argv) > 3:
+                start_time = time.perf_counter()
+                pages = client.upload(sys.argv[3])
+                print(f"Uploaded {pages} pages in {time.perf_counter() - start_time:.2f}s")
+            else:
+                print(usage)
+    except (Stk500Error, serial.SerialException, ValueError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import tty
+import time
+import select
+import threading
+
+from stk500_programmer import (
+    STK_OK, STK_INSYNC, STK_NOSYNC, CRC_EOP, STK_GET_SYNC, STK_GET_PARAMETER, STK_SET_DEVICE,
+    STK_SET_DEVICE_EXT, STK_LEAVE_PROGMODE, STK_LOAD_ADDRESS, STK_UNIVERSAL,
+    STK_PROG_PAGE, STK_READ_PAGE, STK_READ_SIGN, STK_SW_MAJOR, STK_SW_MINOR
+)
+
+class SimulatedOptiboot:
+    """An Arduino Uno's Optiboot bootloader answering STK500v1 on a pseudo-terminal.
+
+    Point Stk500Client at the slave side returned by start(). The model keeps
+    a flash array and answers the commands Optiboot implements; like Optiboot
+    it erases each page as it writes it. A pty has no DTR line, so the
+    simulated board is always in its bootloader.
+    """
+
+    def __init__(self, signature=b'\x1e\x95\x0f', flash_size=32768, page_size=128, version=(8, 0)):
+        """Create a board with erased flash."""
+        self.signature = bytes(signature)
+        self.page_size = page_size
+        self.version = version
+        self.flash = bytearray([0xFF]) * flash_size
+        self.address = 0
+        self.stats = {'page_writes': 0, 'page_reads': 0, 'syncs': 0, 'app_starts': 0}
+        self._master = None
+        self._slave_fd = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """Open a pty and serve the bootloader on it from a background thread.
+
+        Returns:
+            str: Path of the slave side to open as the serial port
+        """
+        master, slave = os.openpty()
+        tty.setraw(master)
+        self._master = master
+        self._slave_fd = slave
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return os.ttyname(slave)
+
+    def stop(self):
+        """Stop serving and close the pty."""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        for fd in (self._master, self._slave_fd):
+            try:
+                os.close(fd)
+            except (OSError, TypeError):
+                pass
+
+    def _serve(self):
+        """Feed received bytes through the protocol state machine."""
+        protocol = self._protocol()
+        next(protocol)
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            for byte in data:
+                protocol.send(byte)
+
+    def _reply(self, data=b''):
+        """Answer a command: INSYNC, payload, OK."""
+        os.write(self._master, bytes([STK_INSYNC]) + bytes(data) + bytes([STK_OK]))
+
+    def _protocol(self):
+        """Generator that consumes one byte per send() and answers commands."""
+        while True:
+            command = yield
+            arguments = bytearray()
+
+            if command == STK_GET_PARAMETER:
+                arguments.append((yield))
+            elif command == STK_SET_DEVICE:
+                for _ in range(20):
+                    arguments.append((yield))
+            elif command == STK_SET_DEVICE_EXT:
+                for _ in range(5):
+                    arguments.append((yield))
+            elif command == STK_LOAD_ADDRESS:
+                for _ in range(2):
+                    arguments.append((yield))
+            elif command == STK_UNIVERSAL:
+                for _ in range(4):
+                    arguments.append((yield))
+            elif command in (STK_PROG_PAGE, STK_READ_PAGE):
+                for _ in range(3):
+                    arguments.append((yield))
+                if command == STK_PROG_PAGE:
+                    for _ in range((arguments[0] << 8) | arguments[1]):
+                        arguments.append((yield))
+
+            if (yield) != CRC_EOP:
+                # Optiboot lets its watchdog reset the board on a framing error
+                os.write(self._master, bytes([STK_NOSYNC]))
+                continue
+
+            if command == STK_GET_SYNC:
+                self.stats['syncs'] += 1
+                self._reply()
+            elif command == STK_GET_PARAMETER:
+                values = {STK_SW_MAJOR: self.version[0], STK_SW_MINOR: self.version[1]}
+                self._reply([values.get(arguments[0], 0x03)])
+            elif command == STK_READ_SIGN:
+                self._reply(self.signature)
+            elif command == STK_LOAD_ADDRESS:
+                # Word address, little endian
+                self.address = ((arguments[1] << 8) | arguments[0]) * 2
+                self._reply()
+            elif command == STK_UNIVERSAL:
+                self._reply([0x00])
+            elif command == STK_PROG_PAGE:
+                data = bytes(arguments[3:])
+                if arguments[2] == ord('F'):
+                    page = self.address - self.address % self.page_size
+                    self.flash[page:page + self.page_size] = bytes([0xFF]) * self.page_size
+                    self.flash[self.address:self.address + len(data)] = data
+                    self.stats['page_writes'] += 1
+                self._reply()
+            elif command == STK_READ_PAGE:
+                size = (arguments[0] << 8) | arguments[1]
+                self.stats['page_reads'] += 1
+                self._reply(self.flash[self.address:self.address + size])
+            elif command == STK_LEAVE_PROGMODE:
+                self.stats['app_starts'] += 1
+                self._reply()
+            else:
+                # SET_DEVICE, SET_DEVICE_EXT, ENTER_PROGMODE and the rest are acknowledged
+                self._reply()
+
+def main():
+    """Serve a simulated Optiboot until interrupted."""
+    target = SimulatedOptiboot()
+    port = target.start()
+    print(f"Simulated Optiboot (ATmega328P) on {port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        target.stop()
+        print(f"Stats: {target.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from elf_convert import write_hex
+from elf_reader import ElfFile
+from firmware_patcher import FirmwarePatcher
+from intel_hex import HexImage
+from toolchain_registry import get_registry
+
+LE_FINAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LE_Final")
+COMMITTED_ELF = os.path.join(LE_FINAL_DIR, "build", "LE_Final.ino.elf")
+
+class PatchTemplateTest(unittest.TestCase):
+    """Patch a template made from the committed LE_Final ELF.
+
+    The committed ELF predates the calibration globals, so three words of its
+    initialised .rodata stand in for address, sine_off and cosine_off. The
+    patcher only sees flash offsets and sizes, exactly as in a real template.
+    """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='le_patch_test_')
+        template_dir = os.path.join(self.work_dir, "template")
+        os.makedirs(template_dir)
+        self.template_hex = os.path.join(template_dir, "LE_Final.hex")
+
+        elf = ElfFile(COMMITTED_ELF)
+        write_hex(elf, self.template_hex)
+
+        table = elf.find_symbol('digital_pin_to_timer')
+        base = elf.load_address(table['value'])
+        self.patcher = FirmwarePatcher(LE_FINAL_DIR, template_dir)
+        self.slots = {setting: base + 2 * i for i, setting in enumerate(('address', 'sine', 'cosine'))}
+        self.stored = {setting: int.from_bytes(elf.read(table['value'] + offset - base, 2), 'little', signed=True)
+                       for setting, offset in self.slots.items()}
+
+        manifest = {
+            "source_hash": self.patcher._source_hash(),
+            "hex_file": "LE_Final.hex",
+            "values": self.stored,
+            "symbols": {setting: {"symbol": setting, "offset": offset, "size": 2, "section": ".rodata"}
+                        for setting, offset in self.slots.items()}
+        }
+        with open(self.patcher.manifest_file, 'w') as f:
+            json.dump(manifest, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _patch(self, address, sine, cosine):
+        output_hex = os.path.join(self.work_dir, "out", f"{address}_{sine}_{cosine}.hex")
+        self.assertEqual(self.patcher.patch(address, sine, cosine, output_hex), output_hex)
+        return output_hex
+
+    def test_template_values_reproduce_the_template(self):
+        patched_hex = self._patch(self.stored['address'], self.stored['sine'], self.stored['cosine'])
+        with open(self.template_hex, 'rb') as f, open(patched_hex, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_only_calibration_bytes_change(self):
+        values = {'address': 42, 'sine': -317, 'cosine': 1023}
+        patched_hex = self._patch(values['address'], values['sine'], values['cosine'])
+
+        template = HexImage.load(self.template_hex)
+        patched = HexImage.load(patched_hex)
+        self.assertEqual(template.segments, patched.segments)
+        self.assertEqual(template.start_address, patched.start_address)
+
+        calibration = set()
+        for setting, offset in self.slots.items():
+            self.assertEqual(int.from_bytes(patched.data[offset:offset + 2], 'little', signed=True), values[setting])
+            calibration.update((offset, offset + 1))
+        differing = {i for i, (a, b) in enumerate(zip(template.data, patched.data)) if a != b}
+        self.assertTrue(differing <= calibration)
+
+        with open(self.template_hex) as f, open(patched_hex) as g:
+            self.assertEqual(len(f.readlines()), len(g.readlines()))
+
+class FullCompileTest(unittest.TestCase):
+    """Compare a patched image with a full compile of LE_Final; needs avr-gcc and megaTinyCore."""
+
+    def test_patched_image_matches_full_compile(self):
+        registry = get_registry()
+        if not registry.get('avr_gcc') or not registry.get('core_path'):
+            self.skipTest("avr-gcc or megaTinyCore not installed")
+
+        patcher = FirmwarePatcher()
+        for address, sine, cosine in ((8, 47, 59), (127, -512, 511)):
+            self.assertTrue(patcher.verify(address, sine, cosine))
+
+if __name__ == "__main__":
+    unittest.main()
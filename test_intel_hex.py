@@ -0,0 +1,49 @@
+import os
+import unittest
+
+from intel_hex import HexImage, IntelHexError
+
+HEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Hex")
+
+class HexImageTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for name in ("LE_Final.hex", "LE_Test.ino.hex", "LED_Blink.ino.hex"):
+            image = HexImage.load(os.path.join(HEX_DIR, name))
+            text = image.to_ihex()
+            again = HexImage.parse(text)
+            self.assertEqual(again.segments, image.segments, name)
+            self.assertEqual(bytes(again.view()), bytes(image.view()), name)
+            self.assertEqual(again.to_ihex(), text, name)
+
+    def test_checksum_error(self):
+        text = HexImage.from_bytes(bytes(range(16))).to_ihex()
+        record = text.splitlines()[0]
+        broken = record[:-2] + f"{(int(record[-2:], 16) + 1) & 0xFF:02X}"
+        with self.assertRaises(IntelHexError):
+            HexImage.parse(text.replace(record, broken))
+
+    def test_views_survive_diff_with_a_larger_image(self):
+        small = HexImage.from_bytes(b'\x01' * 100)
+        large = HexImage.from_bytes(b'\x01' * 100 + b'\x02' * 200)
+        pages = small.pages(64)
+        view = small.view()
+
+        self.assertEqual(small.diff(large, 64), [64, 128, 192, 256])
+        self.assertEqual(large.diff(small, 64), [64, 128, 192, 256])
+        page = small.page(small.end + 64, 64)
+        self.assertEqual(bytes(page), b'\xff' * 64)
+
+        # The views handed out earlier still read the image
+        self.assertEqual(bytes(pages[0]), b'\x01' * 64)
+        self.assertEqual(bytes(pages[64]), b'\x01' * 36 + b'\xff' * 28)
+        self.assertEqual(bytes(view), b'\x01' * 100)
+
+    def test_pages_of_images_with_different_sizes(self):
+        image = HexImage.from_bytes(b'\xaa' * 10, address=130)
+        self.assertEqual(list(image.pages(64)), [128])
+        self.assertEqual(bytes(image.page(128, 64)), b'\xff' * 2 + b'\xaa' * 10 + b'\xff' * 52)
+        self.assertEqual(image.diff(HexImage.from_bytes(b'\xaa' * 10, address=130), 64), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+
+from le_protocol import AsciiDecoder, SAMPLE_LINES
+
+def regex_columns(body):
+    """Reference parse: the regex pass alone, line by line."""
+    columns = ([], [], [])
+    for line in body.split(b'\n'):
+        match = SAMPLE_LINES.match(line)
+        if match:
+            for column, field in zip(columns, match.groups()):
+                column.append(int(field))
+    return columns
+
+def random_field(rng, digits):
+    """A number as LE_Reader prints it, sometimes with too many digits, a sign or a leading zero."""
+    roll = rng.random()
+    if roll < 0.1:
+        number = str(rng.randint(10 ** digits, 10 ** (digits + 2)))
+    elif roll < 0.15:
+        number = '0' + str(rng.randint(0, 10 ** digits))
+    else:
+        number = str(rng.randint(0, 10 ** digits - 1))
+    return ('-' if rng.random() < 0.2 else '') + number
+
+class AsciiDecoderTest(unittest.TestCase):
+    """The JSON fast path must accept exactly the lines the regex pass accepts."""
+
+    def test_fast_path_matches_regex_pass(self):
+        rng = random.Random(1616)
+        for _ in range(2000):
+            lines = [f"{random_field(rng, 3)},{random_field(rng, 6)},{random_field(rng, 6)}\r\n".encode()
+                     for _ in range(rng.randint(1, 6))]
+            chunk = b''.join(lines)
+
+            decoder = AsciiDecoder()
+            parsed = decoder.columns(chunk)
+            expected = regex_columns(chunk[:-1])
+            self.assertEqual(tuple(map(list, parsed)), expected, chunk)
+
+    def test_line_acceptance_does_not_depend_on_the_chunk(self):
+        good = b'8,12,-34\r\n'
+        for line in (b'1234,1,1\r\n', b'8,1234567,1\r\n', b'8,1,-1234567\r\n', b'-8,1,1\r\n', b'-0,1,1\r\n'):
+            alone = AsciiDecoder().columns(line)
+            with_good = AsciiDecoder().columns(good + line + good)
+            self.assertEqual(alone, ([], [], []))
+            self.assertEqual(with_good, ([8, 8], [12, 12], [-34, -34]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from avrdude_runner import run_avrdude
+from programmer_baud import BaudMemory, JTAG2UPDI_BAUD_RATES, LINK_ERRORS, run_with_fallback
+
+# avrdude -c jtag2updi output for each way a link rate can fail, with the
+# messages of avrdude's jtagmkII driver. The driver signs on at 19200 and then
+# asks the programmer to switch to the -b rate.
+HEADER = ("avrdude: Version 6.3-20190619\n"
+          "         Using Port                    : /dev/ttyUSB0\n"
+          "         Using Programmer              : jtag2updi\n"
+          "         Overriding Baud Rate          : {rate}\n")
+TRANSCRIPTS = {
+    # Not in the driver's table of rates; it stays at 19200
+    'unsupported': "avrdude: jtagmkII_open(): unsupported baudrate: {rate}\n",
+    # The programmer refused the switch; the driver stays at 19200
+    'refused': ("avrdude: jtagmkII_setparm(): bad response to set parameter command: RSP_FAILED\n"
+                "JTAG ICE mkII sign-on message:\n"),
+    # Both sides switched, but the programmer's UART is too far off the rate
+    'garbled': ("avrdude: jtagmkII_program_enable(): timeout/error communicating with programmer (status -1)\n"
+                "avrdude: initialization failed, rc=-1\n"),
+    'silent': "",
+    'wrong_part': ("avrdude: Device signature = 0x1e9422 (probably t1614)\n"
+                   "avrdude: Expected signature for ATtiny1616 is 1E 94 21\n"),
+    'ok': ("avrdude: AVR device initialized and ready to accept instructions\n"
+           "avrdude: writing flash (1024 bytes):\n"
+           "avrdude done.  Thank you.\n")
+}
+
+FAKE_AVRDUDE = '''#!{python}
+import sys, json, time
+rate = next(arg[2:] for arg in sys.argv[1:] if arg.startswith('-b'))
+with open({log!r}, 'a') as f:
+    f.write(rate + '\\n')
+behaviour = json.load(open({behaviours!r})).get(rate, 'ok')
+sys.stdout.write({header!r}.format(rate=rate) + json.load(open({transcripts!r}))[behaviour].format(rate=rate))
+sys.stdout.flush()
+if behaviour == 'silent':
+    time.sleep(30)
+sys.exit(0 if behaviour == 'ok' else 1)
+'''
+
+class FallbackTest(unittest.TestCase):
+    """Run the fallback against a fake avrdude that fails per rate as configured."""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='le_baud_test_')
+        self.log = os.path.join(self.work_dir, 'rates.log')
+        self.behaviours = os.path.join(self.work_dir, 'behaviours.json')
+        transcripts = os.path.join(self.work_dir, 'transcripts.json')
+        with open(transcripts, 'w') as f:
+            json.dump(TRANSCRIPTS, f)
+        script = os.path.join(self.work_dir, 'avrdude.py')
+        with open(script, 'w') as f:
+            f.write(FAKE_AVRDUDE.format(python=sys.executable, log=self.log, behaviours=self.behaviours,
+                                        header=HEADER, transcripts=transcripts))
+        os.chmod(script, 0o755)
+        # run_with_fallback puts -b right after the program, so the script has to be the program
+        self.cmd = [script, '-cjtag2updi', '-Uflash:w:LE_Final.hex:i']
+        self.memory = BaudMemory(os.path.join(self.work_dir, 'programmer_baud.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _behave(self, behaviours):
+        with open(self.behaviours, 'w') as f:
+            json.dump({str(rate): behaviour for rate, behaviour in behaviours.items()}, f)
+        if os.path.exists(self.log):
+            os.remove(self.log)
+
+    def _tried(self):
+        with open(self.log) as f:
+            return [int(line) for line in f.read().split()]
+
+    def test_rate_failures_are_link_errors(self):
+        for behaviour in ('unsupported', 'refused', 'garbled', 'silent'):
+            with self.subTest(behaviour=behaviour):
+                self._behave({1000000: behaviour})
+                run = run_avrdude([self.cmd[0], '-b1000000'] + self.cmd[1:], timeout=2)
+                self.assertFalse(run.success)
+                self.assertIn(run.error['kind'], LINK_ERRORS)
+
+    def test_first_upload_falls_back_and_second_starts_there(self):
+        self._behave({1000000: 'refused', 500000: 'garbled'})
+        run, rate = run_with_fallback(self.cmd, '/dev/ttyUSB0', memory=self.memory, timeout=5)
+        self.assertTrue(run.success)
+        self.assertEqual(rate, 115200)
+        self.assertEqual(self._tried(), list(JTAG2UPDI_BAUD_RATES))
+        self.assertEqual(BaudMemory(self.memory.cache_file).get('/dev/ttyUSB0'), 115200)
+
+        self._behave({1000000: 'refused', 500000: 'garbled'})
+        run, rate = run_with_fallback(self.cmd, '/dev/ttyUSB0', memory=self.memory, timeout=5)
+        self.assertTrue(run.success)
+        self.assertEqual(self._tried(), [115200])
+
+    def test_target_errors_do_not_fall_back(self):
+        self._behave({1000000: 'wrong_part'})
+        run, rate = run_with_fallback(self.cmd, '/dev/ttyUSB0', memory=self.memory, timeout=5)
+        self.assertEqual(run.error['kind'], 'signature_mismatch')
+        self.assertEqual(rate, 1000000)
+        self.assertEqual(self._tried(), [1000000])
+        self.assertIsNone(self.memory.get('/dev/ttyUSB0'))
+
+if __name__ == "__main__":
+    unittest.main()
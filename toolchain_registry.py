@@ -0,0 +1,305 @@
+import os
+import sys
+import glob
+import json
+import shutil
+import platform
+import subprocess
+import tempfile
+
+# Tool versions the project was developed with; they win over other installed versions
+PREFERRED_VERSIONS = {
+    'avrdude': '6.3.0-arduino17or18',
+    'avr-gcc': '7.3.0-atmel3.6.1-azduino7b1',
+    'megaTinyCore': '2.6.10'
+}
+
+def _exe(name):
+    """Executable file name on this platform."""
+    return name + '.exe' if platform.system() == 'Windows' else name
+
+def _arduino15_dirs():
+    """Arduino15 data directories of the IDE (boards manager packages live here)."""
+    home = os.path.expanduser('~')
+    dirs = [
+        os.path.join(os.environ.get('LOCALAPPDATA', os.path.join(home, 'AppData', 'Local')), 'Arduino15'),
+        os.path.join(home, 'AppData', 'Local', 'Arduino15'),
+        os.path.join(home, '.arduino15'),
+        os.path.join(home, 'Library', 'Arduino15')
+    ]
+    return list(dict.fromkeys(dirs))
+
+def _arduino_cache_dirs():
+    """Directories where Arduino IDE 2 keeps compiled cores."""
+    home = os.path.expanduser('~')
+    dirs = [
+        os.path.join(os.environ.get('LOCALAPPDATA', os.path.join(home, 'AppData', 'Local')), 'arduino', 'cores'),
+        os.path.join(home, 'AppData', 'Local', 'arduino', 'cores'),
+        os.path.join(home, '.cache', 'arduino', 'cores'),
+        os.path.join(home, 'Library', 'Caches', 'arduino', 'cores')
+    ]
+    return list(dict.fromkeys(dirs))
+
+def _package_candidates(pattern, preferred):
+    """Glob pattern over every Arduino15 directory, preferred version first, then newest first."""
+    matches = []
+    for arduino15 in _arduino15_dirs():
+        matches.extend(glob.glob(os.path.join(arduino15, pattern)))
+    # Version directories sort newest first; the preferred version goes in front
+    matches.sort(reverse=True)
+    matches.sort(key=lambda path: preferred not in path.split(os.sep))
+    return matches
+
+def _find_avrdude():
+    """Find avrdude, preferring the boards manager builds that know jtag2updi."""
+    candidates = _package_candidates(os.path.join('packages', '*', 'tools', 'avrdude', '*', 'bin', _exe('avrdude')),
+                                     PREFERRED_VERSIONS['avrdude'])
+    candidates += [
+        os.path.join(os.environ.get('ProgramFiles', 'C:\\Program Files'), 'Arduino', 'hardware', 'tools', 'avr', 'bin', 'avrdude.exe'),
+        os.path.join(os.environ.get('ProgramFiles(x86)', 'C:\\Program Files (x86)'), 'Arduino', 'hardware', 'tools', 'avr', 'bin', 'avrdude.exe'),
+        '/Applications/Arduino.app/Contents/Java/hardware/tools/avr/bin/avrdude',
+        os.path.expanduser('~/Applications/Arduino.app/Contents/Java/hardware/tools/avr/bin/avrdude')
+    ]
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+
+    # Distribution packages (apt install avrdude) or anything else on PATH
+    for path in (shutil.which('avrdude'), '/usr/bin/avrdude', '/usr/local/bin/avrdude'):
+        if path and os.path.isfile(path):
+            return path
+
+    return None
+
+def _find_avr_gcc():
+    """Find the bin directory holding avr-gcc and its binutils."""
+    candidates = _package_candidates(os.path.join('packages', '*', 'tools', 'avr-gcc', '*', 'bin'),
+                                     PREFERRED_VERSIONS['avr-gcc'])
+    candidates += [
+        os.path.join(os.environ.get('ProgramFiles', 'C:\\Program Files'), 'Arduino', 'hardware', 'tools', 'avr', 'bin'),
+        os.path.join(os.environ.get('ProgramFiles(x86)', 'C:\\Program Files (x86)'), 'Arduino', 'hardware', 'tools', 'avr', 'bin')
+    ]
+
+    which = shutil.which('avr-gcc')
+    if which:
+        candidates.append(os.path.dirname(which))
+    candidates += ['/usr/bin', '/usr/local/bin']
+
+    for path in candidates:
+        if os.path.isfile(os.path.join(path, _exe('avr-gcc'))):
+            return path
+
+    return None
+
+def _find_megatinycore():
+    """Find the megaTinyCore hardware directory."""
+    candidates = _package_candidates(os.path.join('packages', 'megaTinyCore', 'hardware', 'megaavr', '*'),
+                                     PREFERRED_VERSIONS['megaTinyCore'])
+    for path in candidates:
+        if os.path.isdir(os.path.join(path, 'cores', 'megatinycore')):
+            return path
+    return None
+
+def _find_avrdude_conf(avrdude, core_path):
+    """Find the avrdude.conf that goes with an avrdude executable."""
+    candidates = []
+    if avrdude:
+        avrdude_dir = os.path.dirname(avrdude)
+        candidates += [
+            os.path.join(avrdude_dir, 'avrdude.conf'),
+            os.path.join(os.path.dirname(avrdude_dir), 'etc', 'avrdude.conf'),
+            os.path.join(os.path.dirname(os.path.dirname(avrdude_dir)), 'etc', 'avrdude.conf')
+        ]
+    if core_path:
+        candidates.append(os.path.join(core_path, 'avrdude.conf'))
+    candidates += ['/etc/avrdude.conf', '/usr/local/etc/avrdude.conf']
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+def _find_core_a():
+    """Find a megaTinyCore core.a left behind by an Arduino IDE build."""
+    for cores_dir in _arduino_cache_dirs():
+        if not os.path.isdir(cores_dir):
+            continue
+        for root, dirs, files in os.walk(cores_dir):
+            if 'core.a' in files:
+                return os.path.join(root, 'core.a')
+    return None
+
+def _tool_version(path, args):
+    """First line of a tool's version output, used as its fingerprint."""
+    try:
+        result = subprocess.run([path] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    lines = result.stdout.splitlines()
+    if args != ['--version']:
+        # avrdude has no --version; its usage text ends with "avrdude version X"
+        lines = [line for line in lines if 'version' in line.lower()]
+    return lines[0].strip() if lines else None
+
+class ToolchainRegistry:
+    """Discovers the AVR toolchain once and remembers it across runs.
+
+    Entries are stored in a cache file with the mtime of every path. A cached
+    entry is used as long as its mtime is unchanged; if an executable changed,
+    its --version output is taken again so callers that key on the toolchain
+    version see the update. Lookups after loading are plain dictionary reads.
+    """
+
+    # Entry name -> version arguments for executables (None for plain files/directories)
+    ENTRIES = {
+        'avrdude': ['-?'],
+        'avr_gcc': ['--version'],
+        'core_path': None,
+        'avrdude_conf': None,
+        'core_a': None
+    }
+
+    def __init__(self, cache_file=None):
+        """Load the registry from cache_file, discovering anything that is missing or stale."""
+        if cache_file is None:
+            cache_file = os.path.join(tempfile.gettempdir(), 'arduino_compiler', 'toolchain.json')
+
+        self.cache_file = cache_file
+        self.entries = {}
+        self._load()
+
+    def _stamp(self, path):
+        """mtime of a path in nanoseconds, or None if it is gone."""
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def _version_target(self, name, path):
+        """The executable whose version identifies an entry."""
+        if name == 'avr_gcc':
+            return os.path.join(path, _exe('avr-gcc'))
+        return path
+
+    def _make_entry(self, name, path):
+        """Create a cache entry for a discovered path."""
+        entry = {'path': path, 'mtime': None, 'version': None}
+        if path is None:
+            return entry
+
+        target = self._version_target(name, path)
+        entry['mtime'] = self._stamp(target)
+        if self.ENTRIES[name] is not None:
+            entry['version'] = _tool_version(target, self.ENTRIES[name])
+        return entry
+
+    def _is_valid(self, name, entry):
+        """Check a cached entry; refresh its version if the tool was updated in place."""
+        path = entry.get('path')
+        if path is None:
+            return False
+
+        target = self._version_target(name, path)
+        mtime = self._stamp(target)
+        if mtime is None:
+            return False
+        if mtime == entry.get('mtime'):
+            return True
+
+        # Same location but a different file: take a new fingerprint
+        entry.update(self._make_entry(name, path))
+        return True
+
+    def _discover(self, name):
+        """Run the filesystem search for one entry."""
+        if name == 'avrdude':
+            return _find_avrdude()
+        if name == 'avr_gcc':
+            return _find_avr_gcc()
+        if name == 'core_path':
+            return _find_megatinycore()
+        if name == 'avrdude_conf':
+            return _find_avrdude_conf(self.get('avrdude'), self.get('core_path'))
+        if name == 'core_a':
+            return _find_core_a()
+        return None
+
+    def _load(self):
+        """Read the cache file and validate or rediscover every entry."""
+        cached = {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+        changed = False
+        for name in self.ENTRIES:
+            entry = cached.get(name)
+            if entry is not None:
+                before = dict(entry)
+                if self._is_valid(name, entry):
+                    self.entries[name] = entry
+                    changed = changed or entry != before
+                    continue
+
+            # Missing entries are searched for again, so a later install is picked up
+            self.entries[name] = self._make_entry(name, self._discover(name))
+            changed = changed or self.entries[name] != entry
+
+        if changed:
+            self._save()
+
+    def _save(self):
+        """Write the registry to the cache file."""
+        cache_dir = os.path.dirname(self.cache_file)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=4)
+        os.replace(tmp_path, self.cache_file)
+
+    def get(self, name):
+        """Return the path registered for name, or None."""
+        entry = self.entries.get(name)
+        return entry['path'] if entry else None
+
+    def version(self, name):
+        """Return the version fingerprint recorded for name, or None."""
+        entry = self.entries.get(name)
+        return entry['version'] if entry else None
+
+    def refresh(self):
+        """Forget the cached entries and search the filesystem again."""
+        self.entries = {}
+        for name in self.ENTRIES:
+            self.entries[name] = self._make_entry(name, self._discover(name))
+        self._save()
+
+_registry = None
+
+def get_registry():
+    """Return the process-wide toolchain registry, loading it on first use."""
+    global _registry
+    if _registry is None:
+        _registry = ToolchainRegistry()
+    return _registry
+
+def main():
+    """Main function for standalone usage."""
+    registry = get_registry()
+    if len(sys.argv) > 1 and sys.argv[1] == "--refresh":
+        registry.refresh()
+
+    print(f"Toolchain registry: {registry.cache_file}")
+    for name in registry.ENTRIES:
+        path = registry.get(name)
+        version = registry.version(name)
+        print(f"  {name:13} {path or 'not found'}" + (f" ({version})" if version else ""))
+
+if __name__ == "__main__":
+    main()
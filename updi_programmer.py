@@ -0,0 +1,606 @@
+import os
+import sys
+import time
+import hashlib
+import serial
+
+from intel_hex import HexImage
+
+# UPDI physical layer
+UPDI_BREAK = 0x00
+UPDI_SYNC = 0x55
+UPDI_ACK = 0x40
+
+# UPDI instructions
+UPDI_LDS = 0x00
+UPDI_STS = 0x40
+UPDI_LD = 0x20
+UPDI_ST = 0x60
+UPDI_LDCS = 0x80
+UPDI_STCS = 0xC0
+UPDI_REPEAT = 0xA0
+UPDI_KEY = 0xE0
+
+UPDI_PTR_INC = 0x04
+UPDI_PTR_ADDRESS = 0x08
+UPDI_ADDRESS_16 = 0x04
+UPDI_DATA_8 = 0x00
+UPDI_DATA_16 = 0x01
+UPDI_KEY_SIB = 0x04
+UPDI_KEY_64 = 0x00
+UPDI_SIB_16BYTES = 0x01
+
+# UPDI control/status registers
+UPDI_CS_STATUSA = 0x00
+UPDI_CS_CTRLA = 0x02
+UPDI_CS_CTRLB = 0x03
+UPDI_ASI_KEY_STATUS = 0x07
+UPDI_ASI_RESET_REQ = 0x08
+UPDI_ASI_SYS_STATUS = 0x0B
+
+UPDI_CTRLA_IBDLY_BIT = 7
+UPDI_CTRLB_CCDETDIS_BIT = 3
+UPDI_CTRLB_UPDIDIS_BIT = 2
+UPDI_ASI_KEY_STATUS_NVMPROG = 4
+UPDI_ASI_SYS_STATUS_NVMPROG = 3
+UPDI_ASI_SYS_STATUS_LOCKSTATUS = 0
+UPDI_RESET_REQ_VALUE = 0x59
+
+# Keys are sent least significant byte first
+UPDI_KEY_NVM = b'NVMProg '
+
+# tinyAVR 0/1-series memory map (NVM controller version 0)
+NVMCTRL_BASE = 0x1000
+NVMCTRL_CTRLA = 0x00
+NVMCTRL_STATUS = 0x02
+NVMCTRL_DATAL = 0x06
+NVMCTRL_ADDRL = 0x08
+NVMCTRL_ADDRH = 0x09
+
+NVMCTRL_CMD_WP = 0x01
+NVMCTRL_CMD_ER = 0x02
+NVMCTRL_CMD_ERWP = 0x03
+NVMCTRL_CMD_PBC = 0x04
+NVMCTRL_CMD_CHER = 0x05
+NVMCTRL_CMD_WFU = 0x07
+
+NVMCTRL_STATUS_FBUSY = 0
+NVMCTRL_STATUS_EEBUSY = 1
+NVMCTRL_STATUS_WRERROR = 2
+
+SIGROW_BASE = 0x1100
+FUSE_BASE = 0x1280
+FLASH_BASE = 0x8000
+
+# Supported targets: signature -> (name, flash size, page size)
+DEVICES = {
+    bytes([0x1E, 0x94, 0x21]): ('attiny1616', 16384, 64),
+    bytes([0x1E, 0x94, 0x22]): ('attiny1614', 16384, 64)
+}
+
+class UpdiError(Exception):
+    """Raised when the UPDI target does not respond as expected."""
+
+class VerifyError(UpdiError):
+    """Raised when flash read back after programming does not match the image."""
+
+class UpdiLink:
+    """UPDI data link over a serial adapter with TX and RX joined (SerialUPDI wiring).
+
+    The line is half duplex, so every byte sent comes back as an echo that is
+    read and checked before the reply.
+    """
+
+    def __init__(self, port, baud_rate=115200, timeout=1):
+        """Open the serial port in UPDI framing (8 data bits, even parity, 2 stop bits)."""
+        self.port = port
+        self.baud_rate = baud_rate
+        self.ser = serial.Serial(port, baud_rate, parity=serial.PARITY_EVEN,
+                                 stopbits=serial.STOPBITS_TWO, timeout=timeout)
+        # The interface state is unknown until a double break resets it
+        self.active = False
+        # Bytes on the wire, for estimating transfer time at the real baud rate
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def close(self):
+        """Close the serial port."""
+        self.ser.close()
+
+    def set_baud_rate(self, baud_rate):
+        """Switch the link rate; the next init() resynchronises the target with a double break."""
+        if baud_rate != self.ser.baudrate:
+            self.ser.baudrate = baud_rate
+        self.baud_rate = baud_rate
+        self.active = False
+
+    def _send(self, data):
+        """Send bytes and consume their echo."""
+        data = bytes(data)
+        self.bytes_sent += len(data)
+        self.ser.write(data)
+        echo = self.ser.read(len(data))
+        if echo != data:
+            raise UpdiError(f"Bad echo on {self.port}: sent {data.hex()}, got {echo.hex()}")
+
+    def _receive(self, size):
+        """Read size reply bytes."""
+        data = self.ser.read(size)
+        self.bytes_received += len(data)
+        if len(data) != size:
+            raise UpdiError(f"Timeout on {self.port}: expected {size} bytes, got {len(data)}")
+        return data
+
+    def _expect_ack(self):
+        """Read one ACK byte."""
+        reply = self._receive(1)
+        if reply[0] != UPDI_ACK:
+            raise UpdiError(f"Expected ACK, got 0x{reply[0]:02x}")
+
+    def send_double_break(self):
+        """Reset the UPDI interface with two long break characters."""
+        self.ser.reset_input_buffer()
+        self.ser.baudrate = 300
+        self.ser.write(bytes([UPDI_BREAK, UPDI_BREAK]))
+        self.ser.read(2)
+        self.ser.baudrate = self.baud_rate
+        self.ser.reset_input_buffer()
+
+    def init(self):
+        """Enable the link: inter-byte delay on, collision detection off."""
+        if self.active:
+            return
+
+        self.send_double_break()
+        try:
+            self.stcs(UPDI_CS_CTRLB, 1 << UPDI_CTRLB_CCDETDIS_BIT)
+            self.stcs(UPDI_CS_CTRLA, 1 << UPDI_CTRLA_IBDLY_BIT)
+            if self.ldcs(UPDI_CS_STATUSA) != 0:
+                self.active = True
+                return
+        except UpdiError:
+            pass
+        raise UpdiError(f"No UPDI target responding on {self.port}")
+
+    def ldcs(self, address):
+        """Load a UPDI control/status register."""
+        self._send([UPDI_SYNC, UPDI_LDCS | (address & 0x0F)])
+        return self._receive(1)[0]
+
+    def stcs(self, address, value):
+        """Store a UPDI control/status register."""
+        self._send([UPDI_SYNC, UPDI_STCS | (address & 0x0F), value])
+
+    def ld(self, address):
+        """Load one byte from the data space."""
+        self._send([UPDI_SYNC, UPDI_LDS | UPDI_ADDRESS_16 | UPDI_DATA_8, address & 0xFF, (address >> 8) & 0xFF])
+        return self._receive(1)[0]
+
+    def st(self, address, value):
+        """Store one byte to the data space."""
+        self._send([UPDI_SYNC, UPDI_STS | UPDI_ADDRESS_16 | UPDI_DATA_8, address & 0xFF, (address >> 8) & 0xFF])
+        self._expect_ack()
+        self._send([value])
+        self._expect_ack()
+
+    def _set_pointer(self, address):
+        """Load the UPDI pointer register."""
+        self._send([UPDI_SYNC, UPDI_ST | UPDI_PTR_ADDRESS | UPDI_DATA_16, address & 0xFF, (address >> 8) & 0xFF])
+        self._expect_ack()
+
+    def _repeat(self, count):
+        """Repeat the next instruction count times."""
+        self._send([UPDI_SYNC, UPDI_REPEAT, (count - 1) & 0xFF])
+
+    def read(self, address, size):
+        """Read up to 256 bytes from the data space."""
+        self._set_pointer(address)
+        if size > 1:
+            self._repeat(size)
+        self._send([UPDI_SYNC, UPDI_LD | UPDI_PTR_INC | UPDI_DATA_8])
+        return self._receive(size)
+
+    def write(self, address, data):
+        """Write up to 256 bytes to the data space."""
+        self._set_pointer(address)
+        if len(data) > 1:
+            self._repeat(len(data))
+        self._send([UPDI_SYNC, UPDI_ST | UPDI_PTR_INC | UPDI_DATA_8, data[0]])
+        self._expect_ack()
+        for byte in data[1:]:
+            self._send([byte])
+            self._expect_ack()
+
+    def key(self, key):
+        """Send a 64-bit activation key."""
+        self._send([UPDI_SYNC, UPDI_KEY | UPDI_KEY_64])
+        self._send(bytes(reversed(key)))
+
+    def read_sib(self):
+        """Read the 16-byte System Information Block."""
+        self._send([UPDI_SYNC, UPDI_KEY | UPDI_KEY_SIB | UPDI_SIB_16BYTES])
+        return self._receive(16)
+
+class UpdiSession:
+    """Programming session with an ATtiny1616 over UPDI.
+
+    The serial port stays open for the life of the session. Programming mode
+    is entered on the first operation that needs it and left with release(),
+    which resets the target into its application; the next operation enters
+    programming mode again without reopening the port.
+    """
+
+    def __init__(self, port, baud_rate=115200, timeout=1):
+        """Open the UPDI link on port."""
+        self.link = UpdiLink(port, baud_rate, timeout)
+        self.port = port
+        self.in_progmode = False
+        self.device = None
+        # Device id -> {page address: page bytes} last programmed by this session
+        self.flash_baselines = {}
+
+    def close(self):
+        """Release the target and close the port."""
+        try:
+            if self.in_progmode:
+                self.release()
+        finally:
+            self.link.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reset(self):
+        """Pulse the target reset through the UPDI reset request register."""
+        self.link.stcs(UPDI_ASI_RESET_REQ, UPDI_RESET_REQ_VALUE)
+        self.link.stcs(UPDI_ASI_RESET_REQ, 0x00)
+
+    def enter_progmode(self):
+        """Unlock the NVM controller and halt the target in programming mode."""
+        if self.in_progmode:
+            return
+
+        self.link.init()
+
+        # Still in programming mode from an earlier session on the same port
+        if self.link.ldcs(UPDI_ASI_SYS_STATUS) & (1 << UPDI_ASI_SYS_STATUS_NVMPROG):
+            self.in_progmode = True
+            self._identify()
+            return
+
+        self.link.key(UPDI_KEY_NVM)
+        if not self.link.ldcs(UPDI_ASI_KEY_STATUS) & (1 << UPDI_ASI_KEY_STATUS_NVMPROG):
+            raise UpdiError("Target did not accept the NVMPROG key")
+
+        self._reset()
+
+        deadline = time.monotonic() + 0.5
+        while self.link.ldcs(UPDI_ASI_SYS_STATUS) & (1 << UPDI_ASI_SYS_STATUS_LOCKSTATUS):
+            if time.monotonic() > deadline:
+                raise UpdiError("Target is locked; a chip erase is needed to unlock it")
+            time.sleep(0.001)
+
+        if not self.link.ldcs(UPDI_ASI_SYS_STATUS) & (1 << UPDI_ASI_SYS_STATUS_NVMPROG):
+            raise UpdiError("Target did not enter programming mode")
+
+        self.in_progmode = True
+        self._identify()
+
+    def release(self):
+        """Leave programming mode and let the target run its application.
+
+        The UPDI interface is disabled, which clears the NVMPROG key; the
+        serial port stays open for the next operation.
+        """
+        self._reset()
+        self.link.stcs(UPDI_CS_CTRLB, (1 << UPDI_CTRLB_UPDIDIS_BIT) | (1 << UPDI_CTRLB_CCDETDIS_BIT))
+        self.link.active = False
+        self.in_progmode = False
+
+    def _identify(self):
+        """Read the signature and look up the device geometry."""
+        signature = self.link.read(SIGROW_BASE, 3)
+        if signature not in DEVICES:
+            raise UpdiError(f"Unsupported device signature {signature.hex()}")
+        self.device = DEVICES[signature]
+
+    def device_id(self):
+        """Signature and serial number of the target as a hex string."""
+        self.enter_progmode()
+        return (self.link.read(SIGROW_BASE, 3) + self.link.read(SIGROW_BASE + 3, 10)).hex()
+
+    def signature(self):
+        """Return the three signature bytes."""
+        self.enter_progmode()
+        return self.link.read(SIGROW_BASE, 3)
+
+    def _wait_nvm_ready(self, timeout=0.5):
+        """Wait for the NVM controller to finish the current operation."""
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.link.ld(NVMCTRL_BASE + NVMCTRL_STATUS)
+            if status & (1 << NVMCTRL_STATUS_WRERROR):
+                raise UpdiError("NVM write error")
+            if not status & ((1 << NVMCTRL_STATUS_FBUSY) | (1 << NVMCTRL_STATUS_EEBUSY)):
+                return
+            if time.monotonic() > deadline:
+                raise UpdiError("Timeout waiting for the NVM controller")
+
+    def _nvm_command(self, command):
+        """Run an NVM controller command and wait for it to complete."""
+        self.link.st(NVMCTRL_BASE + NVMCTRL_CTRLA, command)
+        self._wait_nvm_ready()
+
+    def chip_erase(self):
+        """Erase the whole flash (and EEPROM unless EESAVE is set)."""
+        self.enter_progmode()
+        self._wait_nvm_ready()
+        self._nvm_command(NVMCTRL_CMD_CHER)
+
+    def read_fuses(self, count=11):
+        """Read fuse bytes 0..count-1 in one block."""
+        self.enter_progmode()
+        return self.link.read(FUSE_BASE, count)
+
+    def write_fuse(self, number, value):
+        """Write one fuse byte."""
+        self.enter_progmode()
+        self._wait_nvm_ready()
+        address = FUSE_BASE + number
+        self.link.st(NVMCTRL_BASE + NVMCTRL_ADDRL, address & 0xFF)
+        self.link.st(NVMCTRL_BASE + NVMCTRL_ADDRH, (address >> 8) & 0xFF)
+        self.link.st(NVMCTRL_BASE + NVMCTRL_DATAL, value)
+        self._nvm_command(NVMCTRL_CMD_WFU)
+
+    def write_page(self, address, data):
+        """Write one flash page; the page must be erased.
+
+        Args:
+            address (int): Flash offset of the page (not the data space address)
+            data (bytes): Page contents, exactly one page long
+        """
+        self.enter_progmode()
+        self._wait_nvm_ready()
+        self._nvm_command(NVMCTRL_CMD_PBC)
+        self.link.write(FLASH_BASE + address, data)
+        self._nvm_command(NVMCTRL_CMD_WP)
+
+    def erase_write_page(self, address, data):
+        """Erase one flash page and write it in a single NVM operation."""
+        self.enter_progmode()
+        self._wait_nvm_ready()
+        self._nvm_command(NVMCTRL_CMD_PBC)
+        self.link.write(FLASH_BASE + address, data)
+        self._nvm_command(NVMCTRL_CMD_ERWP)
+
+    def erase_page(self, address):
+        """Erase one flash page."""
+        self.enter_progmode()
+        self._wait_nvm_ready()
+        self._nvm_command(NVMCTRL_CMD_PBC)
+        # A dummy write to the page buffer selects the page to erase
+        self.link.st(FLASH_BASE + address, 0xFF)
+        self._nvm_command(NVMCTRL_CMD_ER)
+
+    def read_flash(self, address, size):
+        """Read size bytes of flash starting at flash offset address."""
+        self.enter_progmode()
+        data = bytearray()
+        while len(data) < size:
+            chunk = min(256, size - len(data))
+            data += self.link.read(FLASH_BASE + address + len(data), chunk)
+        return bytes(data)
+
+    def flash_digest(self, start, end):
+        """SHA-256 of flash offsets start..end-1 as read from the device."""
+        return hashlib.sha256(self.read_flash(start, end - start)).hexdigest()
+
+    def image_matches(self, image):
+        """Check whether the device flash already holds a HexImage, reading back only its occupied range."""
+        return self.flash_digest(image.start, image.end) == image.digest()
+
+    def verify_pages(self, pages, addresses):
+        """Read back the given pages and compare them with the image, stopping at the first mismatch.
+
+        Adjacent pages are read in runs of up to 256 bytes; each run is compared
+        by digest and only a mismatching run is searched for the bad page.
+
+        Args:
+            pages (dict): {page address: page bytes} of the image
+            addresses (iterable): Page addresses to check
+
+        Returns:
+            int: Address of the first mismatching page, or None if all match
+        """
+        page_size = self.device[2]
+        per_run = max(1, 256 // page_size)
+
+        runs = []
+        for address in sorted(addresses):
+            if runs and address == runs[-1][-1] + page_size and len(runs[-1]) < per_run:
+                runs[-1].append(address)
+            else:
+                runs.append([address])
+
+        for run in runs:
+            expected = b''.join(pages[address] for address in run)
+            actual = self.read_flash(run[0], len(expected))
+            if hashlib.sha256(actual).digest() == hashlib.sha256(expected).digest():
+                continue
+            for i, address in enumerate(run):
+                if actual[i * page_size:(i + 1) * page_size] != pages[address]:
+                    return address
+        return None
+
+    def program(self, hex_file, fuses=None, delta=False, verify='none'):
+        """Write fuses and flash an Intel HEX image.
+
+        A full flash erases the chip and writes every page of the image. With
+        delta=True and a known baseline for this device (the image this session
+        last programmed into it), only pages that differ are erased and
+        written, and pages the old image used but the new one does not are
+        erased. The flash ends up the same either way.
+
+        Args:
+            hex_file (str): Image to program
+            fuses (dict): Fuse number -> value to write before flashing
+            delta (bool): Write only changed pages when the baseline is known
+            verify (str): 'none', 'pages' to read back only the pages written, or
+                'full' to read back every page of the image
+
+        Returns:
+            dict: 'written', 'erased' and 'skipped' page counts, and 'full' (bool)
+
+        Raises:
+            VerifyError: A page read back differs from the image
+        """
+        image = HexImage.load(hex_file)
+        self.enter_progmode()
+
+        name, flash_size, page_size = self.device
+        if image.end > flash_size:
+            raise UpdiError(f"Image does not fit in the {flash_size} byte flash of the {name}")
+
+        for number, value in sorted((fuses or {}).items()):
+            self.write_fuse(number, value)
+
+        pages = image.pages(page_size)
+        identity = self.device_id()
+        baseline = self.flash_baselines.pop(identity, None) if delta else None
+        summary = {'written': 0, 'erased': 0, 'skipped': 0, 'full': baseline is None}
+
+        written = []
+        if baseline is None:
+            self.chip_erase()
+            for address, data in pages.items():
+                self.write_page(address, data)
+                written.append(address)
+        else:
+            blank = bytes([0xFF]) * page_size
+            for address, data in pages.items():
+                if baseline.get(address, blank) == data:
+                    summary['skipped'] += 1
+                    continue
+                self.erase_write_page(address, data)
+                written.append(address)
+            for address in baseline:
+                if address not in pages and baseline[address] != blank:
+                    self.erase_page(address)
+                    summary['erased'] += 1
+        summary['written'] = len(written)
+
+        if verify != 'none':
+            bad_page = self.verify_pages(pages, pages if verify == 'full' else written)
+            if bad_page is not None:
+                raise VerifyError(f"Verification failed: flash page 0x{bad_page:04x} differs from the image")
+
+        # Recorded only once every page is written, so a failed upload leaves no baseline
+        self.flash_baselines[identity] = {address: bytes(data) for address, data in pages.items()}
+        return summary
+
+def benchmark_verify(hex_file, baud_rate=115200):
+    """Compare verification costs on a simulated target.
+
+    Each case programs hex_file (a full flash) or a copy with one byte changed
+    (a one-page delta flash) with no verification, with read-back of only the
+    written pages, and with read-back of every page of the image, which is
+    what avrdude's verify does. The simulated link has no baud rate, so the
+    wire time is estimated from the bytes exchanged at baud_rate with 12 bits
+    per UPDI character.
+    """
+    import tempfile
+    from updi_simulator import SimulatedUpdiTarget
+
+    # A calibration-sized change: one byte in the middle of the image
+    variant = HexImage.load(hex_file)
+    variant.data[(variant.start + variant.end) // 2] ^= 0xFF
+    fd, variant_file = tempfile.mkstemp(suffix='.hex')
+    os.close(fd)
+    variant.write(variant_file)
+
+    target = SimulatedUpdiTarget()
+    port = target.start()
+    results = []
+    try:
+        with UpdiSession(port) as session:
+            for label, delta in (('full flash', False), ('1-page delta', True)):
+                for verify in ('none', 'pages', 'full'):
+                    # Start every case from the original image on the device
+                    session.program(hex_file)
+                    link = session.link
+                    sent, received = link.bytes_sent, link.bytes_received
+                    start_time = time.perf_counter()
+                    summary = session.program(variant_file if delta else hex_file, delta=delta, verify=verify)
+                    elapsed = time.perf_counter() - start_time
+                    wire_bytes = link.bytes_sent - sent + link.bytes_received - received
+                    results.append((label, verify, summary['written'], elapsed, wire_bytes * 12 / baud_rate))
+    finally:
+        target.stop()
+        os.remove(variant_file)
+
+    names = {'none': 'no verify', 'pages': 'written pages', 'full': 'full read-back'}
+    print(f"{'Upload':14} {'Verify':16} {'Pages':>5} {'Host ms':>8} {'Wire ms':>8} {'Overhead':>9}")
+    for label, verify, pages, elapsed, wire in results:
+        base = next(r[4] for r in results if r[0] == label and r[1] == 'none')
+        print(f"{label:14} {names[verify]:16} {pages:5d} {elapsed * 1000:8.1f} {wire * 1000:8.1f} "
+              f"{(wire - base) / base * 100:8.0f}%")
+    return results
+
+def main():
+    """Main function for standalone usage."""
+    usage = ("Usage:\n"
+             "  python updi_programmer.py <port> info\n"
+             "  python updi_programmer.py <port> flash <hex_file>\n"
+             "  python updi_programmer.py --simulate <hex_file>\n"
+             "  python updi_programmer.py --benchmark <hex_file>")
+
+    if len(sys.argv) < 3:
+        print(usage)
+        return
+
+    if sys.argv[1] == "--benchmark":
+        benchmark_verify(sys.argv[2])
+        return
+
+    if sys.argv[1] == "--simulate":
+        # Program a simulated ATtiny1616 on a pty and check the result
+        from updi_simulator import SimulatedUpdiTarget
+        from fuse_manager import FUSE_PROFILE, fuse_values
+        target = SimulatedUpdiTarget()
+        port = target.start()
+        try:
+            start_time = time.perf_counter()
+            with UpdiSession(port) as session:
+                summary = session.program(sys.argv[2], fuse_values(FUSE_PROFILE), verify='pages')
+            elapsed = time.perf_counter() - start_time
+
+            image = HexImage.load(sys.argv[2])
+            ok = target.flash[image.start:image.end] == image.view()
+            print(f"Programmed {summary['written']} pages on simulated target {port} in {elapsed:.3f}s: "
+                  f"{'flash matches image' if ok else 'FLASH MISMATCH'}")
+            sys.exit(0 if ok else 1)
+        finally:
+            target.stop()
+
+    port, command = sys.argv[1], sys.argv[2]
+    try:
+        with UpdiSession(port) as session:
+            if command == "info":
+                session.enter_progmode()
+                print(f"Device: {session.device[0]} (signature {session.signature().hex()})")
+                print(f"Fuses: {session.read_fuses().hex()}")
+            elif command == "flash" and len(sys.argv) > 3:
+                start_time = time.perf_counter()
+                summary = session.program(sys.argv[3], verify='pages')
+                print(f"Programmed {summary['written']} pages in {time.perf_counter() - start_time:.2f}s")
+            else:
+                print(usage)
+    except (UpdiError, serial.SerialException, ValueError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
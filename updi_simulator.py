@@ -0,0 +1,318 @@
+import os
+import tty
+import time
+import select
+import termios
+import threading
+
+from updi_programmer import (
+    UPDI_BREAK, UPDI_SYNC, UPDI_ACK, UPDI_LDS, UPDI_STS, UPDI_LD, UPDI_ST, UPDI_LDCS, UPDI_STCS,
+    UPDI_REPEAT, UPDI_KEY, UPDI_PTR_INC, UPDI_PTR_ADDRESS, UPDI_KEY_SIB, UPDI_KEY_NVM,
+    UPDI_CS_STATUSA, UPDI_CS_CTRLB, UPDI_ASI_KEY_STATUS, UPDI_ASI_RESET_REQ, UPDI_ASI_SYS_STATUS,
+    UPDI_CTRLB_UPDIDIS_BIT, UPDI_ASI_KEY_STATUS_NVMPROG, UPDI_ASI_SYS_STATUS_NVMPROG,
+    UPDI_RESET_REQ_VALUE, NVMCTRL_BASE, NVMCTRL_CTRLA, NVMCTRL_STATUS, NVMCTRL_DATAL, NVMCTRL_ADDRL,
+    NVMCTRL_CMD_WP, NVMCTRL_CMD_PBC, NVMCTRL_CMD_CHER, NVMCTRL_CMD_WFU, SIGROW_BASE, FUSE_BASE, FLASH_BASE
+)
+
+# Commands of the tinyAVR NVM controller that are not used by the programmer
+NVMCTRL_CMD_ER = 0x02
+NVMCTRL_CMD_ERWP = 0x03
+
+# termios speed constant -> baud rate, for pacing at the rate the host selected
+_BAUD_RATES = {getattr(termios, f"B{rate}"): rate
+               for rate in (300, 9600, 19200, 38400, 57600, 115200, 230400, 460800, 500000, 921600, 1000000)
+               if hasattr(termios, f"B{rate}")}
+
+class SimulatedUpdiTarget:
+    """An ATtiny1616 answering the UPDI protocol on a pseudo-terminal.
+
+    Point UpdiSession (or any UPDI client) at the slave side returned by
+    start(). The model covers what programming needs: the control/status
+    registers, the NVMPROG key, the signature row, fuses, and a flash array
+    behind the NVM controller with its page buffer. Like the real single-wire
+    interface, every byte received is echoed back before the reply.
+
+    A pty moves bytes as fast as they are written. With paced=True the target
+    instead holds every byte for its time on the wire at the baud rate the
+    host set on the port, and above max_baud_rate it ignores what it receives,
+    as a link whose clock error is too large would.
+    """
+
+    def __init__(self, signature=b'\x1e\x94\x21', flash_size=16384, page_size=64, serial_number=None,
+                 paced=False, max_baud_rate=None):
+        """Create a blank (erased) target."""
+        self.paced = paced
+        self.max_baud_rate = max_baud_rate
+        self._wire_time = 0.0
+        self.signature = bytes(signature)
+        self.page_size = page_size
+        self.flash = bytearray([0xFF]) * flash_size
+        self.fuses = bytearray([0x00, 0x00, 0x02, 0xFF, 0x00, 0xC4, 0x04, 0x00, 0x00, 0xFF, 0xC5])
+        self.serial_number = bytes(serial_number or os.urandom(10))
+        self.stats = {'page_writes': 0, 'fuse_writes': 0, 'chip_erases': 0, 'bytes_read': 0}
+        self._reset_state()
+        self._master = None
+        self._slave_name = None
+        self._thread = None
+        self._running = False
+
+    def _reset_state(self):
+        """Power-on state of the UPDI and NVM controller."""
+        self.enabled = True
+        self.key_status = 0
+        self.sys_status = 0
+        self.cs = bytearray(16)
+        self.cs[UPDI_CS_STATUSA] = 0x10
+        self.pointer = 0
+        self.nvm_addr = 0
+        self.nvm_data = 0
+        self.page_buffer = bytearray([0xFF]) * self.page_size
+        self.page_address = 0
+        self._reset_requested = False
+
+    def start(self):
+        """Open a pty and serve UPDI on it from a background thread.
+
+        Returns:
+            str: Path of the slave side to open as the serial port
+        """
+        master, slave = os.openpty()
+        tty.setraw(master)
+        self._master = master
+        self._slave_fd = slave
+        self._slave_name = os.ttyname(slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self._slave_name
+
+    def stop(self):
+        """Stop serving and close the pty."""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        for fd in (self._master, self._slave_fd):
+            try:
+                os.close(fd)
+            except (OSError, TypeError):
+                pass
+
+    def _line_settings(self):
+        """(baud rate, bits per character) the host configured on the slave side."""
+        attributes = termios.tcgetattr(self._slave_fd)
+        speed, cflag = attributes[5], attributes[2]
+        baud_rate = _BAUD_RATES.get(speed, 115200)
+        data_bits = {termios.CS5: 5, termios.CS6: 6, termios.CS7: 7, termios.CS8: 8}[cflag & termios.CSIZE]
+        bits = 1 + data_bits + (1 if cflag & termios.PARENB else 0) + (2 if cflag & termios.CSTOPB else 1)
+        return baud_rate, bits
+
+    def _wait_wire(self, size):
+        """Sleep until size characters would have crossed the wire at the host's baud rate."""
+        baud_rate, bits = self._line_settings()
+        now = time.perf_counter()
+        self._wire_time = max(self._wire_time, now) + size * bits / baud_rate
+        if self._wire_time > now:
+            time.sleep(self._wire_time - now)
+
+    def _serve(self):
+        """Feed received bytes through the protocol state machine."""
+        protocol = self._protocol()
+        next(protocol)
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            if self.paced:
+                if self.max_baud_rate and self._line_settings()[0] > self.max_baud_rate:
+                    # Framing errors at this rate: nothing is understood or echoed
+                    continue
+                self._wait_wire(len(data))
+            for byte in data:
+                # Single-wire interface: the host sees its own bytes first
+                os.write(self._master, bytes([byte]))
+                protocol.send(byte)
+
+    def _reply(self, data):
+        """Send reply bytes to the host."""
+        if self.paced:
+            self._wait_wire(len(data))
+        os.write(self._master, bytes(data))
+
+    def _protocol(self):
+        """Generator that consumes one byte per send() and answers UPDI instructions."""
+        repeat = 1
+        while True:
+            byte = yield
+
+            if byte == UPDI_BREAK:
+                # A break re-enables a disabled interface and resets the link
+                self.enabled = True
+                repeat = 1
+                continue
+            if not self.enabled or byte != UPDI_SYNC:
+                continue
+
+            opcode = yield
+            instruction = opcode & 0xE0
+            count, repeat = repeat, 1
+
+            if instruction == UPDI_LDCS:
+                self._reply([self._ldcs(opcode & 0x0F)])
+
+            elif instruction == UPDI_STCS:
+                value = yield
+                self._stcs(opcode & 0x0F, value)
+
+            elif instruction == UPDI_LDS:
+                address = (yield) | ((yield) << 8)
+                self._reply([self._load(address)])
+
+            elif instruction == UPDI_STS:
+                address = (yield) | ((yield) << 8)
+                self._reply([UPDI_ACK])
+                value = yield
+                self._store(address, value)
+                self._reply([UPDI_ACK])
+
+            elif instruction == UPDI_ST and opcode & UPDI_PTR_ADDRESS:
+                self.pointer = (yield) | ((yield) << 8)
+                self._reply([UPDI_ACK])
+
+            elif instruction == UPDI_LD and opcode & UPDI_PTR_INC:
+                data = []
+                for _ in range(count):
+                    data.append(self._load(self.pointer))
+                    self.pointer += 1
+                self.stats['bytes_read'] += len(data)
+                self._reply(data)
+
+            elif instruction == UPDI_ST and opcode & UPDI_PTR_INC:
+                for _ in range(count):
+                    value = yield
+                    self._store(self.pointer, value)
+                    self.pointer += 1
+                    self._reply([UPDI_ACK])
+
+            elif instruction == UPDI_REPEAT:
+                repeat = (yield) + 1
+
+            elif instruction == UPDI_KEY:
+                if opcode & UPDI_KEY_SIB:
+                    self._reply(b'tinyAVR P:0D:0-3')
+                else:
+                    key = bytearray()
+                    for _ in range(8):
+                        key.append((yield))
+                    if bytes(reversed(key)) == UPDI_KEY_NVM:
+                        self.key_status |= 1 << UPDI_ASI_KEY_STATUS_NVMPROG
+
+    def _ldcs(self, address):
+        """Read a control/status register."""
+        if address == UPDI_ASI_KEY_STATUS:
+            return self.key_status
+        if address == UPDI_ASI_SYS_STATUS:
+            return self.sys_status
+        return self.cs[address]
+
+    def _stcs(self, address, value):
+        """Write a control/status register."""
+        if address == UPDI_ASI_RESET_REQ:
+            if value == UPDI_RESET_REQ_VALUE:
+                self._reset_requested = True
+            elif self._reset_requested:
+                # Reset released: the NVMPROG key takes effect
+                self._reset_requested = False
+                if self.key_status & (1 << UPDI_ASI_KEY_STATUS_NVMPROG):
+                    self.sys_status |= 1 << UPDI_ASI_SYS_STATUS_NVMPROG
+                    self.key_status &= ~(1 << UPDI_ASI_KEY_STATUS_NVMPROG)
+            return
+
+        if address == UPDI_CS_CTRLB and value & (1 << UPDI_CTRLB_UPDIDIS_BIT):
+            # Disabling UPDI drops programming mode; the application starts running
+            self._reset_state()
+            self.enabled = False
+            return
+
+        self.cs[address] = value
+
+    def _load(self, address):
+        """Read a byte of the data space."""
+        if SIGROW_BASE <= address < SIGROW_BASE + 3:
+            return self.signature[address - SIGROW_BASE]
+        if SIGROW_BASE + 3 <= address < SIGROW_BASE + 13:
+            return self.serial_number[address - SIGROW_BASE - 3]
+        if FUSE_BASE <= address < FUSE_BASE + len(self.fuses):
+            return self.fuses[address - FUSE_BASE]
+        if address == NVMCTRL_BASE + NVMCTRL_STATUS:
+            return 0
+        if FLASH_BASE <= address < FLASH_BASE + len(self.flash):
+            if not self.sys_status & (1 << UPDI_ASI_SYS_STATUS_NVMPROG):
+                return 0xFF
+            return self.flash[address - FLASH_BASE]
+        return 0
+
+    def _store(self, address, value):
+        """Write a byte of the data space."""
+        nvmprog = self.sys_status & (1 << UPDI_ASI_SYS_STATUS_NVMPROG)
+
+        if FLASH_BASE <= address < FLASH_BASE + len(self.flash):
+            if nvmprog:
+                offset = address - FLASH_BASE
+                self.page_buffer[offset % self.page_size] &= value
+                self.page_address = offset - offset % self.page_size
+            return
+
+        if address == NVMCTRL_BASE + NVMCTRL_ADDRL:
+            self.nvm_addr = (self.nvm_addr & 0xFF00) | value
+        elif address == NVMCTRL_BASE + NVMCTRL_ADDRL + 1:
+            self.nvm_addr = (self.nvm_addr & 0x00FF) | (value << 8)
+        elif address == NVMCTRL_BASE + NVMCTRL_DATAL:
+            self.nvm_data = value
+        elif address == NVMCTRL_BASE + NVMCTRL_CTRLA and nvmprog:
+            self._nvm_command(value)
+
+    def _nvm_command(self, command):
+        """Execute an NVM controller command."""
+        page = slice(self.page_address, self.page_address + self.page_size)
+
+        if command == NVMCTRL_CMD_PBC:
+            self.page_buffer = bytearray([0xFF]) * self.page_size
+        elif command == NVMCTRL_CMD_WP:
+            # Flash cells can only be programmed from 1 to 0 without an erase
+            self.flash[page] = bytes(a & b for a, b in zip(self.flash[page], self.page_buffer))
+            self.page_buffer = bytearray([0xFF]) * self.page_size
+            self.stats['page_writes'] += 1
+        elif command == NVMCTRL_CMD_ER:
+            self.flash[page] = bytes([0xFF]) * self.page_size
+        elif command == NVMCTRL_CMD_ERWP:
+            self.flash[page] = self.page_buffer
+            self.page_buffer = bytearray([0xFF]) * self.page_size
+            self.stats['page_writes'] += 1
+        elif command == NVMCTRL_CMD_CHER:
+            self.flash[:] = bytes([0xFF]) * len(self.flash)
+            self.stats['chip_erases'] += 1
+        elif command == NVMCTRL_CMD_WFU:
+            if FUSE_BASE <= self.nvm_addr < FUSE_BASE + len(self.fuses):
+                self.fuses[self.nvm_addr - FUSE_BASE] = self.nvm_data
+                self.stats['fuse_writes'] += 1
+
+def main():
+    """Serve a simulated ATtiny1616 until interrupted."""
+    target = SimulatedUpdiTarget()
+    port = target.start()
+    print(f"Simulated ATtiny1616 UPDI target on {port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        target.stop()
+        print(f"Stats: {target.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+
+class VariantCache:
+    """Disk cache of finished LE_Final hex files, one per device variant.
+
+    Entries are keyed by the full (address, sine, cosine) tuple, a hash of the
+    sketch source and the toolchain version, so a change to any of them
+    produces a new entry instead of a stale image. The cache is bounded to
+    max_size bytes and evicts the least recently used variants first.
+    """
+
+    def __init__(self, cache_dir=None, max_size=32 * 1024 * 1024):
+        """Initialize the cache in cache_dir with a disk budget of max_size bytes."""
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'arduino_compiler', 'variant_cache')
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.stats_file = os.path.join(cache_dir, 'stats.json')
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self.stats = self._load_stats()
+
+    def _load_stats(self):
+        """Load the counters kept across sessions."""
+        stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0,
+                 'bytes_saved': 0, 'seconds_saved': 0.0}
+        try:
+            with open(self.stats_file, 'r') as f:
+                stats.update(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            pass
+        return stats
+
+    def _save_stats(self):
+        """Write the counters to disk; the caller holds the lock."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.stats, f, indent=4)
+        os.replace(tmp_path, self.stats_file)
+
+    @staticmethod
+    def make_key(address, sine, cosine, source_hash, toolchain_version):
+        """Cache key for one device variant."""
+        text = f"{address}\0{sine}\0{cosine}\0{source_hash}\0{toolchain_version}"
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        """Hex and metadata paths of an entry."""
+        base = os.path.join(self.cache_dir, key)
+        return base + '.hex', base + '.json'
+
+    def get(self, key, output_hex):
+        """Copy a cached variant to output_hex.
+
+        Returns:
+            bool: True on a cache hit
+        """
+        hex_path, meta_path = self._paths(key)
+
+        with self._lock:
+            try:
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+                shutil.copyfile(hex_path, output_hex)
+                # Touch the entry so LRU eviction keeps it
+                os.utime(hex_path, None)
+            except (OSError, json.JSONDecodeError):
+                self.stats['misses'] += 1
+                self._save_stats()
+                return False
+
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += os.path.getsize(hex_path)
+            self.stats['seconds_saved'] += meta.get('build_seconds', 0.0)
+            self._save_stats()
+
+        return True
+
+    def put(self, key, hex_file, metadata=None):
+        """Store a finished hex file under key."""
+        hex_path, meta_path = self._paths(key)
+
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            shutil.copyfile(hex_file, tmp_path)
+            os.replace(tmp_path, hex_path)
+
+            meta = dict(metadata or {})
+            meta['created'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f, indent=4)
+
+            self.stats['stored'] += 1
+            self._evict_locked()
+            self._save_stats()
+
+    def _evict_locked(self):
+        """Remove least recently used variants until the cache fits its budget."""
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.hex'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            for stale in (path, path[:-4] + '.json'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+            self.stats['evicted'] += 1
+
+    def get_stats(self):
+        """Return the cache counters, including the hit rate, for station reports."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def report(self):
+        """Print the cache counters."""
+        stats = self.get_stats()
+        print(f"Variant cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate'] * 100:.0f}% hit rate), "
+              f"{stats['bytes_saved']} bytes served without building, "
+              f"{stats['seconds_saved']:.1f}s of build time saved")
+
+def main():
+    """Print the variant cache statistics."""
+    cache = VariantCache()
+    print(f"Cache directory: {cache.cache_dir}")
+    cache.report()
+
+if __name__ == "__main__":
+    main()